@@ -0,0 +1,151 @@
+import logging
+import os
+import random
+import string
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from utils.logger import create_logger
+
+logger = create_logger(name=__name__, level=logging.INFO)
+
+# Number of files and size of each file of the synthetic source trees
+TREE_SIZES = {
+    "small": (200, 4 * 1024),
+    "medium": (2000, 16 * 1024),
+    "large": (5000, 32 * 1024)
+}
+
+
+def _text(size: int, rng: random.Random) -> str:
+    # Words instead of random bytes, so the files compress like real code
+    words = ["let", "const", "function", "sprites", "game", "controller", "scene",
+             "if", "else", "return", "forever", "info", "tiles", "=", "(", ")", "{",
+             "}", ";", "\n"]
+    chunks = []
+    length = 0
+    while length < size:
+        word = rng.choice(words) if rng.random() < 0.8 else \
+            "".join(rng.choices(string.ascii_lowercase, k=8))
+        chunks.append(word)
+        length += len(word) + 1
+    return " ".join(chunks)[:size]
+
+
+def make_source_tree(root: Path, file_count: int, file_size: int, seed: int = 0):
+    """
+    Creates a synthetic MakeCode project, with a pxt.json, code files spread over
+    nested directories, and a node_modules and built directory that should not be
+    copied.
+
+    :param root: The directory to create the project in.
+    :param file_count: The number of code files.
+    :param file_size: The size of each code file in bytes.
+    :param seed: The seed of the random contents.
+    """
+    rng = random.Random(seed)
+    root.mkdir(parents=True, exist_ok=True)
+    (root / "pxt.json").write_text('{"name": "benchmark", "files": ["main.ts"]}')
+    (root / "main.ts").write_text(_text(file_size, rng))
+    for i in range(file_count):
+        path = root / f"dir{i % 10}" / f"sub{i % 7}" / f"file{i}.ts"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(_text(file_size, rng))
+    for ignored_dir in ("node_modules/dep", "built"):
+        (root / ignored_dir).mkdir(parents=True, exist_ok=True)
+        (root / ignored_dir / "ignored.js").write_text(_text(file_size, rng))
+    # Make every file older than the racy window of hash manifests
+    old = time.time() - 60
+    for path in root.rglob("*"):
+        os.utime(path, (old, old))
+
+
+def make_simulator_fixture(root: Path, asset_count: int, asset_size: int,
+                           seed: int = 0) -> Path:
+    """
+    Creates a stand-in for the simulator page at /---simulator, which links CSS and
+    JS files like the real page does.
+
+    :param root: The directory to serve.
+    :param asset_count: The number of CSS and JS files.
+    :param asset_size: The size of each file in bytes.
+    :param seed: The seed of the random contents.
+    :return: The root directory.
+    """
+    rng = random.Random(seed)
+    (root / "blb").mkdir(parents=True, exist_ok=True)
+    tags = []
+    for i in range(asset_count):
+        if i % 3 == 0:
+            name = f"sim-{i}.css"
+            tags.append(f'<link rel="stylesheet" href="/blb/{name}">')
+        else:
+            name = f"sim-{i}.js"
+            tags.append(f'<script type="text/javascript" src="/blb/{name}"></script>')
+        (root / "blb" / name).write_text(_text(asset_size, rng))
+    (root / "---simulator").write_text(
+        "<!DOCTYPE html>\n<html lang=\"en\">\n<head>\n<meta charset=\"utf-8\">\n"
+        "<title>Simulator</title>\n" + "\n".join(tags) +
+        "\n</head>\n<body>\n<div id=\"root\"></div>\n</body>\n</html>\n")
+    return root
+
+
+class StandInServer:
+    """
+    A local HTTP server standing in for the simulator host. Every request is delayed
+    to simulate network latency, and the highest number of requests handled at the
+    same time is recorded.
+    """
+
+    def __init__(self, root: Path, latency: float = 0.0):
+        """
+        :param root: The directory to serve.
+        :param latency: How long to delay every request in seconds.
+        """
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.requests = 0
+        server = self
+
+        class Handler(SimpleHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with server.lock:
+                    server.active += 1
+                    server.requests += 1
+                    server.max_active = max(server.max_active, server.active)
+                try:
+                    time.sleep(server.latency)
+                    super().do_GET()
+                finally:
+                    with server.lock:
+                        server.active -= 1
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0),
+                                         partial(Handler, directory=str(root)))
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}/"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def reset_stats(self):
+        with self.lock:
+            self.max_active = 0
+            self.requests = 0
+
+    def __enter__(self) -> "StandInServer":
+        self.thread.start()
+        logger.debug(f"Stand-in server listening at {self.base_url}")
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,280 @@
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from build import BuildOptions, build
+from fixtures import StandInServer, TREE_SIZES, make_simulator_fixture, \
+    make_source_tree
+from shims import BINARY_SIZE_ENV, LATENCY_ENV, SHIMS_SUPPORTED, make_shims
+from utils.asset_cache import AssetCache
+from utils.filesystem import CopyMode, sync_dir
+from utils.fingerprint import hash_tree
+from utils.logger import create_logger, set_all_stdout_logger_levels
+from utils.trace import get_tracer
+
+logger = create_logger(name=__name__, level=logging.INFO)
+
+BENCHMARKS = ("sync", "hash", "download", "pipeline")
+
+parser = ArgumentParser(description="Benchmark the conversion pipeline offline, "
+                                    "against local fixtures and fake toolchains.")
+parser.add_argument("--only", type=str, nargs="+", choices=BENCHMARKS,
+                    default=list(BENCHMARKS),
+                    help="Benchmarks to run. Defaults to all of them.")
+parser.add_argument("--sizes", type=str, nargs="+", choices=list(TREE_SIZES),
+                    default=["small", "medium"],
+                    help="Sizes of the synthetic source trees. Defaults to small and "
+                         "medium.")
+parser.add_argument("--repeat", type=int, default=3,
+                    help="How many times to run each measurement, the fastest is "
+                         "kept. Defaults to 3.")
+parser.add_argument("--latency", type=float, default=0.05,
+                    help="Delay of every request to the stand-in server in seconds. "
+                         "Defaults to 0.05.")
+parser.add_argument("--shim-latency", type=float, default=0.05,
+                    help="Delay of every fake npx, yarn, and cargo command in "
+                         "seconds. Defaults to 0.05.")
+parser.add_argument("--assets", type=int, default=24,
+                    help="Number of CSS and JS files linked by the stand-in simulator "
+                         "page. Defaults to 24.")
+parser.add_argument("--output", type=Path,
+                    help="Path to write the JSON results to. Defaults to "
+                         "benchmarks/results/<timestamp>.json.")
+parser.add_argument("--keep", action="store_true",
+                    help="Keep the temporary fixture directory.")
+parser.add_argument("--debug", action="store_true",
+                    help="Enable debug logging.")
+
+
+def best_of(repeat: int, func: Callable[[], Any],
+            setup: Optional[Callable[[], None]] = None) -> tuple[float, Any]:
+    """
+    Times a function several times.
+
+    :param repeat: How many times to run it.
+    :param func: The function to time.
+    :param setup: A function to run before every run, which is not timed.
+    :return: The fastest time in seconds, and the result of the last run.
+    """
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def tree_size(root: Path) -> int:
+    return sum(path.stat().st_size for path in root.rglob("*") if path.is_file())
+
+
+def bench_sync(work_dir: Path, sizes: list[str], repeat: int) -> dict:
+    results = {}
+    for size in sizes:
+        file_count, file_size = TREE_SIZES[size]
+        src = work_dir / f"tree-{size}"
+        if not src.exists():
+            make_source_tree(src, file_count, file_size)
+        dest = work_dir / f"sync-{size}"
+        ignore = ("node_modules", "built")
+        cold, _ = best_of(repeat, lambda: sync_dir(src, dest, ignore=ignore),
+                          lambda: shutil.rmtree(dest, ignore_errors=True))
+        total_bytes = tree_size(dest)
+        warm, manifest = best_of(repeat, lambda: sync_dir(src, dest, ignore=ignore))
+        linked, _ = best_of(repeat, lambda: sync_dir(src, dest, CopyMode.AUTO,
+                                                     ignore=ignore),
+                            lambda: shutil.rmtree(dest, ignore_errors=True))
+        results[size] = {
+            "files": file_count,
+            "bytes": total_bytes,
+            "cold_copy_s": cold,
+            "cold_copy_mb_per_s": total_bytes / 1024 ** 2 / cold,
+            "cold_auto_s": linked,
+            "warm_s": warm,
+            "warm_unchanged_files": len(manifest.unchanged)
+        }
+        logger.info(f"sync {size}: cold {cold:.3f} s "
+                    f"({results[size]['cold_copy_mb_per_s']:.1f} MB/s), auto "
+                    f"{linked:.3f} s, warm {warm:.3f} s")
+    return results
+
+
+def bench_hash(work_dir: Path, sizes: list[str], repeat: int) -> dict:
+    results = {}
+    for size in sizes:
+        file_count, file_size = TREE_SIZES[size]
+        src = work_dir / f"tree-{size}"
+        if not src.exists():
+            make_source_tree(src, file_count, file_size)
+        manifest_path = work_dir / f"hash-{size}.json"
+        exclude = ("node_modules", "built")
+        cold, _ = best_of(repeat, lambda: hash_tree(src, exclude, manifest_path),
+                          lambda: manifest_path.unlink(missing_ok=True))
+        warm, _ = best_of(repeat, lambda: hash_tree(src, exclude, manifest_path))
+        results[size] = {"files": file_count, "cold_s": cold, "warm_s": warm}
+        logger.info(f"hash {size}: cold {cold:.3f} s, warm {warm:.3f} s")
+    return results
+
+
+def bench_download(work_dir: Path, server: StandInServer, repeat: int) -> dict:
+    cache_dir = work_dir / "download-cache"
+    urls = [f"{server.base_url}blb/{path.name}"
+            for path in sorted((work_dir / "sim" / "blb").iterdir())]
+
+    def get_all(refresh: bool = False):
+        server.reset_stats()
+        AssetCache(cache_dir).get_many(urls, refresh=refresh)
+        return server.max_active
+
+    tracer = get_tracer()
+    tracer.reset()
+    cold, cold_concurrency = best_of(
+        repeat, get_all, lambda: shutil.rmtree(cache_dir, ignore_errors=True))
+    downloaded = tracer.counters["bytes_downloaded"] // repeat
+    warm, warm_concurrency = best_of(repeat, get_all)
+    results = {
+        "assets": len(urls),
+        "latency_s": server.latency,
+        "cold_s": cold,
+        "cold_bytes": downloaded,
+        "cold_max_concurrency": cold_concurrency,
+        "revalidate_s": warm,
+        "revalidate_max_concurrency": warm_concurrency
+    }
+    logger.info(f"download {len(urls)} assets: cold {cold:.3f} s (up to "
+                f"{cold_concurrency} at once), revalidate {warm:.3f} s")
+    return results
+
+
+def bench_pipeline(work_dir: Path, server: StandInServer, repeat: int) -> dict:
+    game_dir = work_dir / "game"
+    make_source_tree(game_dir / "source", 50, 4 * 1024)
+    config_path = game_dir / "game.yaml"
+
+    def write_config(title: str):
+        config_path.write_text(
+            f"name: Benchmark\ndescription: Benchmark game\nauthor: benchmarks\n"
+            f"version: 1.0.0\ntitle: \"{title}\"\nsource: {game_dir / 'source'}\n"
+            f"output: [static, electron, tauri]\n"
+            f"simulator:\n  url: {server.base_url}\n")
+
+    cache_dir = work_dir / "pipeline-cache"
+    options = BuildOptions(cache_dir=cache_dir)
+    tracer = get_tracer()
+
+    def run() -> dict[str, float]:
+        result = build(config_path, options)
+        # build() records itself in a game span, which is the total
+        game_span = next(span for span in tracer.spans if span.category == "game")
+        return {**result.timings, "total": game_span.wall_time}
+
+    def clean():
+        shutil.rmtree(game_dir / "Benchmark", ignore_errors=True)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        write_config("{NAME}")
+
+    results = {}
+    for name, setup in (("cold", clean),
+                        ("warm", None),
+                        ("config_change",
+                         lambda: write_config(f"{{NAME}} {time.time_ns()}"))):
+        best = None
+        for _ in range(repeat):
+            if setup is not None:
+                setup()
+            stages = run()
+            if best is None or stages["total"] < best["total"]:
+                best = stages
+        results[name] = best
+        logger.info(f"pipeline {name}: {best['total']:.3f} s")
+    return results
+
+
+def git_version() -> str:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"],
+                              cwd=Path(__file__).parent, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (subprocess.CalledProcessError, OSError):
+        return "unknown"
+
+
+def main():
+    args = parser.parse_args()
+    if args.debug:
+        set_all_stdout_logger_levels(logging.DEBUG)
+    else:
+        # Only show the benchmark's own progress, not every stage of the pipeline
+        set_all_stdout_logger_levels(logging.WARNING)
+        logger.setLevel(logging.INFO)
+        for handler in logger.handlers:
+            if handler.level == logging.WARNING and "<stdout>" in repr(handler):
+                handler.setLevel(logging.INFO)
+
+    work_dir = Path(tempfile.mkdtemp(prefix="mkcd-bench-"))
+    logger.info(f"Fixtures are in {work_dir}")
+    results = {
+        "version": git_version(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {key: str(value) if isinstance(value, Path) else value
+                       for key, value in vars(args).items()},
+        "results": {}
+    }
+    make_simulator_fixture(work_dir / "sim", args.assets, 64 * 1024)
+    benchmarks = list(args.only)
+    old_path = os.environ.get("PATH", "")
+    if "pipeline" in benchmarks and not SHIMS_SUPPORTED:
+        logger.warning("Skipping the pipeline benchmark, its stand-in npx, yarn, "
+                       "and cargo are shell scripts that only run on Unix-like "
+                       "systems")
+        benchmarks.remove("pipeline")
+    elif "pipeline" in benchmarks:
+        shim_dir = make_shims(work_dir / "bin")
+        os.environ["PATH"] = f"{shim_dir}{os.pathsep}{old_path}"
+    os.environ[LATENCY_ENV] = str(args.shim_latency)
+    os.environ[BINARY_SIZE_ENV] = str(1024 * 1024)
+    try:
+        with StandInServer(work_dir / "sim", args.latency) as server:
+            if "sync" in benchmarks:
+                results["results"]["sync"] = bench_sync(work_dir, args.sizes,
+                                                        args.repeat)
+            if "hash" in benchmarks:
+                results["results"]["hash"] = bench_hash(work_dir, args.sizes,
+                                                        args.repeat)
+            if "download" in benchmarks:
+                results["results"]["download"] = bench_download(work_dir, server,
+                                                                args.repeat)
+            if "pipeline" in benchmarks:
+                results["results"]["pipeline"] = bench_pipeline(work_dir, server,
+                                                                args.repeat)
+    finally:
+        os.environ["PATH"] = old_path
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = args.output or Path(__file__).parent / "results" / \
+             f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    logger.info(f"Wrote results to {output}")
+
+
+if __name__ == "__main__":
+    main()
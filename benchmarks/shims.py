@@ -0,0 +1,114 @@
+import os
+import shutil
+import sys
+from pathlib import Path
+
+# Environment variables read by the shims
+LATENCY_ENV = "MKCD_BENCH_SHIM_LATENCY"
+BINARY_SIZE_ENV = "MKCD_BENCH_BINARY_SIZE"
+
+TOOLS = ("npx", "yarn", "cargo")
+# The commands are shell scripts, which Windows cannot run
+SHIMS_SUPPORTED = os.name != "nt"
+
+# The shim itself - a tiny stand-in for npx, yarn, and cargo that sleeps for the
+# configured latency and creates the files the real tool would
+SHIM_SOURCE = r'''
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+
+tool, args = sys.argv[1], sys.argv[2:]
+cwd = Path.cwd()
+if args in (["--version"], ["-V"]):
+    print({"npx": "10.0.0", "yarn": "1.22.19", "cargo": "cargo 1.86.0"}[tool])
+    sys.exit(0)
+time.sleep(float(os.environ.get("MKCD_BENCH_SHIM_LATENCY", "0.05")))
+
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+def install():
+    write(cwd / "node_modules" / "dep" / "index.js", "module.exports = {};\n")
+    esbuild = cwd / "node_modules" / ".bin" / "esbuild"
+    # Minify by dropping blank lines, output goes to --outfile=
+    write(esbuild, "#!/bin/sh\n"
+                   "for arg; do case $arg in --outfile=*) out=${arg#--outfile=};; "
+                   "esac; done\n"
+                   "grep -v '^$' \"$1\" > \"$out\"\n")
+    esbuild.chmod(0o755)
+
+
+if tool == "npx":
+    if args[:2] == ["mkc", "build"]:
+        size = int(os.environ.get("MKCD_BENCH_BINARY_SIZE", str(1024 * 1024)))
+        line = "var x = sprites.create(img``, SpriteKind.Player);\n\n"
+        write(cwd / "built" / "binary.js", (line * (size // len(line) + 1))[:size])
+    elif args[:2] == ["mkc", "download"]:
+        write(cwd / "pxt.json", '{"name": "benchmark", "files": ["main.ts"]}')
+        write(cwd / "main.ts", "game.splash('hi')\n")
+    elif any(arg.startswith("create-electron-app") for arg in args):
+        name = args[[arg.startswith("create-electron-app")
+                     for arg in args].index(True) + 1]
+        write(cwd / name / "package.json", "{}")
+elif tool == "yarn":
+    if args == [] or args[:1] == ["install"]:
+        install()
+    elif args[:2] == ["create", "vite"]:
+        for sub in ("public", "src"):
+            (cwd / args[2] / sub).mkdir(parents=True, exist_ok=True)
+        write(cwd / args[2] / "package.json", "{}")
+    elif args[:2] == ["create", "tauri-app"]:
+        (cwd / args[2] / "src-tauri").mkdir(parents=True, exist_ok=True)
+        write(cwd / args[2] / "package.json", "{}")
+    elif args == ["build"]:
+        # Like vite build: the public directory and index.html, plus a bundle
+        dist = cwd / "dist"
+        shutil.rmtree(dist, ignore_errors=True)
+        shutil.copytree(cwd / "public", dist)
+        shutil.copy(cwd / "index.html", dist / "index.html")
+        write(dist / "assets" / "index.js", "console.log('app');\n" * 5000)
+    elif args == ["run", "make"]:
+        write(cwd / "out" / "make" / "app.zip", "app")
+    elif args == ["run", "package"]:
+        import json
+        name = json.loads((cwd / "package.json").read_text()).get("productName", "app")
+        packaged = cwd / "out" / f"{name}-linux-x64"
+        write(packaged / name, "electron")
+        write(packaged / "resources" / "app.asar", "asar")
+        write(packaged / "resources" / "binary.js", "")
+    elif args[:3] == ["run", "tauri", "build"]:
+        target = Path(os.environ.get("CARGO_TARGET_DIR", cwd / "src-tauri" / "target"))
+        profile = "debug" if "--debug" in args else "release"
+        write(target / profile / "app", "app")
+        if "--no-bundle" not in args:
+            write(target / profile / "bundle" / "deb" / f"{cwd.name}.deb", "app")
+'''
+
+
+def make_shims(bin_dir: Path) -> Path:
+    """
+    Creates fake npx, yarn, and cargo commands in a directory. Put it first in PATH
+    to use them instead of the real tools. Only works where SHIMS_SUPPORTED is True.
+
+    :param bin_dir: The directory to create the commands in.
+    :return: The directory.
+    """
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    shim_path = bin_dir / "shim.py"
+    shim_path.write_text(SHIM_SOURCE)
+    for tool in TOOLS:
+        path = bin_dir / tool
+        path.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{shim_path}" {tool} '
+                        f'"$@"\n')
+        path.chmod(0o755)
+    return bin_dir
+
+
+def remove_shims(bin_dir: Path):
+    shutil.rmtree(bin_dir, ignore_errors=True)
@@ -0,0 +1,565 @@
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field, replace
+from pathlib import Path
+from typing import Callable, Optional
+
+from convert.mkcd_to_website.config import BuildProfile, Config, IconSourceType, \
+    OutputType, get_cargo_profile_dir_name, parse_config
+from convert.mkcd_to_website.source import DEFAULT_SOURCE_IGNORE, download_source
+from utils.binary_cache import BinaryCache
+from utils.cache import get_cache_dir
+from utils.cargo_cache import CargoTargetCache
+from utils.cmd import run_shell_command
+from utils.filesystem import delete_these
+from utils.fingerprint import FingerprintStore, fingerprint, get_tool_version, \
+    hash_file, hash_tree
+from utils.git_cache import GitMirrorCache
+from utils.logger import create_logger
+from utils.package_mirror import PackageMirror
+from utils.scaffold import ScaffoldCache
+from utils.size_report import SizeCategory, append_history, check_budgets, \
+    list_electron_files, list_tauri_files, list_website_files, measure_sizes
+from utils.trace import get_tracer
+
+# The modules that generate and build each output import requests, Pillow, and
+# brotli, so they are only imported by the stages that use them
+
+logger = create_logger(name=__name__, level=logging.INFO)
+
+# Directories and files that are not inputs of a stage when hashing its project
+WEBSITE_EXCLUDE = ("node_modules", "dist")
+ELECTRON_EXCLUDE = ("node_modules", "out", ".webpack")
+TAURI_EXCLUDE = ("node_modules", "target", "gen")
+
+
+@dataclass
+class BuildOptions:
+    """
+    Options of a build, the same as the command line arguments of main.py.
+    """
+    # Ignore cached files and download and create everything again
+    no_cache: bool = False
+    # Run every stage even if its inputs have not changed
+    rebuild: bool = False
+    # Only use cached simulator files and mirrored source code
+    offline: bool = False
+    # The directory of the persistent caches, defaults to the user cache directory
+    cache_dir: Optional[Path] = None
+    # The directory of the yarn offline mirror, defaults to one in the cache directory
+    package_mirror: Optional[Path] = None
+    # Package the Electron app from the prebuilt shell instead of Electron Forge
+    electron_shell: bool = False
+    # Overrides the build profile in the configuration
+    profile: Optional[BuildProfile] = None
+    # The directory to create the game's directory in. Defaults to the directory of
+    # the configuration file, or the current directory for a Config.
+    work_dir: Optional[Path] = None
+
+    skip_source_download: bool = False
+    skip_bin_build: bool = False
+    skip_website_gen: bool = False
+    skip_website_build: bool = False
+    skip_electron_gen: bool = False
+    skip_electron_build: bool = False
+    skip_tauri_gen: bool = False
+    skip_tauri_build: bool = False
+
+
+@dataclass
+class BuildResult:
+    """
+    The result of building one game.
+    """
+    config: Config
+    # The directory of each output, ex. the website's dist directory
+    outputs: dict[OutputType, Path] = field(default_factory=dict)
+    # How long each stage that ran took in seconds, keyed by stage name
+    timings: dict[str, float] = field(default_factory=dict)
+    duration: float = 0
+
+
+def get_website_project_name(config: Config) -> str:
+    return f"{config.name.lower().replace(" ", "-")}-website"
+
+
+def get_target_version(source_code_path: Path) -> Optional[str]:
+    """
+    Gets the version of the pxt-arcade target a game is built with, from the target
+    installed in the game's node_modules, or else the one pinned in its pxt.json.
+
+    :param source_code_path: The directory of the game's source code.
+    :return: The version, or None if the target is not installed or pinned, in which
+     case mkc uses the latest one.
+    """
+    target_package_path = source_code_path / "node_modules" / "pxt-arcade" / \
+                          "package.json"
+    pxt_json_path = source_code_path / "pxt.json"
+    try:
+        if target_package_path.exists():
+            return json.loads(target_package_path.read_text())["version"]
+        if pxt_json_path.exists():
+            return json.loads(pxt_json_path.read_text()).get(
+                "targetVersions", {}).get("target")
+    except (json.JSONDecodeError, KeyError, AttributeError) as e:
+        logger.warning(f"Could not read the target version of {source_code_path}: {e}")
+    return None
+
+
+def get_bin_build_fingerprint(source_code_path: Path, cwd: Path) -> str:
+    """
+    Fingerprints the inputs of building binary.js.
+
+    :param source_code_path: The directory of the game's source code.
+    :param cwd: The working directory of the game, where the hash manifest is kept.
+    :return: The fingerprint.
+    """
+    # Build output and dependencies are not inputs, the same files syncing skips
+    return fingerprint({
+        "source": hash_tree(source_code_path, exclude=DEFAULT_SOURCE_IGNORE,
+                            manifest_path=cwd / ".source-manifest.json"),
+        "makecode": hash_tree(
+            Path(__file__).parent.parent / "node_modules" / "makecode" / "package.json"),
+        # node_modules is ignored in the source hash, but the target decides the output
+        "target": get_target_version(source_code_path),
+        "node": get_tool_version("node --version")
+    })
+
+
+def build_game(config: Config, work_dir: Path,
+               options: BuildOptions) -> dict[OutputType, Path]:
+    """
+    Builds one game.
+
+    :param config: The configuration of the game.
+    :param work_dir: The directory to create the game's directory in.
+    :param options: The options of the build.
+    :return: The path to the output directory of each output.
+    """
+    if options.profile is not None:
+        config = replace(config, profile=options.profile)
+    fast = config.profile == BuildProfile.FAST
+    if fast:
+        logger.info("Fast profile selected. Apps will not be optimized and no "
+                    "installers will be made.")
+
+    logger.debug(f"Building to {", ".join(output.value for output in config.outputs)}")
+    logger.debug(f"Window title will be {config.title}")
+
+    no_cache = options.no_cache
+    if no_cache:
+        logger.info("No cache option selected. Ignoring cached files.")
+    rebuild = options.rebuild
+    if rebuild:
+        logger.info("Rebuild option selected. Running every stage.")
+    offline = options.offline
+    if offline:
+        logger.info("Offline option selected. Only cached simulator files and "
+                    "mirrored packages will be used.")
+    skip_source_download = options.skip_source_download
+    skip_bin_build = options.skip_bin_build
+    skip_website_gen = options.skip_website_gen
+    skip_website_build = options.skip_website_build
+    skip_electron_gen = options.skip_electron_gen
+    skip_electron_build = options.skip_electron_build
+    skip_tauri_gen = options.skip_tauri_gen
+    skip_tauri_build = options.skip_tauri_build
+    electron_shell = options.electron_shell
+
+    cwd = work_dir / config.name
+    src_dir = Path(__file__).parent
+    logger.debug(f"Current working directory: {cwd} (source code directory will be "
+                 f"downloaded here)")
+    logger.debug(f"Source code directory: {src_dir}")
+    cwd.mkdir(parents=True, exist_ok=True)
+    cache_dir = get_cache_dir(options.cache_dir)
+    scaffold_cache = ScaffoldCache(cache_dir)
+    package_mirror = PackageMirror(cache_dir, offline, options.package_mirror)
+    tracer = get_tracer()
+    lazy = {}
+
+    def get_asset_cache():
+        if "asset_cache" not in lazy:
+            from utils.asset_cache import AssetCache
+            lazy["asset_cache"] = AssetCache(cache_dir, offline=offline)
+        return lazy["asset_cache"]
+
+    def get_icons():
+        # Stages that are skipped do not need the icons, or Pillow
+        if "icons" not in lazy:
+            if config.icon is not None:
+                from utils.icons import prepare_icons
+                logger.debug("Preparing icons")
+                with tracer.span("icons"):
+                    lazy["icons"] = prepare_icons(
+                        config.icon, config.icon_source_type == IconSourceType.URL,
+                        cache_dir, get_asset_cache(), no_cache)
+            else:
+                lazy["icons"] = None
+        return lazy["icons"]
+
+    def get_icon_fingerprint() -> Optional[str]:
+        # The hash of the source image, without decoding it or revalidating a URL,
+        # since the stage may be skipped. The stage prepares and revalidates it.
+        if "icon_fingerprint" not in lazy:
+            if config.icon is None:
+                lazy["icon_fingerprint"] = None
+            elif config.icon_source_type == IconSourceType.URL:
+                lazy["icon_fingerprint"] = get_asset_cache().get(
+                    str(config.icon), revalidate=False).sha256
+            else:
+                lazy["icon_fingerprint"] = hash_file(Path(config.icon))
+        return lazy["icon_fingerprint"]
+
+    # Stage fingerprints, to skip stages whose inputs have not changed
+    stages = FingerprintStore(cwd / ".fingerprints.json")
+    # Size budgets are checked after building, so they are not an input of any build
+    config_inputs = {key: value for key, value in asdict(config).items()
+                     if key not in ("size_budgets", "size_history")}
+    templates_dir = src_dir / "templates"
+
+    def can_skip(stage: str, stage_fingerprint: str, outputs: list[Path]) -> bool:
+        if no_cache or rebuild:
+            return False
+        return stages.is_fresh(stage, stage_fingerprint, outputs)
+
+    size_history_path = config.size_history or cwd / "size-history.jsonl"
+
+    def report_sizes(output: OutputType, output_path: Path, build_fingerprint: str,
+                     list_files: Callable[[Path], list[tuple[Path, SizeCategory]]]):
+        stage = f"size-report-{output.value}"
+        budgets = config.size_budgets.get(output.value, {})
+        size_report_fingerprint = fingerprint({
+            "build": build_fingerprint,
+            "budgets": budgets
+        })
+        if not output_path.exists():
+            logger.warning(f"{output_path} does not exist, not measuring its size")
+        elif can_skip(stage, size_report_fingerprint, [output_path]):
+            logger.info(f"Skipping {output.value} size report, output has not changed")
+        else:
+            with tracer.span(stage):
+                logger.info(f"Measuring {output.value} output size")
+                stages.invalidate(stage)
+                report = measure_sizes(output_path, list_files(output_path))
+                logger.info(f"{output.value.capitalize()} output sizes:\n{report}")
+                append_history(size_history_path, report, {
+                    "name": config.name,
+                    "version": config.version,
+                    "profile": config.profile.value,
+                    "output": output.value
+                })
+                exceeded = check_budgets(report, budgets)
+                if len(exceeded) > 0:
+                    raise RuntimeError(f"{output.value.capitalize()} output is over its "
+                                       f"size budget: {'; '.join(exceeded)}")
+                stages.record(stage, size_report_fingerprint)
+
+    # Download source code
+    if skip_source_download:
+        logger.info("Skipping source code download")
+        source_code_path = cwd / f"{config.name} source"
+    else:
+        logger.info("Downloading source code")
+        with tracer.span("source-download"):
+            source_code_path = download_source(config, cwd, no_cache,
+                                               GitMirrorCache(cache_dir, offline))
+
+    # npx pxt build
+    binary_js_path = source_code_path / "built" / "binary.js"
+    bin_build_fingerprint = get_bin_build_fingerprint(source_code_path, cwd)
+    if skip_bin_build:
+        logger.info("Skipping build")
+    elif can_skip("bin-build", bin_build_fingerprint, [binary_js_path]):
+        logger.info("Skipping build, source code has not changed")
+    else:
+        with tracer.span("bin-build"):
+            logger.info("Building project")
+            stages.invalidate("bin-build")
+            if no_cache:
+                logger.debug("Checking for binary to remove")
+                if binary_js_path.exists():
+                    logger.debug(f"Deleting {binary_js_path}")
+                    binary_js_path.unlink()
+            binary_cache = BinaryCache(cache_dir)
+            if not no_cache and binary_cache.restore(bin_build_fingerprint,
+                                                     binary_js_path):
+                logger.info("Restored binary from compile cache")
+            else:
+                run_shell_command("npx mkc build -j", cwd=source_code_path)
+                binary_cache.store(bin_build_fingerprint, binary_js_path)
+            stages.record("bin-build", bin_build_fingerprint)
+    logger.debug(f"Binary JS path: {binary_js_path}")
+
+    # yarn create vite, copy files, and substitute values
+    vite_project_name = get_website_project_name(config)
+    website_path = cwd / vite_project_name
+    if skip_website_gen:
+        logger.info("Skipping website generation")
+    else:
+        website_gen_fingerprint = fingerprint({
+            "config": config_inputs,
+            "icon": get_icon_fingerprint(),
+            "template": hash_tree(templates_dir / "website_files"),
+            "binary": hash_tree(binary_js_path),
+            "node": get_tool_version("node --version"),
+            "yarn": get_tool_version("yarn --version")
+        })
+        if can_skip("website-gen", website_gen_fingerprint, [website_path]):
+            logger.info("Skipping website generation, inputs have not changed")
+        else:
+            with tracer.span("website-gen"):
+                from convert.mkcd_to_website.website import generate_website
+                logger.info(f"Generating TS React and Vite website")
+                stages.invalidate("website-gen")
+                if no_cache:
+                    logger.debug("Checking for existing website to remove")
+                    delete_these([vite_project_name], cwd)
+                logger.debug(f"Creating Vite project with name {vite_project_name}")
+                generate_website(config, vite_project_name,
+                                 templates_dir / "website_files", cwd, binary_js_path,
+                                 get_asset_cache(), no_cache, scaffold_cache,
+                                 get_icons(), package_mirror)
+                stages.record("website-gen", website_gen_fingerprint)
+
+    # yarn run build
+    website_dist_path = website_path / "dist"
+    website_build_fingerprint = fingerprint({
+        "website": hash_tree(website_path, exclude=WEBSITE_EXCLUDE)
+    })
+    if skip_website_build:
+        logger.info("Skipping website build")
+    elif can_skip("website-build", website_build_fingerprint, [website_dist_path]):
+        logger.info("Skipping website build, website has not changed")
+    else:
+        with tracer.span("website-build"):
+            logger.info("Building website")
+            stages.invalidate("website-build")
+            run_shell_command("yarn build", cwd=website_path)
+            if fast:
+                logger.info("Skipping minifying and precompressing website assets")
+            else:
+                from convert.mkcd_to_website.assets import optimize_assets
+                logger.info("Minifying and precompressing website assets")
+                with tracer.span("website-assets"):
+                    report = optimize_assets(website_dist_path, website_path)
+                logger.info(f"Website asset sizes:\n{report}")
+            stages.record("website-build", website_build_fingerprint)
+
+    logger.info(f"Static website files are at {website_dist_path}")
+    if OutputType.STATIC in config.outputs and not skip_website_build:
+        report_sizes(OutputType.STATIC, website_dist_path, website_build_fingerprint,
+                     list_website_files)
+
+    def build_electron() -> Path:
+        electron_project_name = f"{config.name.lower().replace(" ", "-")}-electron"
+        electron_path = cwd / electron_project_name
+        if skip_electron_gen:
+            logger.info("Skipping Electron app generation")
+        else:
+            electron_gen_fingerprint = fingerprint({
+                "config": config_inputs,
+                "icon": get_icon_fingerprint(),
+                "template": hash_tree(templates_dir / "electron_files"),
+                "dist": hash_tree(website_dist_path),
+                "node": get_tool_version("node --version"),
+                "yarn": get_tool_version("yarn --version")
+            })
+            if can_skip("electron-gen", electron_gen_fingerprint, [electron_path]):
+                logger.info("Skipping Electron app generation, inputs have not changed")
+            else:
+                with tracer.span("electron-gen"):
+                    from convert.website_to_electron.electron import generate_electron
+                    logger.info(f"Generating Electron app")
+                    stages.invalidate("electron-gen")
+                    logger.debug(f"Creating Electron app in {cwd}, using "
+                                 f"{website_dist_path} for source")
+                    logger.debug(f"Creating Electron project with name "
+                                 f"{electron_project_name}")
+                    # npx create-electron-app@latest, copy files, and substitute values
+                    if no_cache:
+                        logger.debug("Checking for existing website to remove")
+                        delete_these([electron_project_name], cwd)
+                    generate_electron(config, electron_project_name,
+                                      templates_dir / "electron_files",
+                                      website_dist_path, cwd, scaffold_cache, no_cache,
+                                      get_icons(), package_mirror)
+                    stages.record("electron-gen", electron_gen_fingerprint)
+
+        # yarn run make
+        electron_dist_path = electron_path / "out"
+        electron_build_fingerprint = fingerprint({
+            "electron": hash_tree(electron_path, exclude=ELECTRON_EXCLUDE)
+        })
+        if skip_electron_build:
+            logger.info("Skipping Electron app build")
+        elif can_skip("electron-build", electron_build_fingerprint,
+                      [electron_dist_path]):
+            logger.info("Skipping Electron app build, app has not changed")
+        else:
+            with tracer.span("electron-build"):
+                logger.info("Building Electron app")
+                stages.invalidate("electron-build")
+                run_shell_command("yarn run make", cwd=electron_path)
+                stages.record("electron-build", electron_build_fingerprint)
+        if not skip_electron_build:
+            report_sizes(OutputType.ELECTRON, electron_dist_path,
+                         electron_build_fingerprint, list_electron_files)
+
+        logger.info(f"Electron app executables are at {electron_dist_path}")
+        return electron_dist_path
+
+    def build_electron_from_shell() -> Path:
+        electron_project_name = f"{config.name.lower().replace(" ", "-")}-electron"
+        electron_dist_path = cwd / electron_project_name / "out"
+        if skip_electron_build:
+            logger.info("Skipping Electron app build")
+        else:
+            from convert.website_to_electron.shell import get_electron_shell, \
+                get_shell_inputs, package_electron_from_shell
+            electron_build_fingerprint = fingerprint({
+                "config": config_inputs,
+                "icon": get_icon_fingerprint(),
+                "dist": hash_tree(website_dist_path),
+                "shell": get_shell_inputs(templates_dir / "electron_files")
+            })
+            if can_skip("electron-build", electron_build_fingerprint,
+                        [electron_dist_path]):
+                logger.info("Skipping Electron app build, app has not changed")
+            else:
+                with tracer.span("electron-build"):
+                    logger.info("Packaging Electron app from the prebuilt shell")
+                    stages.invalidate("electron-build")
+                    shell_dir = get_electron_shell(templates_dir / "electron_files",
+                                                   scaffold_cache, no_cache,
+                                                   package_mirror)
+                    package_electron_from_shell(config, website_dist_path,
+                                                electron_dist_path, shell_dir,
+                                                get_icons())
+                    stages.record("electron-build", electron_build_fingerprint)
+            report_sizes(OutputType.ELECTRON, electron_dist_path,
+                         electron_build_fingerprint, list_electron_files)
+
+        logger.info(f"Electron app executables are at {electron_dist_path}")
+        return electron_dist_path
+
+    def build_tauri() -> Path:
+        tauri_project_name = f"{config.name.lower().replace(' ', '-')}-tauri"
+        tauri_path = cwd / tauri_project_name
+        if skip_tauri_gen:
+            logger.info("Skipping Tauri app generation")
+        else:
+            tauri_gen_fingerprint = fingerprint({
+                "config": config_inputs,
+                "icon": get_icon_fingerprint(),
+                "template": hash_tree(templates_dir / "tauri_files"),
+                "dist": hash_tree(website_dist_path),
+                "node": get_tool_version("node --version"),
+                "yarn": get_tool_version("yarn --version")
+            })
+            if can_skip("tauri-gen", tauri_gen_fingerprint, [tauri_path]):
+                logger.info("Skipping Tauri app generation, inputs have not changed")
+            else:
+                with tracer.span("tauri-gen"):
+                    from convert.website_to_tauri.tauri import generate_tauri
+                    logger.info(f"Generating Tauri app")
+                    stages.invalidate("tauri-gen")
+                    logger.debug(f"Creating Tauri app in {cwd}, using "
+                                 f"{website_dist_path} for source")
+                    logger.debug(f"Creating Tauri project with name "
+                                 f"{tauri_project_name}")
+                    # yarn create tauri-app
+                    if no_cache:
+                        logger.debug("Checking for existing website to remove")
+                        delete_these([tauri_project_name], cwd)
+                    generate_tauri(config, tauri_project_name,
+                                   templates_dir / "tauri_files", website_dist_path,
+                                   cwd, scaffold_cache, no_cache, get_icons(),
+                                   package_mirror)
+                    stages.record("tauri-gen", tauri_gen_fingerprint)
+
+        # yarn run tauri build
+        tauri_dist_path = (tauri_path / "src-tauri" / "target" /
+                           get_cargo_profile_dir_name(config.profile))
+        tauri_build_fingerprint = fingerprint({
+            "tauri": hash_tree(tauri_path, exclude=TAURI_EXCLUDE),
+            "cargo": get_tool_version("cargo --version"),
+            "profile": config.profile.value
+        })
+        if skip_tauri_build:
+            logger.info("Skipping Tauri app build")
+        elif can_skip("tauri-build", tauri_build_fingerprint, [tauri_dist_path]):
+            logger.info("Skipping Tauri app build, app has not changed")
+        else:
+            with tracer.span("tauri-build"):
+                from convert.website_to_tauri.tauri import build_tauri_app
+                logger.info("Building Tauri app")
+                stages.invalidate("tauri-build")
+                # Compile the Rust dependencies once for every game
+                build_tauri_app(tauri_path, templates_dir / "tauri_files",
+                                CargoTargetCache(cache_dir) if not no_cache else None,
+                                config.profile)
+                stages.record("tauri-build", tauri_build_fingerprint)
+        if not skip_tauri_build:
+            report_sizes(OutputType.TAURI, tauri_dist_path, tauri_build_fingerprint,
+                         list_tauri_files)
+
+        logger.info(f"Tauri app executables are at {tauri_dist_path}")
+        return tauri_dist_path
+
+    output_paths = {}
+    if OutputType.STATIC in config.outputs:
+        output_paths[OutputType.STATIC] = website_dist_path
+    app_builders = {
+        OutputType.ELECTRON: build_electron_from_shell if electron_shell else build_electron,
+        OutputType.TAURI: build_tauri
+    }
+    app_outputs = [output for output in config.outputs if output in app_builders]
+    if len(app_outputs) > 0:
+        # The apps only depend on the website, so package them at the same time
+        with ThreadPoolExecutor(max_workers=len(app_outputs)) as executor:
+            futures = {output: executor.submit(app_builders[output])
+                       for output in app_outputs}
+            for output, future in futures.items():
+                output_paths[output] = future.result()
+    logger.info(f"Build finished")
+    return output_paths
+
+
+def build(config: Config | Path | str,
+          options: Optional[BuildOptions] = None) -> BuildResult:
+    """
+    Builds one game. Builds can be run one after another in the same process, which
+    reuses the HTTP session, tool versions, and imported modules between them. Run
+    builds that should happen at the same time in separate processes, like main.py
+    does for batches. The process's tracer is reset at the start of every build and
+    the build is recorded in a game span, so it only holds the spans of the latest
+    build. Callers should not open spans around it.
+
+    :param config: The configuration of the game, or the path to its YAML
+     configuration file.
+    :param options: The options of the build. If None, the defaults are used.
+    :return: A BuildResult.
+    """
+    if options is None:
+        options = BuildOptions()
+    tracer = get_tracer()
+    # Spans of earlier builds would pile up in a long-lived process
+    tracer.reset()
+    start = time.perf_counter()
+    with tracer.span(config.name if isinstance(config, Config) else str(config),
+                     "game"):
+        if isinstance(config, Config):
+            work_dir = options.work_dir or Path.cwd()
+        else:
+            config_path = Path(config)
+            logger.info(f"Loading configuration from {config_path}")
+            config = parse_config(config_path.read_text(), config_path.parent)
+            work_dir = options.work_dir or config_path.parent
+        outputs = build_game(config, work_dir, options)
+    duration = time.perf_counter() - start
+    timings = {span.name: span.wall_time for span in tracer.spans
+               if span.category == "stage"}
+    return BuildResult(config, outputs, timings, duration)
@@ -0,0 +1,183 @@
+import gzip
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional, only gzip files are made without it
+    brotli = None
+
+from utils.cmd import run_command
+from utils.logger import create_logger
+
+logger = create_logger(name=__name__, level=logging.INFO)
+
+# File types worth compressing, images and audio are already compressed
+COMPRESSIBLE_SUFFIXES = (".html", ".js", ".mjs", ".css", ".json", ".svg", ".txt",
+                         ".map", ".wasm", ".ico", ".xml")
+# Files smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+# Patterns of precompressed files, which only static hosts can use
+PRECOMPRESSED_PATTERNS = ("*.gz", "*.br")
+
+
+@dataclass
+class AssetSize:
+    """
+    The sizes of one asset before and after optimizing it.
+    """
+    path: str
+    original: int
+    minified: int
+    gzip: Optional[int] = None
+    brotli: Optional[int] = None
+
+
+@dataclass
+class AssetReport:
+    """
+    The sizes of the assets of a website before and after optimizing them.
+    """
+    assets: list[AssetSize] = field(default_factory=list)
+
+    @property
+    def original(self) -> int:
+        return sum(asset.original for asset in self.assets)
+
+    @property
+    def minified(self) -> int:
+        return sum(asset.minified for asset in self.assets)
+
+    @property
+    def compressed(self) -> int:
+        """
+        The total size when every asset is served with its smallest encoding.
+        """
+        return sum(min(size for size in (asset.minified, asset.gzip, asset.brotli)
+                       if size is not None) for asset in self.assets)
+
+    def __str__(self) -> str:
+        if len(self.assets) == 0:
+            return "No assets"
+
+        def kb(size: Optional[int]) -> str:
+            return "-" if size is None else f"{size / 1024:.1f}"
+
+        name_width = min(max(len(asset.path) for asset in self.assets), 60)
+        lines = [f"{'Asset':<{name_width}}  Original (kb)  Minified (kb)  "
+                 f"Gzip (kb)  Brotli (kb)"]
+        for asset in sorted(self.assets, key=lambda a: a.original, reverse=True):
+            lines.append(f"{asset.path[:name_width]:<{name_width}}  "
+                         f"{kb(asset.original):>13}  {kb(asset.minified):>13}  "
+                         f"{kb(asset.gzip):>9}  {kb(asset.brotli):>11}")
+        lines.append(f"Total: {kb(self.original)} kb -> {kb(self.compressed)} kb "
+                     f"transferred")
+        return "\n".join(lines)
+
+
+def _write_file(path: Path, data: bytes):
+    # Write to a temporary file and move it into place, so the file is never
+    # partially written and a hardlinked file is replaced instead of modified
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def minify_js(js_path: Path, prj_dir: Path) -> bool:
+    """
+    Minifies a JavaScript file in place with the esbuild installed in a Vite project.
+    Only whitespace and syntax are minified, identifiers are not renamed because the
+    simulator looks up the game's globals by name.
+
+    :param js_path: The path to the JavaScript file.
+    :param prj_dir: The directory of the Vite project.
+    :return: True if the file was minified, False if esbuild is not installed.
+    """
+    esbuild_path = prj_dir / "node_modules" / ".bin" / \
+                   ("esbuild.cmd" if os.name == "nt" else "esbuild")
+    if not esbuild_path.exists():
+        logger.warning(f"esbuild not found at {esbuild_path}, not minifying {js_path}")
+        return False
+    logger.debug(f"Minifying {js_path}")
+    tmp_path = js_path.with_name(f".{js_path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        # Absolute paths, since esbuild runs in the project directory
+        run_command([str(esbuild_path.resolve()), str(js_path.resolve()),
+                     "--minify-whitespace", "--minify-syntax", "--log-level=warning",
+                     f"--outfile={tmp_path.resolve()}"], cwd=prj_dir)
+        os.replace(tmp_path, js_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return True
+
+
+def _precompress(path: Path) -> tuple[Optional[int], Optional[int]]:
+    data = path.read_bytes()
+    gzip_size = brotli_size = None
+    # mtime=0 so the output only depends on the input
+    gzip_data = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gzip_data) < len(data):
+        _write_file(path.with_name(f"{path.name}.gz"), gzip_data)
+        gzip_size = len(gzip_data)
+    if brotli is not None:
+        brotli_data = brotli.compress(data, quality=11)
+        if len(brotli_data) < len(data):
+            _write_file(path.with_name(f"{path.name}.br"), brotli_data)
+            brotli_size = len(brotli_data)
+    return gzip_size, brotli_size
+
+
+def precompress_dir(dist_dir: Path) -> dict[Path, tuple[Optional[int], Optional[int]]]:
+    """
+    Writes gzip and Brotli compressed copies of the compressible files in a directory
+    next to them (ex. binary.js.gz and binary.js.br), so static hosts can serve them
+    without compressing on the fly. Brotli files are only written if the brotli
+    package is installed. Compressed copies that are not smaller are not written.
+
+    :param dist_dir: The directory to compress files in.
+    :return: The gzip and Brotli sizes of each compressible file, or None if that
+     copy was not written.
+    """
+    # Remove old compressed copies first, so deleted files do not leave them behind
+    for pattern in PRECOMPRESSED_PATTERNS:
+        for path in dist_dir.rglob(pattern):
+            path.unlink()
+    paths = [path for path in dist_dir.rglob("*")
+             if path.is_file() and path.suffix.lower() in COMPRESSIBLE_SUFFIXES and
+             path.stat().st_size >= MIN_COMPRESS_SIZE]
+    if brotli is None:
+        logger.debug("brotli is not installed, only writing gzip files")
+    logger.debug(f"Precompressing {len(paths)} files in {dist_dir}")
+    # zlib and brotli release the GIL while compressing
+    with ThreadPoolExecutor() as executor:
+        return dict(zip(paths, executor.map(_precompress, paths)))
+
+
+def optimize_assets(dist_dir: Path, prj_dir: Path) -> AssetReport:
+    """
+    Optimizes a built website: minifies the game's binary.js and writes precompressed
+    copies of every compressible file.
+
+    :param dist_dir: The directory of the built website.
+    :param prj_dir: The directory of the Vite project.
+    :return: An AssetReport of the sizes before and after.
+    """
+    original_sizes = {path: path.stat().st_size for path in dist_dir.rglob("*")
+                      if path.is_file() and not any(path.match(pattern) for pattern
+                                                    in PRECOMPRESSED_PATTERNS)}
+    binary_js_path = dist_dir / "binary.js"
+    if binary_js_path.exists():
+        minify_js(binary_js_path, prj_dir)
+    compressed_sizes = precompress_dir(dist_dir)
+    report = AssetReport()
+    for path, original in original_sizes.items():
+        gzip_size, brotli_size = compressed_sizes.get(path, (None, None))
+        report.assets.append(AssetSize(path.relative_to(dist_dir).as_posix(), original,
+                                       path.stat().st_size, gzip_size, brotli_size))
+    return report
@@ -1,5 +1,5 @@
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
 from pathlib import Path
 from typing import Optional
@@ -8,9 +8,12 @@ from urllib.parse import urlparse
 import yaml
 
 from utils.logger import create_logger
+from utils.size_report import SizeCategory, TOTAL_BUDGET, parse_size
 
 logger = create_logger(name=__name__, level=logging.INFO)
 
+DEFAULT_SIMULATOR_URL = "https://trg-arcade.userpxt.io/"
+
 
 class SourceType(Enum):
     GITHUB = "github"
@@ -29,6 +32,30 @@ class OutputType(Enum):
     TAURI = "tauri"
 
 
+class SimulatorAssetMode(Enum):
+    # Keep the CSS and JS files as separate files next to the page
+    LINK = "link"
+    # Put the CSS and JS inside the page
+    INLINE = "inline"
+    # Combine the CSS and JS into as few files as possible, with integrity hashes
+    BUNDLE = "bundle"
+
+
+class BuildProfile(Enum):
+    # Type-checked, minified, and packaged into every installer
+    RELEASE = "release"
+    # No type-checking or minification, a debug Cargo build, and one host package
+    FAST = "fast"
+
+
+def get_cargo_profile_dir_name(profile: BuildProfile) -> str:
+    """
+    :return: The name of the directory in the cargo target directory that a build
+     profile compiles into.
+    """
+    return "debug" if profile == BuildProfile.FAST else "release"
+
+
 @dataclass
 class Config:
     """
@@ -43,11 +70,25 @@ class Config:
     source: str
     source_type: SourceType
     source_checkout: Optional[str] = None  # For GitHub sources
+    # Glob patterns of files not to copy, for path sources
+    source_ignore: list[str] = field(default_factory=list)
 
     icon: Optional[Path | str] = None
     icon_source_type: Optional[IconSourceType] = None
 
-    output: OutputType = OutputType.STATIC
+    outputs: list[OutputType] = field(default_factory=lambda: [OutputType.STATIC])
+    profile: BuildProfile = BuildProfile.RELEASE
+
+    # Where to get the simulator from, and which version of it
+    simulator_url: str = DEFAULT_SIMULATOR_URL
+    simulator_version: Optional[str] = None
+    simulator_assets: SimulatorAssetMode = SimulatorAssetMode.LINK
+
+    # The most bytes each size category may take compressed, keyed by output, and
+    # where to record the sizes of every build. If None, they are recorded in the
+    # project.
+    size_budgets: dict[str, dict[str, int]] = field(default_factory=dict)
+    size_history: Optional[Path] = None
 
 
 # https://stackoverflow.com/a/36283503/10291933
@@ -109,6 +150,10 @@ def parse_config(yaml_text: str, cwd: Path) -> Config:
         logger.debug(f"Complex GitHub source detected - will checkout {src_checkout} "
                      f"for url {src}")
 
+    src_ignore = result.get("source_ignore", [])
+    if type(src_ignore) is str:
+        src_ignore = [src_ignore]
+
     icon = result.get("icon")
     icon_source_type = None if icon is None else determine_icon_source_type(icon)
     if icon_source_type == IconSourceType.PATH:
@@ -117,6 +162,40 @@ def parse_config(yaml_text: str, cwd: Path) -> Config:
             icon = cwd / icon
     logger.debug(f"Determined icon source type for {icon} is {icon_source_type}")
 
+    outputs = result.get("output", "static")
+    if type(outputs) is str:
+        outputs = [outputs]
+    outputs = list(dict.fromkeys(OutputType(output.lower()) for output in outputs))
+    logger.debug(f"Determined outputs are {outputs}")
+
+    profile = BuildProfile(result.get("profile", "release").lower())
+    logger.debug(f"Build profile is {profile.value}")
+
+    simulator = result.get("simulator") or {}
+    simulator_url = simulator.get("url", DEFAULT_SIMULATOR_URL)
+    simulator_version = simulator.get("version")
+    if simulator_version is not None:
+        simulator_version = str(simulator_version)
+    simulator_assets = SimulatorAssetMode(simulator.get("assets", "link").lower())
+    logger.debug(f"Simulator is at {simulator_url}, version "
+                 f"{simulator_version or 'latest'}, assets will be {simulator_assets.value}ed")
+
+    sizes = result.get("sizes") or {}
+    size_budgets = {}
+    for output, budgets in (sizes.get("budgets") or {}).items():
+        output = OutputType(output.lower()).value
+        size_budgets[output] = {}
+        for name, budget in budgets.items():
+            if name != TOTAL_BUDGET:
+                name = SizeCategory(name.lower()).value
+            size_budgets[output][name] = parse_size(budget)
+    logger.debug(f"Size budgets are {size_budgets}")
+    size_history = sizes.get("history")
+    if size_history is not None:
+        size_history = Path(size_history)
+        if not size_history.is_absolute():
+            size_history = cwd / size_history
+
     config = Config(
         name=result.get("name"),
         description=result.get("description"),
@@ -126,9 +205,16 @@ def parse_config(yaml_text: str, cwd: Path) -> Config:
         source=src,
         source_type=src_type,
         source_checkout=src_checkout,
+        source_ignore=src_ignore,
         icon=icon,
         icon_source_type=icon_source_type,
-        output=OutputType(result.get("output", "static").lower())
+        outputs=outputs,
+        profile=profile,
+        simulator_url=simulator_url,
+        simulator_version=simulator_version,
+        simulator_assets=simulator_assets,
+        size_budgets=size_budgets,
+        size_history=size_history
     )
     config.title = config.title.format(NAME=config.name, VERSION=config.version, AUTHOR=config.author)
     logger.debug(f"Parsed configuration: {config}")
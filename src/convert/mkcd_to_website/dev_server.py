@@ -0,0 +1,93 @@
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import time
+import urllib.request
+from pathlib import Path
+from typing import Optional
+from urllib.error import URLError
+
+from utils.logger import create_logger
+
+logger = create_logger(name=__name__, level=logging.INFO)
+
+DEFAULT_DEV_SERVER_PORT = 5173
+
+
+def publish_binary(binary_js_path: Path, website_path: Path) -> Path:
+    """
+    Copies binary.js into the public directory of the website. The file is replaced in
+    one step, so a running dev server never serves a half written game.
+
+    :param binary_js_path: The path to the built binary.js.
+    :param website_path: The directory of the website project.
+    :return: The path to the published binary.js.
+    """
+    dest = website_path / "public" / "binary.js"
+    temp_path = dest.with_name(f".{dest.name}.tmp")
+    shutil.copyfile(binary_js_path, temp_path)
+    os.replace(temp_path, dest)
+    logger.debug(f"Published {binary_js_path} to {dest}")
+    return dest
+
+
+class DevServer:
+    """
+    The Vite dev server of a generated website, run with yarn dev. The website reloads
+    the game when public/binary.js changes, without reloading the page.
+    """
+
+    def __init__(self, website_path: Path, port: int = DEFAULT_DEV_SERVER_PORT):
+        """
+        :param website_path: The directory of the website project.
+        :param port: The port to listen on.
+        """
+        self.website_path = website_path
+        self.port = port
+        self.url = f"http://localhost:{port}/"
+        self.process: Optional[subprocess.Popen] = None
+
+    def wait_until_ready(self, timeout: float = 60):
+        """
+        Waits until the dev server answers requests.
+
+        :param timeout: How long to wait in seconds.
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Dev server exited with code "
+                                   f"{self.process.returncode}")
+            try:
+                with urllib.request.urlopen(self.url, timeout=1):
+                    return
+            except (URLError, OSError):
+                time.sleep(0.2)
+        raise TimeoutError(f"Dev server did not start within {timeout} seconds")
+
+    def __enter__(self) -> "DevServer":
+        command = f"yarn dev --port {self.port} --strictPort"
+        logger.debug(f"Running command in {self.website_path}: {command}")
+        # A new process group, so stopping yarn also stops Vite
+        self.process = subprocess.Popen(
+            command, cwd=self.website_path, shell=True,
+            start_new_session=os.name != "nt",
+            creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if os.name == "nt" else 0)
+        self.wait_until_ready()
+        logger.debug(f"Dev server is listening at {self.url}")
+        return self
+
+    def __exit__(self, *exc):
+        if self.process is None or self.process.poll() is not None:
+            return
+        logger.debug("Stopping dev server")
+        if os.name == "nt":
+            self.process.send_signal(signal.CTRL_BREAK_EVENT)
+        else:
+            os.killpg(self.process.pid, signal.SIGTERM)
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
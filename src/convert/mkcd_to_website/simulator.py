@@ -0,0 +1,313 @@
+import base64
+import hashlib
+import html
+import logging
+import re
+from dataclasses import dataclass
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urljoin, urlparse
+
+from convert.mkcd_to_website.config import SimulatorAssetMode
+from utils.asset_cache import AssetCache, CachedAsset
+from utils.logger import create_logger
+
+logger = create_logger(name=__name__, level=logging.INFO)
+
+SIMULATOR_PAGE = "---simulator"
+# Directory in the public directory for files referenced by the simulator's CSS
+CSS_ASSETS_DIR = "sim-assets"
+
+# Attributes of a stylesheet link that are about fetching the file, so they are not
+# carried over to a style tag or a bundle. Others like media and title are.
+LINK_FETCH_ATTRS = ("rel", "href", "integrity", "crossorigin", "referrerpolicy",
+                    "type", "as", "hreflang", "fetchpriority")
+
+CSS_URL_PATTERN = re.compile(r"""url\(\s*(['"]?)([^'")]+?)\1\s*\)""")
+
+
+def get_simulator_url(base_url: str, version: Optional[str] = None) -> str:
+    """
+    Gets the URL of the simulator page.
+
+    :param base_url: The base URL of the simulator host, ex.
+     https://trg-arcade.userpxt.io/ or a local mirror.
+    :param version: The simulator version to pin to, ex. v1.12.30. If None, the
+     version currently live on the host is used.
+    :return: The URL of the simulator page.
+    """
+    if not base_url.endswith("/"):
+        base_url += "/"
+    if version is not None:
+        base_url = urljoin(base_url, f"{version.strip('/')}/")
+    return urljoin(base_url, SIMULATOR_PAGE)
+
+
+@dataclass
+class AssetTag:
+    """
+    A <link rel="stylesheet"> or <script src> tag in the simulator page. Offsets are
+    character offsets into the page.
+    """
+    kind: str  # css or js
+    url: str
+    start: int  # Start of the tag
+    end: int  # End of the tag, including </script> for scripts
+    value_start: int  # Start of the href or src attribute value
+    value_end: int  # End of the href or src attribute value
+    attrs: list[tuple[str, Optional[str]]]
+
+
+class SimulatorPage(HTMLParser):
+    """
+    The simulator page, parsed in one pass to find the CSS and JS files it loads and
+    where they are in the page. Rewriting the page only replaces those spans, so all
+    other markup stays byte-identical.
+    """
+
+    def __init__(self, html: str):
+        """
+        :param html: The HTML of the simulator page.
+        """
+        super().__init__(convert_charrefs=True)
+        self.html = html
+        self.tags: list[AssetTag] = []
+        # Offsets of inline <script> and <style> tags, which CSS and JS must not be
+        # reordered around when bundling
+        self.barriers: list[int] = []
+        self._line_starts = [0]
+        for match in re.finditer("\n", html):
+            self._line_starts.append(match.end())
+        self._open_script: Optional[AssetTag] = None
+        self.feed(html)
+        self.close()
+        logger.debug(f"Found {len(self.tags)} CSS and JS files in simulator HTML")
+
+    @property
+    def urls(self) -> list[str]:
+        return [tag.url for tag in self.tags]
+
+    def _offset(self) -> int:
+        line, column = self.getpos()
+        return self._line_starts[line - 1] + column
+
+    def _find_value(self, start: int, tag_text: str, attr: str) -> tuple[int, int]:
+        match = re.search(rf"""\s{attr}\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""",
+                          tag_text, re.IGNORECASE)
+        group = next(i for i in (1, 2, 3) if match.group(i) is not None)
+        return start + match.start(group), start + match.end(group)
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, Optional[str]]]):
+        attributes = dict(attrs)
+        start = self._offset()
+        tag_text = self.get_starttag_text()
+        end = start + len(tag_text)
+        if tag == "link" and "stylesheet" in (attributes.get("rel") or "").split() \
+                and attributes.get("href"):
+            value_start, value_end = self._find_value(start, tag_text, "href")
+            self.tags.append(AssetTag("css", attributes["href"], start, end,
+                                      value_start, value_end, attrs))
+        elif tag == "script" and attributes.get("src"):
+            value_start, value_end = self._find_value(start, tag_text, "src")
+            self._open_script = AssetTag("js", attributes["src"], start, end,
+                                         value_start, value_end, attrs)
+            self.tags.append(self._open_script)
+        elif tag in ("script", "style"):
+            self.barriers.append(start)
+
+    def handle_endtag(self, tag: str):
+        if tag == "script" and self._open_script is not None:
+            end = self.html.index(">", self._offset()) + 1
+            self._open_script.end = end
+            self._open_script = None
+
+    def rewrite(self, edits: list[tuple[int, int, str]]) -> str:
+        """
+        Replaces spans of the page.
+
+        :param edits: (start, end, replacement) tuples, which must not overlap.
+        :return: The rewritten page.
+        """
+        pieces = []
+        position = 0
+        for start, end, replacement in sorted(edits):
+            pieces.append(self.html[position:start])
+            pieces.append(replacement)
+            position = end
+        pieces.append(self.html[position:])
+        return "".join(pieces)
+
+
+def find_simulator_assets(sim_html: str) -> list[str]:
+    """
+    Finds the CSS and JS files the simulator page loads.
+
+    :param sim_html: The HTML of the simulator page.
+    :return: The href and src attribute values of the stylesheets and scripts, in
+     document order.
+    """
+    return SimulatorPage(sim_html).urls
+
+
+def _file_name(url: str) -> str:
+    return urlparse(url).path.split("/")[-1]
+
+
+def _integrity(data: bytes) -> str:
+    return f"sha384-{base64.b64encode(hashlib.sha384(data).digest()).decode()}"
+
+
+def _format_attrs(attrs: list[tuple[str, Optional[str]]],
+                  drop: tuple[str, ...]) -> str:
+    return "".join(f" {name}" if value is None else
+                   f" {name}=\"{html.escape(value)}\""
+                   for name, value in attrs if name not in drop)
+
+
+def localize_css(css: str, css_url: str, asset_cache: AssetCache, public_dir: Path,
+                 refresh: bool = False, revalidate: bool = True) -> str:
+    """
+    Downloads the files referenced with url() in a stylesheet (ex. fonts and images)
+    into the public directory and points the references at them, so nothing is
+    fetched from the internet at runtime.
+
+    :param css: The stylesheet.
+    :param css_url: The URL the stylesheet was downloaded from, to resolve relative
+     references against.
+    :param asset_cache: The cache to download the files through.
+    :param public_dir: The public directory of the website. The stylesheet is assumed
+     to be loaded from this directory.
+    :param refresh: If True, download the files unconditionally.
+    :param revalidate: If False, use cached files without revalidating them.
+    :return: The rewritten stylesheet.
+    """
+    references = list(dict.fromkeys(
+        match.group(2) for match in CSS_URL_PATTERN.finditer(css)
+        if not match.group(2).startswith(("data:", "#", "about:"))))
+    if len(references) == 0:
+        return css
+    logger.debug(f"Localizing {len(references)} references in {css_url}")
+    assets = asset_cache.get_many([urljoin(css_url, ref) for ref in references],
+                                  refresh=refresh, revalidate=revalidate)
+    local_paths = {}
+    for reference, asset in zip(references, assets):
+        local_path = f"{CSS_ASSETS_DIR}/{asset.sha256[:8]}-{_file_name(asset.url)}"
+        AssetCache.link_to(asset, public_dir / local_path)
+        local_paths[reference] = local_path
+
+    def replace(match: re.Match) -> str:
+        local_path = local_paths.get(match.group(2))
+        return match.group(0) if local_path is None else f"url(\"{local_path}\")"
+
+    return CSS_URL_PATTERN.sub(replace, css)
+
+
+def _group_tags(page: SimulatorPage, kind: str) -> list[list[AssetTag]]:
+    # Tags of a kind that can be combined without moving them past an inline script
+    # or style, or past a tag of the other kind for scripts
+    groups = []
+    previous_end = None
+    for tag in page.tags:
+        if tag.kind != kind:
+            if kind == "js":
+                previous_end = None
+            continue
+        barrier_between = previous_end is not None and any(
+            previous_end <= barrier < tag.start for barrier in page.barriers)
+        # Stylesheets with different media or titles apply differently
+        attrs_differ = kind == "css" and previous_end is not None and \
+            _format_attrs(tag.attrs, LINK_FETCH_ATTRS) != \
+            _format_attrs(groups[-1][0].attrs, LINK_FETCH_ATTRS)
+        if previous_end is None or barrier_between or attrs_differ:
+            groups.append([])
+        groups[-1].append(tag)
+        previous_end = tag.end
+    return groups
+
+
+def write_simulator(sim_html: str, sim_url: str, asset_cache: AssetCache,
+                    public_dir: Path, mode: SimulatorAssetMode = SimulatorAssetMode.LINK,
+                    refresh: bool = False, revalidate: bool = True) -> Path:
+    """
+    Downloads the CSS and JS files of the simulator page into the public directory,
+    localizes the references in the CSS, and writes the page as ---simulator.html
+    pointing to the local files. Only the tags that load CSS and JS are changed, the
+    rest of the page is written exactly as downloaded.
+
+    :param sim_html: The HTML of the simulator page.
+    :param sim_url: The URL of the simulator page.
+    :param asset_cache: The cache to download the files through.
+    :param public_dir: The public directory of the website.
+    :param mode: Whether to link, inline, or bundle the CSS and JS files.
+    :param refresh: If True, download the files unconditionally.
+    :param revalidate: If False, use cached files without revalidating them.
+    :return: The path to the written page.
+    """
+    page = SimulatorPage(sim_html)
+    urls = [urljoin(sim_url, tag.url) for tag in page.tags]
+    logger.debug(f"Getting {len(urls)} CSS and JS files")
+    assets = dict(zip(urls, asset_cache.get_many(urls, refresh=refresh,
+                                                 revalidate=revalidate)))
+
+    def get_text(tag: AssetTag) -> str:
+        asset = assets[urljoin(sim_url, tag.url)]
+        if tag.kind == "css":
+            return localize_css(asset.read_text(), asset.url, asset_cache, public_dir,
+                                refresh, revalidate)
+        return asset.read_text()
+
+    edits = []
+    if mode == SimulatorAssetMode.LINK:
+        for tag in page.tags:
+            asset: CachedAsset = assets[urljoin(sim_url, tag.url)]
+            file_name = _file_name(asset.url)
+            dest = public_dir / file_name
+            css = get_text(tag) if tag.kind == "css" else None
+            if css is not None and css != asset.read_text():
+                dest.unlink(missing_ok=True)
+                dest.write_text(css, encoding="utf-8")
+            else:
+                # Link the cached file into the public directory
+                AssetCache.link_to(asset, dest)
+            edits.append((tag.value_start, tag.value_end, f"./{file_name}"))
+    elif mode == SimulatorAssetMode.INLINE:
+        for tag in page.tags:
+            if tag.kind == "css":
+                css = get_text(tag).replace("</style", "<\\/style")
+                attrs = _format_attrs(tag.attrs, LINK_FETCH_ATTRS)
+                edits.append((tag.start, tag.end, f"<style{attrs}>{css}</style>"))
+            else:
+                js = get_text(tag).replace("</script", "<\\/script")
+                attrs = _format_attrs(tag.attrs, ("src", "integrity", "crossorigin",
+                                                  "async", "defer"))
+                edits.append((tag.start, tag.end, f"<script{attrs}>{js}</script>"))
+    elif mode == SimulatorAssetMode.BUNDLE:
+        for kind in ("css", "js"):
+            for index, group in enumerate(_group_tags(page, kind)):
+                # Semicolons keep scripts that do not end with one separate
+                separator = "\n" if kind == "css" else "\n;\n"
+                data = separator.join(get_text(tag) for tag in group).encode("utf-8")
+                digest = hashlib.sha256(data).hexdigest()[:8]
+                file_name = f"sim-bundle-{index}.{digest}.{kind}"
+                (public_dir / file_name).unlink(missing_ok=True)
+                (public_dir / file_name).write_bytes(data)
+                integrity = _integrity(data)
+                first = group[0]
+                if kind == "css":
+                    attrs = _format_attrs(first.attrs, LINK_FETCH_ATTRS)
+                    replacement = f"<link rel=\"stylesheet\" href=\"./{file_name}\" " \
+                                  f"integrity=\"{integrity}\"{attrs}>"
+                else:
+                    attrs = _format_attrs(first.attrs, ("src", "integrity"))
+                    replacement = f"<script src=\"./{file_name}\" " \
+                                  f"integrity=\"{integrity}\"{attrs}></script>"
+                edits.append((first.start, first.end, replacement))
+                edits.extend((tag.start, tag.end, "") for tag in group[1:])
+                logger.debug(f"Bundled {len(group)} {kind} files into {file_name}")
+    else:
+        raise ValueError(f"Unknown simulator asset mode {mode}")
+
+    sim_path = public_dir / "---simulator.html"
+    sim_path.write_text(page.rewrite(edits), encoding="utf-8")
+    return sim_path
@@ -5,20 +5,89 @@ from typing import Optional
 
 from convert.mkcd_to_website.config import Config, SourceType
 from utils.cmd import run_command, run_shell_command
+from utils.filesystem import sync_dir
+from utils.git_cache import GitMirrorCache
 from utils.logger import create_logger
 
 logger = create_logger(name=__name__, level=logging.INFO)
 
+# Files never copied from path sources, which are build output, dependencies, or
+# editor and OS junk. Anything in them already in the copy is also left alone.
+DEFAULT_SOURCE_IGNORE = ("node_modules", "built", "pxt_modules", ".pxt", ".git",
+                         ".idea", ".vscode", ".DS_Store", "Thumbs.db", "desktop.ini",
+                         "*.swp", "*~")
 
-def download_source(config: Config, cwd: Path,
-                    no_cache: Optional[bool] = False) -> Path:
+
+def read_gitignore(path: Path) -> list[str]:
+    """
+    Reads a .gitignore file into glob patterns for sync_dir. Negated patterns (!) are
+    not supported and are skipped, and ** is treated like *.
+
+    :param path: The path to the .gitignore file.
+    :return: A list of glob patterns. Patterns anchored to a directory start with /.
+    """
+    if not path.exists():
+        return []
+    patterns = []
+    for line in path.read_text().splitlines():
+        line = line.strip()
+        if line == "" or line.startswith("#"):
+            continue
+        if line.startswith("!"):
+            logger.debug(f"Negated .gitignore pattern {line} is not supported")
+            continue
+        line = line.rstrip("/").replace("**/", "").replace("**", "*")
+        if line == "":
+            continue
+        # A slash anywhere but the end anchors the pattern to the .gitignore's
+        # directory
+        if "/" in line and not line.startswith("/"):
+            line = f"/{line}"
+        patterns.append(line)
+    return patterns
+
+
+def get_source_ignore(config: Config) -> list[str]:
+    """
+    Gets the patterns of files to skip in a path source - the default ignore patterns,
+    the source's .gitignore, and the source_ignore option.
+
+    :param config: The configuration object containing source information.
+    :return: A list of glob patterns.
+    """
+    source_dir = Path(config.source)
+    return [*DEFAULT_SOURCE_IGNORE, *read_gitignore(source_dir / ".gitignore"),
+            *config.source_ignore]
+
+
+def sync_path_source(config: Config, source_code_path: Path):
+    """
+    Syncs a path source into the source code directory, only copying files that
+    changed and deleting files that were removed. Files matching the default ignore
+    patterns, the source's .gitignore, and the source_ignore option are skipped.
+
+    :param config: The configuration object containing source information.
+    :param source_code_path: The directory to sync to.
+    """
+    source_dir = Path(config.source)
+    ignore = get_source_ignore(config)
+    logger.debug(f"Syncing {source_dir} to {source_code_path}, ignoring {ignore}")
+    manifest = sync_dir(source_dir, source_code_path, ignore=ignore)
+    logger.info(f"Synced source: {manifest}")
+
+
+def download_source(config: Config, cwd: Path, no_cache: Optional[bool] = False,
+                    git_cache: Optional[GitMirrorCache] = None) -> Path:
     """
     Downloads the source code based on the provided configuration.
 
     :param config: The configuration object containing source information.
     :param cwd: The current working directory where the source code folder will be
      downloaded.
-    :param no_cache: If True, forces a fresh download of the source code.
+    :param no_cache: If True, forces a fresh download of the source code. For GitHub
+     sources with a git cache, only the working tree is recreated, the mirror is kept.
+    :param git_cache: The cache of git mirrors to check out GitHub sources from. If
+     None, GitHub sources are cloned directly from the remote.
     :return: The path to the downloaded source code.
     """
     source_code_path = cwd / f"{config.name} source"
@@ -33,15 +102,25 @@ def download_source(config: Config, cwd: Path,
                 logger.error("Permission denied. If it's a .git object, you may need "
                              "to delete it with admin/superuser privileges.")
                 raise e
+    elif source_code_path.exists() and config.source_type == SourceType.PATH:
+        logger.debug(f"Source code already exists at {source_code_path}, syncing")
+        sync_path_source(config, source_code_path)
+        return source_code_path
     elif source_code_path.exists():
         logger.debug(f"Source code already exists at {source_code_path}")
-        if config.source_type == SourceType.GITHUB:
+        if config.source_type == SourceType.GITHUB and git_cache is not None:
+            logger.debug("Checking for updates")
+            git_cache.checkout(config.source, config.source_checkout, source_code_path)
+        elif config.source_type == SourceType.GITHUB:
             logger.debug("Checking for updates")
             run_command(["git", "checkout", config.source_checkout],
                         cwd=source_code_path)
             run_command(["git", "pull"], cwd=source_code_path)
         return source_code_path
-    if config.source_type == SourceType.GITHUB:
+    if config.source_type == SourceType.GITHUB and git_cache is not None:
+        logger.info(f"Checking out source from GitHub")
+        git_cache.checkout(config.source, config.source_checkout, source_code_path)
+    elif config.source_type == SourceType.GITHUB:
         logger.info(f"Downloading source from GitHub")
         # Assume it's `git clone`able
         run_command(["git", "clone", config.source, source_code_path], cwd=cwd)
@@ -53,14 +132,7 @@ def download_source(config: Config, cwd: Path,
         run_shell_command(f"npx mkc download {config.source}", cwd=source_code_path)
     elif config.source_type == SourceType.PATH:
         logger.info(f"Copying source from path")
-        source_code_path.mkdir(parents=True, exist_ok=True)
-        # Copy the contents of the source directory to the source_code_path
-        source_path = Path(config.source)
-        for item in source_path.iterdir():
-            if item.is_dir():
-                shutil.copytree(item, source_code_path / item.name)
-            else:
-                shutil.copy2(item, source_code_path / item.name)
+        sync_path_source(config, source_code_path)
     else:
         raise ValueError(f"Unknown source type {config.source_type}")
     logger.debug(f"Source code path: {source_code_path}")
@@ -1,23 +1,127 @@
 import json
 import logging
 import shutil
-from io import BytesIO
 from pathlib import Path
-from typing import Callable
+from typing import Callable, Optional
 
-import requests
-from PIL import Image
-from bs4 import BeautifulSoup
-
-from convert.mkcd_to_website.config import Config, IconSourceType, SourceType
+from convert.mkcd_to_website.config import BuildProfile, Config, SourceType
+from convert.mkcd_to_website.simulator import get_simulator_url, write_simulator
+from utils.asset_cache import AssetCache
 from utils.cmd import run_shell_command
+from utils.fingerprint import get_tool_version, hash_tree
+from utils.icons import IconSet, link_icons
 from utils.logger import create_logger
+from utils.package_mirror import LOCKFILE_NAME, PackageMirror, install_packages, \
+    is_locked
+from utils.scaffold import ScaffoldCache, clone_tree, relink_dir
 
 logger = create_logger(name=__name__, level=logging.INFO)
 
 
+# Dependencies to add to the Vite project (these will be "yarn add"ed)
+DEPENDENCIES = ["react-toastify"]
+DEV_DEPENDENCIES = ["eslint-plugin-react-dom", "eslint-plugin-react-x", "prettier"]
+# Files copied from the template that are the same for every game
+STATIC_TEMPLATE_FILES = ("vite.config.ts", "eslint.config.js", ".prettierignore",
+                         "tsconfig.json", "tsconfig.app.json", "tsconfig.node.json")
+
+
+def write_package_json(template_dir: Path, prj_dir: Path, prj_name: str,
+                       config: Optional[Config] = None):
+    """
+    Write the package.json of the website from the template.
+
+    :param template_dir: The directory containing the template files.
+    :param prj_dir: The directory of the project.
+    :param prj_name: The name of the project.
+    :param config: The configuration object containing the project information. If
+     None, the placeholders from the template are kept.
+    """
+    package_json = json.loads((template_dir / "package.json").read_text())
+    package_json["name"] = prj_name
+    if config is not None:
+        package_json["version"] = config.version
+        package_json["description"] = config.description
+        package_json["author"] = config.author
+    if config is not None and config.profile == BuildProfile.FAST:
+        # Type errors are caught by release builds and the editor
+        build_script = "vite build --minify false"
+    else:
+        build_script = "tsc -b && vite build"
+    package_json["scripts"] = {
+        "dev": "vite",
+        "lint": "eslint .",
+        "writeLint": "eslint --fix .",
+        "format": "prettier --check .",
+        "writeFormat": "prettier --write .",
+        "build": build_script,
+        "preview": "vite preview"
+    }
+    (prj_dir / "package.json").write_text(json.dumps(package_json, indent=2))
+
+
+def copy_static_template_files(template_dir: Path, prj_dir: Path):
+    """
+    Copy the template files that are the same for every game into the website,
+    including the lockfile if the template has one.
+
+    :param template_dir: The directory containing the template files.
+    :param prj_dir: The directory of the project.
+    """
+    for file_name in STATIC_TEMPLATE_FILES:
+        shutil.copy(template_dir / file_name, prj_dir / file_name)
+    if (template_dir / LOCKFILE_NAME).exists():
+        shutil.copy(template_dir / LOCKFILE_NAME, prj_dir / LOCKFILE_NAME)
+
+
+def install_dependencies(prj_dir: Path,
+                         package_mirror: Optional[PackageMirror] = None):
+    """
+    Install the dependencies of the website.
+
+    :param prj_dir: The directory of the project.
+    :param package_mirror: The mirror to install packages from. If None, packages
+     come from the registry.
+    """
+    # yarn
+    install_packages(prj_dir, package_mirror)
+    if (prj_dir / LOCKFILE_NAME).exists():
+        # The template's package.json and lockfile already have everything
+        return
+    # yarn add stuff
+    run_shell_command(f"yarn add {" ".join(DEPENDENCIES)}", cwd=prj_dir)
+    run_shell_command(f"yarn add {" ".join(DEV_DEPENDENCIES)} --dev", cwd=prj_dir)
+
+
+def scaffold_website(template_dir: Path, prj_dir: Path,
+                     package_mirror: Optional[PackageMirror] = None):
+    """
+    Scaffold a React TS Vite project with its dependencies installed. Nothing in it is
+    specific to a game, so it can be reused for every game. If the template has a
+    lockfile, create-vite is skipped and the project is made from the template alone.
+
+    :param template_dir: The directory containing the template files.
+    :param prj_dir: The directory to create the project in.
+    :param package_mirror: The mirror to install packages from. If None, packages
+     come from the registry.
+    """
+    logger.debug(f"Scaffolding React TS Vite project at {prj_dir}")
+    if is_locked(template_dir, package_mirror):
+        prj_dir.mkdir(parents=True)
+    else:
+        run_shell_command(f"yarn create vite {prj_dir.name} -t react-ts "
+                          f"--no-interactive --no-rolldown", cwd=prj_dir.parent)
+    write_package_json(template_dir, prj_dir, prj_dir.name)
+    copy_static_template_files(template_dir, prj_dir)
+    install_dependencies(prj_dir, package_mirror)
+
+
 def generate_website(config: Config, prj_name: str, template_dir: Path, cwd: Path,
-                     bin_js_path: Path):
+                     bin_js_path: Path, asset_cache: AssetCache,
+                     no_cache: Optional[bool] = False,
+                     scaffold_cache: Optional[ScaffoldCache] = None,
+                     icons: Optional[IconSet] = None,
+                     package_mirror: Optional[PackageMirror] = None):
     """
     Generate the website by initializing a React TS Vite project, copying the necessary
     files, and substituting the correct values in.
@@ -27,16 +131,44 @@ def generate_website(config: Config, prj_name: str, template_dir: Path, cwd: Pat
     :param template_dir: The directory containing the template files.
     :param cwd: The current working directory where the project will be created.
     :param bin_js_path: The path to the binary.js file.
+    :param asset_cache: The cache to get the simulator HTML, CSS, and JS files from.
+    :param no_cache: If True, downloads the simulator files and recreates the scaffold
+     even if they are cached.
+    :param scaffold_cache: The cache to clone the project skeleton from. If None, the
+     project is scaffolded from scratch.
+    :param icons: The icons to use for the website. If None, no favicon is added.
+    :param package_mirror: The mirror to install packages from. If None, packages
+     come from the registry.
     """
     logger.debug(f"Creating React TS Vite project for {prj_name}")
+    old_dir = template_dir
+    new_dir = cwd / prj_name
     # Initialize a React TS Vite project
-    if (cwd / prj_name).exists():
+    if scaffold_cache is not None:
+        scaffold_dir = scaffold_cache.get(
+            "website", {
+                "template": {file_name: hash_tree(old_dir / file_name) for file_name
+                             in ("package.json", LOCKFILE_NAME, *STATIC_TEMPLATE_FILES)
+                             if (old_dir / file_name).exists()},
+                "node": get_tool_version("node --version"),
+                "yarn": get_tool_version("yarn --version")
+            }, lambda path: scaffold_website(old_dir, path, package_mirror),
+            refresh=no_cache)
+        if new_dir.exists():
+            # Installing in place would write through the links into the scaffold
+            logger.debug(f"Project {prj_name} already exists, updating it from the "
+                         f"scaffold...")
+            copy_static_template_files(old_dir, new_dir)
+            relink_dir(scaffold_dir / "node_modules", new_dir / "node_modules")
+        else:
+            clone_tree(scaffold_dir, new_dir)
+    elif new_dir.exists():
         logger.debug(f"Project {prj_name} already exists, continuing...")
+        copy_static_template_files(old_dir, new_dir)
+        write_package_json(old_dir, new_dir, prj_name, config)
+        install_dependencies(new_dir, package_mirror)
     else:
-        run_shell_command(f"yarn create vite {prj_name} -t react-ts --no-interactive --no-rolldown", cwd=cwd)
-    # Start copying files from template
-    old_dir = template_dir
-    new_dir = cwd / prj_name
+        scaffold_website(old_dir, new_dir, package_mirror)
 
     def copy_template(file_name: str, callback: Callable[[str], str] = lambda x: x):
         (new_dir / file_name).write_text(callback((old_dir / file_name).read_text()))
@@ -45,38 +177,11 @@ def generate_website(config: Config, prj_name: str, template_dir: Path, cwd: Pat
     # Copy index.html and substitute the title
     copy_template("index.html", lambda x: x.format(TITLE=config.title))
     # Modify package.json
-    package_json = json.loads((old_dir / "package.json").read_text())
-    package_json["name"] = prj_name
-    package_json["version"] = config.version
-    package_json["description"] = config.description
-    package_json["author"] = config.author
-    package_json["scripts"] = {
-        "dev": "vite",
-        "lint": "eslint .",
-        "writeLint": "eslint --fix .",
-        "format": "prettier --check .",
-        "writeFormat": "prettier --write .",
-        "build": "tsc -b && vite build",
-        "preview": "vite preview"
-    }
-    (new_dir / "package.json").write_text(json.dumps(package_json, indent=2))
-    # Queue dependencies to add (these will be "yarn add"ed)
-    dependencies = ["react-toastify"]
-    dev_dependencies = ["eslint-plugin-react-dom", "eslint-plugin-react-x", "prettier"]
+    write_package_json(old_dir, new_dir, prj_name, config)
     # Copy README.md
     copy_template("README.md",
                   lambda x: x.format(WEBSITE_NAME=prj_name,
                                      SOURCE=f"{config.source} @ {config.source_checkout}" if config.source_type == SourceType.GITHUB else config.source))
-    # Copy more files
-    for file_name in ("vite.config.ts", "eslint.config.js", ".prettierignore",
-                      "tsconfig.json",
-                      "tsconfig.app.json", "tsconfig.node.json"):
-        copy_template(file_name)
-    # yarn
-    run_shell_command("yarn", cwd=new_dir)
-    # yarn add stuff
-    run_shell_command(f"yarn add {" ".join(dependencies)}", cwd=new_dir)
-    run_shell_command(f"yarn add {" ".join(dev_dependencies)} --dev", cwd=new_dir)
     # Clear public directory
     if (new_dir / "public").exists():
         shutil.rmtree(new_dir / "public")
@@ -91,63 +196,18 @@ def generate_website(config: Config, prj_name: str, template_dir: Path, cwd: Pat
     # Copy binary.js
     logger.debug(f"Copying binary.js from {bin_js_path}")
     shutil.copy(bin_js_path, new_dir / "public" / "binary.js")
-    # Download https://trg-arcade.userpxt.io/---simulator
-    logger.debug("Downloading simulator files")
-    res = requests.get("https://trg-arcade.userpxt.io/---simulator")
-    if res.ok:
-        sim_html = res.text
-    else:
-        raise Exception(f"Failed to download simulator: {res.status_code} {res.reason}")
-    # Analyze simulator HTML for required CSS and JS files
-    logger.debug("Analyzing simulator HTML for required CSS and JS files")
-    soup = BeautifulSoup(sim_html, features="html.parser")
-    css_links = soup.find_all("link", rel="stylesheet")
-    js_scripts = soup.find_all("script")
-    logger.debug(f"Found {len(css_links)} CSS links and {len(js_scripts)} JS scripts")
-    for css in css_links:
-        if css.get("href"):
-            css_url = css.get("href")
-            logger.debug(f"Downloading CSS file: {css_url}")
-            res = requests.get(css_url)
-            if res.ok:
-                file_name = css_url.split("/")[-1]
-                # Download CSS file
-                (new_dir / "public" / file_name).write_text(res.text)
-                # Rewrite CSS file to use relative paths
-                css["href"] = f"./{file_name}"
-            else:
-                raise Exception(
-                    f"Failed to download CSS file: {res.status_code} {res.reason}")
-    for js in js_scripts:
-        if js.get("src"):
-            js_url = js.get("src")
-            logger.debug(f"Downloading JS file: {js_url}")
-            res = requests.get(js_url)
-            if res.ok:
-                file_name = js_url.split("/")[-1]
-                # Download JS file
-                (new_dir / "public" / file_name).write_text(res.text)
-                # Rewrite JS file to use relative paths
-                js["src"] = f"./{file_name}"
-            else:
-                raise Exception(
-                    f"Failed to download JS file: {res.status_code} {res.reason}")
-    sim_html = soup.prettify(formatter="html5")
-    (new_dir / "public" / "---simulator.html").write_text(sim_html)
-    # Copy or download icon to favicon.ico in public directory
-    if config.icon:
+    # Download the simulator, ex. https://trg-arcade.userpxt.io/---simulator
+    sim_url = get_simulator_url(config.simulator_url, config.simulator_version)
+    logger.debug(f"Getting simulator files from {sim_url}")
+    # A pinned version never changes, so cached files do not need revalidating
+    revalidate = config.simulator_version is None
+    sim_html = asset_cache.get(sim_url, refresh=no_cache,
+                               revalidate=revalidate).read_text()
+    # Get the CSS and JS files and point the simulator HTML to them
+    logger.debug(f"Writing simulator with {config.simulator_assets.value}ed CSS and JS")
+    write_simulator(sim_html, sim_url, asset_cache, new_dir / "public",
+                    config.simulator_assets, refresh=no_cache, revalidate=revalidate)
+    # Link icon to favicon.ico in public directory
+    if icons is not None:
         logger.debug(f"Found icon to use")
-        if config.icon_source_type == IconSourceType.URL:
-            logger.debug(f"Downloading icon from {config.icon}")
-            res = requests.get(config.icon)
-            buffer = BytesIO(res.content)
-            if res.ok:
-                im = Image.open(buffer)
-            else:
-                raise Exception(
-                    f"Failed to download icon: {res.status_code} {res.reason}")
-        else:
-            logger.debug(f"Reading icon from {config.icon}")
-            im = Image.open(config.icon)
-        logger.debug("Saving icon as favicon.ico")
-        im.save(new_dir / "public" / "favicon.ico")
+        link_icons(icons, new_dir / "public", ["favicon.ico"])
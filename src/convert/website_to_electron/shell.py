@@ -0,0 +1,228 @@
+import json
+import logging
+import plistlib
+import re
+import shutil
+import sys
+from pathlib import Path
+from typing import Any, Optional
+
+from convert.mkcd_to_website.assets import PRECOMPRESSED_PATTERNS
+from convert.mkcd_to_website.config import Config
+from convert.website_to_electron.electron import scaffold_electron
+from utils.cmd import run_command, run_shell_command
+from utils.filesystem import CopyMode, copy_file, sync_dir
+from utils.fingerprint import get_tool_version, hash_tree
+from utils.icons import IconSet
+from utils.logger import create_logger
+from utils.package_mirror import PackageMirror
+from utils.scaffold import ScaffoldCache
+
+logger = create_logger(name=__name__, level=logging.INFO)
+
+# Product name of the prebuilt shell, which is replaced with the game's title
+SHELL_PRODUCT_NAME = "electron-shell"
+# Helper apps inside a macOS app bundle, which Electron finds by the app's name
+MAC_HELPER_SUFFIXES = (" Helper", " Helper (GPU)", " Helper (Plugin)",
+                       " Helper (Renderer)")
+
+PLACEHOLDER_INDEX_HTML = """<!DOCTYPE html>
+<html lang="en">
+<head><meta charset="UTF-8"><title>Electron shell</title></head>
+<body></body>
+</html>
+"""
+
+
+def get_shell_inputs(template_dir: Path) -> dict[str, Any]:
+    """
+    Gets what the prebuilt Electron shell depends on.
+
+    :param template_dir: The directory containing the Electron template files.
+    :return: The inputs to key the cached shell with.
+    """
+    return {
+        "template": hash_tree(template_dir, exclude=("README.md",)),
+        "node": get_tool_version("node --version"),
+        "yarn": get_tool_version("yarn --version"),
+        "platform": sys.platform
+    }
+
+
+def build_electron_shell(template_dir: Path, prj_dir: Path,
+                         package_mirror: Optional[PackageMirror] = None):
+    """
+    Builds an Electron app without a game with Electron Forge's package command. The
+    app loads a game from its resources directory, so it can be packaged once and
+    copied for every game.
+
+    :param template_dir: The directory containing the Electron template files.
+    :param prj_dir: The directory to create the project in.
+    :param package_mirror: The mirror to install packages from. If None, packages
+     come from the registry.
+    """
+    scaffold_electron(template_dir, prj_dir, package_mirror)
+    package_json = json.loads((prj_dir / "package.json").read_text())
+    package_json["productName"] = SHELL_PRODUCT_NAME
+    (prj_dir / "package.json").write_text(json.dumps(package_json, indent=2))
+    static_dir = prj_dir / "src" / "static"
+    static_dir.mkdir(parents=True, exist_ok=True)
+    (static_dir / "index.html").write_text(PLACEHOLDER_INDEX_HTML)
+    (static_dir / "binary.js").write_text("")
+    run_shell_command("yarn run package", cwd=prj_dir)
+
+
+def get_electron_shell(template_dir: Path, scaffold_cache: ScaffoldCache,
+                       no_cache: Optional[bool] = False,
+                       package_mirror: Optional[PackageMirror] = None) -> Path:
+    """
+    Gets the prebuilt Electron shell for this platform, building it if it is not
+    cached yet.
+
+    :param template_dir: The directory containing the Electron template files.
+    :param scaffold_cache: The cache to keep the shell in.
+    :param no_cache: If True, rebuild the shell even if it is cached.
+    :param package_mirror: The mirror to install packages from. If None, packages
+     come from the registry.
+    :return: The directory of the project the shell was built in.
+    """
+    return scaffold_cache.get("electron-shell", get_shell_inputs(template_dir),
+                              lambda path: build_electron_shell(template_dir, path,
+                                                                package_mirror),
+                              refresh=no_cache)
+
+
+def _app_file_name(title: str) -> str:
+    # Characters that are not allowed in file names on some platform
+    return re.sub(r'[<>:"/\\|?*\x00-\x1f]', "", title).strip(" .") or "app"
+
+
+def _patch_plist(plist_path: Path, changes: dict[str, str]):
+    with plist_path.open("rb") as f:
+        plist = plistlib.load(f)
+    plist.update(changes)
+    # The plist may be linked to the cached shell, so replace it instead
+    plist_path.unlink()
+    with plist_path.open("wb") as f:
+        plistlib.dump(plist, f)
+
+
+def _rename_mac_app(app_dir: Path, name: str, config: Config,
+                    icons: Optional[IconSet]) -> Path:
+    contents_dir = app_dir / "Contents"
+    (contents_dir / "MacOS" / SHELL_PRODUCT_NAME).rename(contents_dir / "MacOS" / name)
+    plist_path = contents_dir / "Info.plist"
+    with plist_path.open("rb") as f:
+        icon_file = plistlib.load(f).get("CFBundleIconFile", "electron.icns")
+    _patch_plist(plist_path, {
+        "CFBundleName": name,
+        "CFBundleDisplayName": config.title,
+        "CFBundleExecutable": name,
+        "CFBundleIdentifier": f"com.{name.lower().replace(' ', '-')}.app",
+        "CFBundleShortVersionString": config.version,
+        "CFBundleVersion": config.version
+    })
+    for suffix in MAC_HELPER_SUFFIXES:
+        helper_dir = contents_dir / "Frameworks" / f"{SHELL_PRODUCT_NAME}{suffix}.app"
+        if not helper_dir.exists():
+            continue
+        helper_contents_dir = helper_dir / "Contents"
+        (helper_contents_dir / "MacOS" / f"{SHELL_PRODUCT_NAME}{suffix}").rename(
+            helper_contents_dir / "MacOS" / f"{name}{suffix}")
+        _patch_plist(helper_contents_dir / "Info.plist", {
+            "CFBundleName": f"{name}{suffix}",
+            "CFBundleExecutable": f"{name}{suffix}"
+        })
+        helper_dir.rename(helper_dir.with_name(f"{name}{suffix}.app"))
+    if icons is not None:
+        copy_file(icons.icns, contents_dir / "Resources" / icon_file)
+    new_app_dir = app_dir.with_name(f"{name}.app")
+    app_dir.rename(new_app_dir)
+    return new_app_dir
+
+
+def _rename_windows_app(packaged_dir: Path, name: str, config: Config,
+                        icons: Optional[IconSet], shell_dir: Path):
+    exe_path = packaged_dir / f"{name}.exe"
+    # rcedit edits in place, so the executable must not be linked to the cached shell
+    copy_file(packaged_dir / f"{SHELL_PRODUCT_NAME}.exe", exe_path)
+    (packaged_dir / f"{SHELL_PRODUCT_NAME}.exe").unlink()
+    options = {
+        "version-string": {"ProductName": config.title, "FileDescription": config.title,
+                           "CompanyName": config.author},
+        "product-version": config.version,
+        "file-version": config.version
+    }
+    if icons is not None:
+        options["icon"] = str(icons.ico)
+    # rcedit is a dependency of the Electron template
+    script = (f"require('rcedit')({json.dumps(str(exe_path))}, "
+              f"{json.dumps(options)}).catch((e) => {{ console.error(e); "
+              f"process.exit(1); }})")
+    run_command(["node", "-e", script], cwd=shell_dir)
+
+
+def package_electron_from_shell(config: Config, dist_dir: Path, out_dir: Path,
+                                shell_dir: Path,
+                                icons: Optional[IconSet] = None) -> Path:
+    """
+    Packages a game into a copy of the prebuilt Electron shell. The website goes into
+    the resources directory next to binary.js, and the executable is renamed after
+    the game. app.asar is left as it is, so its integrity check still passes.
+
+    :param config: The configuration object containing the project information.
+    :param dist_dir: The dist directory with all the static HTML, CSS, and JS files.
+    :param out_dir: The directory to put the packaged app in.
+    :param shell_dir: The directory of the prebuilt shell's project.
+    :param icons: The icons to use for the app. If None, Electron's icon is kept.
+    :return: The directory of the packaged app.
+    """
+    packaged_dirs = [path for path in (shell_dir / "out").iterdir()
+                     if path.is_dir() and path.name.startswith(f"{SHELL_PRODUCT_NAME}-")]
+    if len(packaged_dirs) != 1:
+        raise RuntimeError(f"Expected one packaged Electron shell in {shell_dir / 'out'}, "
+                           f"found {len(packaged_dirs)}")
+    shell_packaged_dir = packaged_dirs[0]
+    platform_arch = shell_packaged_dir.name[len(SHELL_PRODUCT_NAME) + 1:]
+    name = _app_file_name(config.title)
+    packaged_dir = out_dir / f"{name}-{platform_arch}"
+    logger.debug(f"Copying Electron shell from {shell_packaged_dir} to {packaged_dir}")
+    if packaged_dir.exists():
+        shutil.rmtree(packaged_dir)
+    is_mac_app = (shell_packaged_dir / f"{SHELL_PRODUCT_NAME}.app").exists()
+    if is_mac_app:
+        # Frameworks are full of symlinks, and signing writes into every binary
+        shutil.copytree(shell_packaged_dir, packaged_dir, symlinks=True)
+    else:
+        # Files that are patched are replaced, never written through, so linking is
+        # safe
+        sync_dir(shell_packaged_dir, packaged_dir, CopyMode.AUTO)
+
+    if is_mac_app:
+        app_dir = _rename_mac_app(packaged_dir / f"{SHELL_PRODUCT_NAME}.app", name,
+                                  config, icons)
+        resources_dir = app_dir / "Contents" / "Resources"
+    elif (packaged_dir / f"{SHELL_PRODUCT_NAME}.exe").exists():
+        _rename_windows_app(packaged_dir, name, config, icons, shell_dir)
+        resources_dir = packaged_dir / "resources"
+    else:
+        (packaged_dir / SHELL_PRODUCT_NAME).rename(packaged_dir / name)
+        resources_dir = packaged_dir / "resources"
+
+    logger.debug(f"Copying website files into {resources_dir}")
+    sync_dir(dist_dir, resources_dir / "game", CopyMode.AUTO,
+             ignore=PRECOMPRESSED_PATTERNS)
+    copy_file(dist_dir / "binary.js", resources_dir / "binary.js", CopyMode.AUTO)
+    if icons is not None:
+        copy_file(icons.png, resources_dir / "icon.png", CopyMode.AUTO)
+    (resources_dir / "game.json").write_text(json.dumps({
+        "name": name,
+        "productName": config.title,
+        "version": config.version,
+        "author": config.author
+    }, indent=2))
+    # Apple Silicon refuses to run modified apps without a valid signature
+    if is_mac_app and shutil.which("codesign") is not None:
+        run_command(["codesign", "--force", "--deep", "--sign", "-", app_dir])
+    logger.info(f"Packaged {config.title} from the prebuilt Electron shell")
+    return packaged_dir
@@ -1,69 +1,93 @@
 import json
 import logging
-import shutil
-from io import BytesIO
+import sys
 from pathlib import Path
-from typing import Callable
+from typing import Any, Callable, Optional
 
-import requests
-from PIL import Image
-
-from convert.mkcd_to_website.config import Config, IconSourceType, SourceType
+from convert.mkcd_to_website.assets import PRECOMPRESSED_PATTERNS
+from convert.mkcd_to_website.config import BuildProfile, Config, SourceType, \
+    get_cargo_profile_dir_name
+from utils.cargo_cache import CargoTargetCache
 from utils.cmd import run_shell_command
-from utils.filesystem import copy_these, delete_these
+from utils.filesystem import CopyManifest, CopyMode, copy_file, copy_these, \
+    delete_these, sync_dir
+from utils.fingerprint import get_tool_version, hash_tree
+from utils.icons import IconSet, link_icons
 from utils.logger import create_logger
+from utils.package_mirror import LOCKFILE_NAME, PackageMirror, install_packages, \
+    is_locked
+from utils.scaffold import ScaffoldCache, clone_tree, relink_dir
 
 logger = create_logger(name=__name__, level=logging.INFO)
 
 
-def get_icon(config: Config, src_dir: Path):
+def write_package_json(template_dir: Path, prj_dir: Path, prj_name: str,
+                       config: Optional[Config] = None):
     """
-    Prepares the icon for the Electron app. If the icon is a URL, it downloads the icon
-    and saves it to the specified path. If the icon is a local file, it copies the file
-    to the specified path. Then it will convert it to ICO for Windows, ICNS for Mac, and
-    PNG for Linux.
+    Write the package.json of the Tauri app from the template.
 
-    :param config: The configuration object containing the project information.
-    :param src_dir: The src-tauri directory of the Tauri app - the icon will be saved
-     here.
+    :param template_dir: The directory containing the template files.
+    :param prj_dir: The directory of the project.
+    :param prj_name: The name of the project.
+    :param config: The configuration object containing the project information. If
+     None, the placeholders from the template are kept.
     """
-    if config.icon is None:
-        logger.debug("No icon specified, skipping icon generation.")
-        return
-    logger.debug(f"Preparing icon")
-    icon_dir = src_dir / "icons"
-    icon_dir.mkdir(parents=True, exist_ok=True)
-    if config.icon_source_type == IconSourceType.PATH:
-        path = Path(config.icon)
-        source_icon_path = icon_dir / f"source{path.suffix}"
-        logger.debug(f"Copying icon from {path} to {source_icon_path}")
-        shutil.copy(path, source_icon_path)
+    package_json = json.loads((template_dir / "package.json").read_text())
+    package_json["name"] = prj_name
+    if config is not None:
+        package_json["version"] = config.version
+        package_json["description"] = config.description
+        package_json["author"] = config.author
+    (prj_dir / "package.json").write_text(json.dumps(package_json, indent=2))
+
+
+def copy_static_template_files(template_dir: Path, prj_dir: Path):
+    """
+    Copy the template files that are the same for every game into the Tauri app,
+    including the lockfile if the template has one.
+
+    :param template_dir: The directory containing the template files.
+    :param prj_dir: The directory of the project.
+    """
+    delete_these([".vscode"], prj_dir)
+    copy_these([LOCKFILE_NAME], template_dir, prj_dir)
+    delete_these(["assets", "index.html", "main.js", "style.css"], prj_dir / "src")
+    # Copy src-tauri directory
+    copy_these(list([p.name for p in (template_dir / "src-tauri").glob("*")]),
+               template_dir / "src-tauri",
+               prj_dir / "src-tauri")
+
+
+def scaffold_tauri(template_dir: Path, prj_dir: Path,
+                   package_mirror: Optional[PackageMirror] = None):
+    """
+    Scaffold a Tauri app with its dependencies installed. Nothing in it is specific to
+    a game, so it can be reused for every game. If the template has a lockfile,
+    create-tauri-app is skipped and the app is made from the template alone.
+
+    :param template_dir: The directory containing the template files.
+    :param prj_dir: The directory to create the project in.
+    :param package_mirror: The mirror to install packages from. If None, packages
+     come from the registry.
+    """
+    logger.debug(f"Scaffolding Tauri app at {prj_dir}")
+    if is_locked(template_dir, package_mirror):
+        prj_dir.mkdir(parents=True)
     else:
-        url = config.icon
-        logger.debug(f"Downloading icon from {url}")
-        res = requests.get(url)
-        if not res.ok:
-            logger.error(f"Failed to download icon from {url}")
-            raise Exception(f"Failed to download icon from {url}")
-        buffer = BytesIO(res.content)
-        logger.debug(
-            f"Downloaded image size {round(buffer.getbuffer().nbytes / 1024)} kb")
-        img = Image.open(buffer)
-        source_icon_path = icon_dir / f"source.png"
-        img.save(source_icon_path)
-        logger.debug(f"Saved icon to {source_icon_path}")
-
-    formats = ["ico", "icns", "png"]
-    source_img = Image.open(source_icon_path)
-    for format in formats:
-        icon_path = icon_dir / f"icon.{format}"
-        logger.debug(f"Converting icon to {format} and saving to {icon_path}")
-        source_img.save(icon_path, format=format.upper(),
-                        sizes=[(256, 256)] if format == "ico" else None)
+        run_shell_command(
+            f"yarn create tauri-app {prj_dir.name} -m yarn -t vanilla -y",
+            cwd=prj_dir.parent)
+    write_package_json(template_dir, prj_dir, prj_dir.name)
+    copy_static_template_files(template_dir, prj_dir)
+    # yarn
+    install_packages(prj_dir, package_mirror)
 
 
 def generate_tauri(config: Config, prj_name: str, template_dir: Path, dist_dir: Path,
-                   cwd: Path):
+                   cwd: Path, scaffold_cache: Optional[ScaffoldCache] = None,
+                   no_cache: Optional[bool] = False,
+                   icons: Optional[IconSet] = None,
+                   package_mirror: Optional[PackageMirror] = None) -> CopyManifest:
     """
     Generate the Tauri app from static HTML, CSS, and JS files.
 
@@ -72,42 +96,56 @@ def generate_tauri(config: Config, prj_name: str, template_dir: Path, dist_dir:
     :param template_dir: The directory containing the template files.
     :param dist_dir: The dist directory with all the static HTML, CSS, and JS files.
     :param cwd: The current working directory where the project will be created.
+    :param scaffold_cache: The cache to clone the project skeleton from. If None, the
+     project is scaffolded from scratch.
+    :param no_cache: If True, recreates the scaffold even if it is cached.
+    :param icons: The icons to use for the app. If None, no icons are added.
+    :param package_mirror: The mirror to install packages from. If None, packages
+     come from the registry.
+    :return: A CopyManifest of which website files changed in the app.
     """
     logger.debug(f"Creating Tauri app for {prj_name}")
     # Initialize a Tauri project
     prj_dir = cwd / prj_name
     prj_src_dir = prj_dir / "src"
-    if prj_dir.exists():
+    old_dir = template_dir
+    new_dir = prj_dir
+    if scaffold_cache is not None:
+        scaffold_dir = scaffold_cache.get(
+            "tauri", {
+                "template": hash_tree(old_dir, exclude=("README.md",)),
+                "node": get_tool_version("node --version"),
+                "yarn": get_tool_version("yarn --version")
+            }, lambda path: scaffold_tauri(old_dir, path, package_mirror),
+            refresh=no_cache)
+        if prj_dir.exists():
+            # Installing in place would write through the links into the scaffold
+            logger.debug(f"Project {prj_name} already exists, updating it from the "
+                         f"scaffold...")
+            copy_static_template_files(old_dir, new_dir)
+            relink_dir(scaffold_dir / "node_modules", new_dir / "node_modules")
+        else:
+            clone_tree(scaffold_dir, new_dir)
+    elif prj_dir.exists():
         logger.debug(f"Project {prj_name} already exists, continuing...")
+        write_package_json(old_dir, new_dir, prj_name, config)
+        copy_static_template_files(old_dir, new_dir)
+        # yarn
+        install_packages(prj_dir, package_mirror)
     else:
-        run_shell_command(
-            f"yarn create tauri-app {prj_name} -m yarn -t vanilla -y",
-            cwd=cwd)
-    delete_these([".vscode"], prj_dir)
-    delete_these(["assets", "index.html", "main.js", "style.css"], prj_src_dir)
+        scaffold_tauri(old_dir, new_dir, package_mirror)
     # Start copying files from template
-    old_dir = template_dir
-    new_dir = prj_dir
 
     def copy_template(file_name: str, callback: Callable[[str], str] = lambda x: x):
         (new_dir / file_name).write_text(callback((old_dir / file_name).read_text()))
 
     logger.debug(f"Copying website files from {old_dir} to {new_dir}")
     # Modify package.json
-    package_json = json.loads((old_dir / "package.json").read_text())
-    package_json["name"] = prj_name
-    package_json["version"] = config.version
-    package_json["description"] = config.description
-    package_json["author"] = config.author
-    (new_dir / "package.json").write_text(json.dumps(package_json, indent=2))
+    write_package_json(old_dir, new_dir, prj_name, config)
     # Copy README.md
     copy_template("README.md",
                   lambda x: x.format(WEBSITE_NAME=prj_name,
                                      SOURCE=f"{config.source} @ {config.source_checkout}" if config.source_type == SourceType.GITHUB else config.source))
-    # Copy src-tauri directory
-    copy_these(list([p.name for p in (old_dir / "src-tauri").glob("*")]),
-               old_dir / "src-tauri",
-               prj_dir / "src-tauri")
     # Modify src-tauri/tauri.conf.json
     tauri_conf_json = json.loads((old_dir / "src-tauri/tauri.conf.json").read_text())
     tauri_conf_json["productName"] = config.title
@@ -116,12 +154,75 @@ def generate_tauri(config: Config, prj_name: str, template_dir: Path, dist_dir:
     tauri_conf_json["app"]["windows"][0]["title"] = config.title
     tauri_conf_json["app"]["windows"][0]["width"] = 160 * 4
     tauri_conf_json["app"]["windows"][0]["height"] = 120 * 4
+    # Installers take longer to make than the app takes to compile
+    tauri_conf_json["bundle"]["active"] = config.profile == BuildProfile.RELEASE
     (new_dir / "src-tauri" / "tauri.conf.json").write_text(
         json.dumps(tauri_conf_json, indent=2))
     # Copy dist directory
     prj_src_dir.mkdir(parents=True, exist_ok=True)
-    copy_these(list([p.name for p in dist_dir.glob("*")]), dist_dir, prj_src_dir)
-    # Get icons
-    get_icon(config, prj_dir / "src-tauri")
-    # yarn
-    run_shell_command("yarn", cwd=prj_dir)
+    # Precompressed files are only useful to static hosts
+    manifest = sync_dir(dist_dir, prj_src_dir, CopyMode.AUTO,
+                        ignore=PRECOMPRESSED_PATTERNS)
+    logger.debug(f"Synced website files: {manifest}")
+    # Link icons
+    if icons is not None:
+        link_icons(icons, prj_dir / "src-tauri" / "icons",
+                   ["icon.ico", "icon.icns", "icon.png"])
+    else:
+        logger.debug("No icon specified, skipping icon generation.")
+    return manifest
+
+
+def get_cargo_target_inputs(template_dir: Path) -> dict[str, Any]:
+    """
+    Gets what the compiled Rust dependencies of the Tauri app depend on, which
+    excludes the game's assets, icons, and tauri.conf.json.
+
+    :param template_dir: The directory containing the template files.
+    :return: The inputs to key a shared cargo target directory with.
+    """
+    return {
+        "rust": hash_tree(template_dir / "src-tauri",
+                          exclude=("icons", "tauri.conf.json")),
+        "cargo": get_tool_version("cargo --version"),
+        "platform": sys.platform
+    }
+
+
+def build_tauri_app(prj_dir: Path, template_dir: Path,
+                    cargo_target_cache: Optional[CargoTargetCache] = None,
+                    profile: BuildProfile = BuildProfile.RELEASE) -> Path:
+    """
+    Builds the Tauri app with yarn run tauri build.
+
+    :param prj_dir: The directory of the project.
+    :param template_dir: The directory containing the template files.
+    :param cargo_target_cache: The cache of shared cargo target directories. If None,
+     the app is compiled in its own target directory.
+    :param profile: The build profile. The fast profile uses Cargo's dev profile,
+     which is unoptimized and compiles incrementally.
+    :return: The directory with the executable and the bundles.
+    """
+    command = "yarn run tauri build"
+    if profile == BuildProfile.FAST:
+        command += " --debug --no-bundle"
+    profile_dir_name = get_cargo_profile_dir_name(profile)
+    dist_dir = prj_dir / "src-tauri" / "target" / profile_dir_name
+    if cargo_target_cache is None:
+        run_shell_command(command, cwd=prj_dir)
+        return dist_dir
+    with cargo_target_cache.use(get_cargo_target_inputs(template_dir)) as target_dir:
+        shared_dist_dir = target_dir / profile_dir_name
+        # Bundles are named after the game, so clear the last game's
+        delete_these(["bundle"], shared_dist_dir)
+        run_shell_command(command, cwd=prj_dir,
+                          env={"CARGO_TARGET_DIR": str(target_dir)})
+        # The next game overwrites the shared outputs, so copy them to the project
+        logger.debug(f"Copying outputs from {shared_dist_dir} to {dist_dir}")
+        dist_dir.mkdir(parents=True, exist_ok=True)
+        for path in shared_dist_dir.iterdir():
+            if path.is_file():
+                copy_file(path, dist_dir / path.name, CopyMode.REFLINK)
+        if (shared_dist_dir / "bundle").is_dir():
+            sync_dir(shared_dist_dir / "bundle", dist_dir / "bundle", CopyMode.REFLINK)
+    return dist_dir
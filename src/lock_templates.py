@@ -0,0 +1,93 @@
+import logging
+import shutil
+from argparse import ArgumentParser
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Callable, Optional
+
+from convert.mkcd_to_website import website
+from convert.website_to_electron import electron
+from convert.website_to_tauri import tauri
+from utils.cache import get_cache_dir
+from utils.cmd import run_shell_command
+from utils.logger import create_logger, set_all_stdout_logger_levels
+from utils.package_mirror import LOCKFILE_NAME, PackageMirror
+
+logger = create_logger(name=__name__, level=logging.INFO)
+
+TEMPLATES_DIR = Path(__file__).parent / "templates"
+# How each template's package.json is written, keyed by template name
+TEMPLATES: dict[str, Callable[[Path, Path, str], None]] = {
+    "website": website.write_package_json,
+    "electron": electron.write_package_json,
+    "tauri": tauri.write_package_json
+}
+
+parser = ArgumentParser(description="Pin the packages of the website, Electron, and "
+                                    "Tauri templates in a yarn.lock, and add them "
+                                    "to the package mirror.")
+parser.add_argument("--templates", type=str, nargs="+", choices=list(TEMPLATES),
+                    default=list(TEMPLATES),
+                    help="Templates to lock. Defaults to all of them.")
+parser.add_argument("--upgrade", action="store_true",
+                    help="Resolve every package again instead of keeping the "
+                         "versions in the existing lockfiles.")
+parser.add_argument("--mirror", type=Path,
+                    help="Directory of the yarn offline mirror to add the packages "
+                         "to. Defaults to one in the cache directory.")
+parser.add_argument("--cache-dir", type=Path,
+                    help="Directory of the persistent caches. Defaults to the user "
+                         "cache directory.")
+parser.add_argument("--debug", action="store_true",
+                    help="Enable debug logging.")
+
+
+def lock_template(name: str, package_mirror: Optional[PackageMirror] = None,
+                  upgrade: bool = False) -> Path:
+    """
+    Resolves the packages of a template and writes them to the template's yarn.lock.
+    Packages already in the lockfile keep their versions, and new ones in the
+    template's package.json are added. Install scripts are not run, since only the
+    lockfile and the package tarballs are kept.
+
+    :param name: The name of the template, ex. website.
+    :param package_mirror: The mirror to add the packages to. If None, they are only
+     kept in yarn's cache.
+    :param upgrade: If True, ignore the existing lockfile and resolve the newest
+     versions allowed by package.json.
+    :return: The path to the lockfile.
+    """
+    template_dir = TEMPLATES_DIR / f"{name}_files"
+    lockfile_path = template_dir / LOCKFILE_NAME
+    logger.info(f"Locking packages of the {name} template")
+    with TemporaryDirectory() as tmp:
+        prj_dir = Path(tmp)
+        TEMPLATES[name](template_dir, prj_dir, f"{name}-template")
+        if lockfile_path.exists() and not upgrade:
+            shutil.copy(lockfile_path, prj_dir / LOCKFILE_NAME)
+        if package_mirror is not None:
+            package_mirror.write_yarnrc(prj_dir)
+        run_shell_command("yarn install --non-interactive --ignore-scripts",
+                          cwd=prj_dir)
+        shutil.copy(prj_dir / LOCKFILE_NAME, lockfile_path)
+    logger.info(f"Wrote {lockfile_path}")
+    return lockfile_path
+
+
+def main():
+    args = parser.parse_args()
+    if args.debug:
+        set_all_stdout_logger_levels(logging.DEBUG)
+    logger.debug(f"Received arguments: {args}")
+    if shutil.which("yarn") is None:
+        parser.error("yarn is needed to lock the templates, install it with "
+                     "npm install --global yarn")
+    package_mirror = PackageMirror(get_cache_dir(args.cache_dir),
+                                   mirror_dir=args.mirror)
+    for name in args.templates:
+        lock_template(name, package_mirror, args.upgrade)
+    logger.info(f"Packages are mirrored in {package_mirror.root}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,65 @@
+import glob
 import logging
-from argparse import ArgumentParser
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
 from pathlib import Path
+from typing import Optional
 
-from convert.mkcd_to_website.config import OutputType, parse_config
-from convert.mkcd_to_website.source import download_source
-from convert.mkcd_to_website.website import generate_website
-from convert.website_to_electron.electron import generate_electron
-from convert.website_to_tauri.tauri import generate_tauri
+from build import BuildOptions, build, get_bin_build_fingerprint, \
+    get_website_project_name
+from convert.mkcd_to_website.config import BuildProfile, OutputType, SourceType
+from convert.mkcd_to_website.dev_server import DEFAULT_DEV_SERVER_PORT, DevServer, \
+    publish_binary
+from convert.mkcd_to_website.source import DEFAULT_SOURCE_IGNORE, get_source_ignore, \
+    sync_path_source
+from utils.binary_cache import BinaryCache
+from utils.cache import get_cache_dir
 from utils.cmd import run_shell_command
-from utils.filesystem import delete_these
 from utils.logger import create_logger, set_all_stdout_logger_levels
+from utils.trace import get_tracer, write_chrome_trace
+from utils.watch import TreeWatcher
 
 logger = create_logger(name=__name__, level=logging.INFO)
 
 parser = ArgumentParser(description="Convert your MakeCode Arcade games into a "
                                     "standalone offline executable!")
-parser.add_argument("config_path", type=Path,
-                    help="Path to the YAML configuration file.")
+parser.add_argument("config_paths", type=str, nargs="+", metavar="config_path",
+                    help="Path to the YAML configuration file. Pass more than one "
+                         "path or a glob pattern to build many games.")
+parser.add_argument("-j", "--jobs", type=int, default=1,
+                    help="Number of games to build at the same time when building "
+                         "many games. Defaults to 1.")
 parser.add_argument("--no-cache", action="store_true",
                     help="Do not use cached files. This will delete and download all "
                          "necessary files.")
+parser.add_argument("--rebuild", action="store_true",
+                    help="Run every stage even if its inputs have not changed since "
+                         "the last build.")
+parser.add_argument("--offline", action="store_true",
+                    help="Do not download anything and only use cached simulator "
+                         "files, mirrored source code, and mirrored packages.")
+parser.add_argument("--cache-dir", type=Path,
+                    help="Directory to store persistent caches in, which are shared "
+                         "between games. Defaults to the user cache directory.")
+parser.add_argument("--package-mirror", type=Path,
+                    help="Directory of the yarn offline mirror that packages are "
+                         "installed from. Defaults to one in the cache directory.")
+parser.add_argument("--electron-shell", action="store_true",
+                    help="Package the Electron app by copying a prebuilt Electron "
+                         "shell, which is built once and cached, instead of building "
+                         "and making the app with Electron Forge for every game. "
+                         "No installers are made.")
+parser.add_argument("--profile", type=str,
+                    choices=[profile.value for profile in BuildProfile],
+                    help="Build profile, which overrides the one in the configuration. "
+                         "release type-checks, minifies, and makes every installer. "
+                         "fast skips type-checking and minification, only zips the "
+                         "Electron app for this platform, and builds the Tauri app "
+                         "without optimizations or installers. Defaults to release.")
 parser.add_argument("--skip-source-download", action="store_true",
                     help="Skip source code download. This is useful for debugging.")
 parser.add_argument("--skip-bin-build", action="store_true",
@@ -36,143 +76,220 @@ parser.add_argument("--skip-tauri-gen", action="store_true",
                     help="Skip Tauri app generation. This is useful for debugging.")
 parser.add_argument("--skip-tauri-build", action="store_true",
                     help="Skip building the Tauri app. This is useful for debugging.")
+parser.add_argument("--watch", action="store_true",
+                    help="Keep running, rebuild the game whenever its source code "
+                         "changes, and play it in the website's dev server, which "
+                         "reloads the game without reloading the page. Only the "
+                         "website is generated, the apps are not built.")
+parser.add_argument("--port", type=int, default=DEFAULT_DEV_SERVER_PORT,
+                    help=f"Port of the dev server in watch mode. Defaults to "
+                         f"{DEFAULT_DEV_SERVER_PORT}.")
+parser.add_argument("--trace", type=Path,
+                    help="Write a Chrome trace of the build's stages and commands to "
+                         "this JSON file. Open it with chrome://tracing or "
+                         "https://ui.perfetto.dev.")
 parser.add_argument("--debug", action="store_true",
                     help="Enable debug logging.")
-args = parser.parse_args()
-debug = bool(args.debug)
-if debug:
-    set_all_stdout_logger_levels(logging.DEBUG)
-logger.debug(f"Received arguments: {args}")
-
-config_path = Path(args.config_path)
-logger.info(f"Loading configuration from {config_path}")
-config = parse_config(config_path.read_text(), config_path.parent)
-
-output_format = config.output
-logger.debug(f"Building to {output_format.value}")
-logger.debug(f"Window title will be {config.title}")
-
-no_cache = bool(args.no_cache)
-if no_cache:
-    logger.info("No cache option selected. Ignoring cached files.")
-skip_source_download = bool(args.skip_source_download)
-skip_bin_build = bool(args.skip_bin_build)
-skip_website_gen = bool(args.skip_website_gen)
-skip_website_build = bool(args.skip_website_build)
-skip_electron_gen = bool(args.skip_electron_gen)
-skip_electron_build = bool(args.skip_electron_build)
-skip_tauri_gen = bool(args.skip_tauri_gen)
-skip_tauri_build = bool(args.skip_tauri_build)
-
-cwd = config_path.parent / config.name
-src_dir = Path(__file__).parent
-logger.debug(f"Current working directory: {cwd} (source code directory will be "
-             f"downloaded here)")
-logger.debug(f"Source code directory: {src_dir}")
-cwd.mkdir(parents=True, exist_ok=True)
-
-# Download source code
-if skip_source_download:
-    logger.info("Skipping source code download")
+
+
+def get_build_options(args: Namespace) -> BuildOptions:
+    """
+    Gets the options of a build from the command line arguments.
+
+    :param args: The parsed command line arguments.
+    :return: A BuildOptions.
+    """
+    return BuildOptions(
+        no_cache=bool(args.no_cache),
+        rebuild=bool(args.rebuild),
+        offline=bool(args.offline),
+        cache_dir=args.cache_dir,
+        package_mirror=args.package_mirror,
+        electron_shell=bool(args.electron_shell),
+        profile=BuildProfile(args.profile) if args.profile is not None else None,
+        skip_source_download=bool(args.skip_source_download),
+        skip_bin_build=bool(args.skip_bin_build),
+        skip_website_gen=bool(args.skip_website_gen),
+        skip_website_build=bool(args.skip_website_build),
+        skip_electron_gen=bool(args.skip_electron_gen),
+        skip_electron_build=bool(args.skip_electron_build),
+        skip_tauri_gen=bool(args.skip_tauri_gen),
+        skip_tauri_build=bool(args.skip_tauri_build)
+    )
+
+
+def watch_game(config_path: Path, args: Namespace):
+    """
+    Builds one game, then keeps rebuilding binary.js whenever the source code changes
+    and publishes it to the website's dev server. Runs until interrupted.
+
+    :param config_path: The path to the YAML configuration file of the game.
+    :param args: The parsed command line arguments.
+    """
+    # Everything up to generating the website, which the dev server serves
+    options = replace(get_build_options(args), skip_website_build=True,
+                      skip_electron_gen=True, skip_electron_build=True,
+                      skip_tauri_gen=True, skip_tauri_build=True)
+    config = build(config_path, options).config
+
+    cwd = config_path.parent / config.name
     source_code_path = cwd / f"{config.name} source"
-else:
-    logger.info("Downloading source code")
-    source_code_path = download_source(config, cwd, no_cache)
-
-# npx pxt build
-binary_js_path = source_code_path / "built" / "binary.js"
-if skip_bin_build:
-    logger.info("Skipping build")
-else:
-    logger.info("Building project")
-    if no_cache:
-        logger.debug("Checking for binary to remove")
-        if binary_js_path.exists():
-            logger.debug(f"Deleting {binary_js_path}")
-            binary_js_path.unlink()
-    run_shell_command("npx mkc build -j", cwd=source_code_path)
-logger.debug(f"Binary JS path: {binary_js_path}")
-
-# yarn create vite, copy files, and substitute values
-vite_project_name = f"{config.name.lower().replace(" ", "-")}-website"
-website_path = cwd / vite_project_name
-if skip_website_gen:
-    logger.info("Skipping website generation")
-else:
-    logger.info(f"Generating TS React and Vite website")
-    if no_cache:
-        logger.debug("Checking for existing website to remove")
-        delete_these([vite_project_name], cwd)
-    logger.debug(f"Creating Vite project with name {vite_project_name}")
-    generate_website(config, vite_project_name, src_dir / "templates" / "website_files",
-                     cwd, binary_js_path)
-
-# yarn run build
-website_dist_path = website_path / "dist"
-if skip_website_build:
-    logger.info("Skipping website build")
-else:
-    logger.info("Building website")
-    run_shell_command("yarn build", cwd=website_path)
-
-logger.info(f"Static website files are at {website_dist_path}")
-if output_format == OutputType.STATIC:
-    logger.info(f"Build finished")
-    exit(0)
-elif output_format == OutputType.ELECTRON:
-    electron_project_name = f"{config.name.lower().replace(" ", "-")}-electron"
-    electron_path = cwd / electron_project_name
-    if skip_electron_gen:
-        logger.info("Skipping Electron app generation")
+    binary_js_path = source_code_path / "built" / "binary.js"
+    website_path = cwd / get_website_project_name(config)
+    if config.source_type == SourceType.PATH:
+        # Edits happen in the original directory, which is synced on every change
+        watch_dir = Path(config.source)
+        ignore = get_source_ignore(config)
     else:
-        logger.info(f"Generating Electron app")
-        logger.debug(
-            f"Creating Electron app in {cwd}, using {website_dist_path} for source")
-        logger.debug(f"Creating Electron project with name {electron_project_name}")
-        # npx create-electron-app@latest, copy files, and substitute values
-        if no_cache:
-            logger.debug("Checking for existing website to remove")
-            delete_these([electron_project_name], cwd)
-        generate_electron(config, electron_project_name,
-                          src_dir / "templates" / "electron_files", website_dist_path,
-                          cwd)
-
-    # yarn run make
-    electron_dist_path = electron_path / "out"
-    if skip_electron_build:
-        logger.info("Skipping Electron app build")
-    else:
-        logger.info("Building Electron app")
-        run_shell_command("yarn run make", cwd=electron_path)
-
-    logger.info(f"Electron app executables are at {electron_dist_path}")
-    logger.info(f"Build finished")
-    exit(0)
-elif output_format == OutputType.TAURI:
-    tauri_project_name = f"{config.name.lower().replace(' ', '-')}-tauri"
-    tauri_path = cwd / tauri_project_name
-    if skip_tauri_gen:
-        logger.info("Skipping Tauri app generation")
-    else:
-        logger.info(f"Generating Tauri app")
-        logger.debug(
-            f"Creating Tauri app in {cwd}, using {website_dist_path} for source")
-        logger.debug(f"Creating Tauri project with name {tauri_project_name}")
-        # yarn create tauri-app
-        if no_cache:
-            logger.debug("Checking for existing website to remove")
-            delete_these([tauri_project_name], cwd)
-        generate_tauri(config, tauri_project_name,
-                       src_dir / "templates" / "tauri_files", website_dist_path, cwd)
-
-    # yarn run tauri build
-    tauri_dist_path = tauri_path / "src-tauri" / "target" / "release"
-    if skip_tauri_build:
-        logger.info("Skipping Tauri app build")
-    else:
-        logger.info("Building Tauri app")
-        run_shell_command("yarn run tauri build", cwd=tauri_path)
+        # Edits happen in the checked out source code directly
+        watch_dir = source_code_path
+        ignore = list(DEFAULT_SOURCE_IGNORE)
+    binary_cache = BinaryCache(get_cache_dir(args.cache_dir))
+    publish_binary(binary_js_path, website_path)
+
+    with DevServer(website_path, args.port) as server:
+        watcher = TreeWatcher(watch_dir, ignore)
+        logger.info(f"Play the game at {server.url}")
+        logger.info(f"Watching {watch_dir} for changes, press Ctrl+C to stop")
+        try:
+            while True:
+                changed = watcher.wait()
+                logger.info(f"{len(changed)} file(s) changed, rebuilding")
+                start = time.perf_counter()
+                try:
+                    if config.source_type == SourceType.PATH:
+                        sync_path_source(config, source_code_path)
+                    bin_build_fingerprint = get_bin_build_fingerprint(
+                        source_code_path, cwd)
+                    if not binary_cache.restore(bin_build_fingerprint, binary_js_path):
+                        run_shell_command("npx mkc build -j", cwd=source_code_path)
+                        binary_cache.store(bin_build_fingerprint, binary_js_path)
+                    publish_binary(binary_js_path, website_path)
+                except subprocess.CalledProcessError as e:
+                    logger.error(f"Build failed, waiting for changes: {e}")
+                    continue
+                logger.info(f"Reloaded the game in "
+                            f"{time.perf_counter() - start:.1f} s")
+        except KeyboardInterrupt:
+            logger.info("Stopping")
+
+
+@dataclass
+class BatchResult:
+    """
+    The result of building one game in a batch.
+    """
+    config_path: Path
+    ok: bool
+    duration: float
+    outputs: Optional[dict[OutputType, Path]] = None
+    error: Optional[str] = None
+    trace_events: Optional[list[dict]] = None
+
+
+def build_game_in_batch(config_path: Path, args: Namespace) -> BatchResult:
+    """
+    Builds one game in a batch, catching any errors so other games keep building.
+    This runs in a worker process.
+
+    :param config_path: The path to the YAML configuration file of the game.
+    :param args: The parsed command line arguments.
+    :return: A BatchResult.
+    """
+    if args.debug:
+        set_all_stdout_logger_levels(logging.DEBUG)
+    # Worker processes are reused, but build() starts each game with a clean trace
+    tracer = get_tracer()
+    start = time.perf_counter()
+    try:
+        outputs = build(config_path, get_build_options(args)).outputs
+    except Exception as e:
+        logger.exception(f"Failed to build {config_path}")
+        return BatchResult(config_path, False, time.perf_counter() - start,
+                           error=f"{type(e).__name__}: {e}",
+                           trace_events=tracer.to_chrome_trace())
+    return BatchResult(config_path, True, time.perf_counter() - start, outputs,
+                       trace_events=tracer.to_chrome_trace())
+
+
+def expand_config_paths(patterns: list[str]) -> list[Path]:
+    """
+    Expands glob patterns into configuration file paths, keeping the order and
+    dropping duplicates.
+
+    :param patterns: Paths or glob patterns.
+    :return: A list of paths.
+    """
+    paths = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern, recursive=True))
+            if not matches:
+                logger.warning(f"No configuration files match {pattern}")
+            paths.extend(Path(match) for match in matches)
+        else:
+            paths.append(Path(pattern))
+    return list(dict.fromkeys(paths))
+
+
+def log_batch_summary(results: list[BatchResult]):
+    """
+    Logs a table with the status and duration of every game in a batch.
+
+    :param results: The results of the batch.
+    """
+    name_width = max(len(str(result.config_path)) for result in results)
+    lines = [f"{'Configuration':<{name_width}}  Status  Time (s)  Output / error"]
+    for result in results:
+        status = "OK" if result.ok else "FAILED"
+        detail = ", ".join(str(path) for path in result.outputs.values()) \
+            if result.ok else result.error
+        lines.append(f"{str(result.config_path):<{name_width}}  {status:<6}  "
+                     f"{result.duration:>8.1f}  {detail}")
+    ok_count = sum(result.ok for result in results)
+    lines.append(f"{ok_count}/{len(results)} games built successfully")
+    logger.info("Batch summary:\n" + "\n".join(lines))
+
+
+def main():
+    args = parser.parse_args()
+    debug = bool(args.debug)
+    if debug:
+        set_all_stdout_logger_levels(logging.DEBUG)
+    logger.debug(f"Received arguments: {args}")
+
+    config_paths = expand_config_paths(args.config_paths)
+    if len(config_paths) == 0:
+        parser.error("No configuration files to build")
+    if args.watch:
+        if len(config_paths) > 1:
+            parser.error("Only one game can be watched at a time")
+        watch_game(config_paths[0], args)
+        return
+    if len(config_paths) == 1:
+        tracer = get_tracer()
+        try:
+            build(config_paths[0], get_build_options(args))
+        finally:
+            logger.info("Build times:\n" + tracer.summary("stage"))
+            if args.trace is not None:
+                write_chrome_trace(tracer.to_chrome_trace(), args.trace)
+                logger.info(f"Wrote trace to {args.trace}")
+        return
+
+    jobs = max(1, min(args.jobs, len(config_paths)))
+    logger.info(f"Building {len(config_paths)} games with {jobs} jobs")
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(build_game_in_batch, config_paths,
+                                    [args] * len(config_paths)))
+    log_batch_summary(results)
+    if args.trace is not None:
+        events = [event for result in results for event in result.trace_events or []]
+        write_chrome_trace(events, args.trace)
+        logger.info(f"Wrote trace to {args.trace}")
+    if not all(result.ok for result in results):
+        sys.exit(1)
+
 
-    logger.info(f"Tauri app executables are at {tauri_dist_path}")
-    logger.info(f"Build finished")
-    exit(0)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import json
+import logging
+import posixpath
+import time
+from argparse import ArgumentParser
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urljoin, urlparse
+
+from convert.mkcd_to_website.config import DEFAULT_SIMULATOR_URL
+from convert.mkcd_to_website.simulator import find_simulator_assets, get_simulator_url
+from utils.asset_cache import AssetCache
+from utils.cache import get_cache_dir
+from utils.logger import create_logger, set_all_stdout_logger_levels
+
+logger = create_logger(name=__name__, level=logging.INFO)
+
+parser = ArgumentParser(description="Snapshot a MakeCode Arcade simulator release "
+                                    "into a directory and serve it over HTTP, so "
+                                    "games can be built without the internet.")
+parser.add_argument("--debug", action="store_true",
+                    help="Enable debug logging.")
+subparsers = parser.add_subparsers(dest="command", required=True)
+snapshot_parser = subparsers.add_parser(
+    "snapshot", help="Download a simulator release into a directory.")
+snapshot_parser.add_argument("out_dir", type=Path,
+                             help="Directory to save the snapshot to.")
+snapshot_parser.add_argument("--url", type=str, default=DEFAULT_SIMULATOR_URL,
+                             help=f"Base URL of the simulator host. Defaults to "
+                                  f"{DEFAULT_SIMULATOR_URL}.")
+snapshot_parser.add_argument("--version", type=str,
+                             help="Simulator version to snapshot, ex. v1.12.30. "
+                                  "Defaults to the version currently live.")
+snapshot_parser.add_argument("--cache-dir", type=Path,
+                             help="Directory of the persistent cache to download "
+                                  "through. Defaults to the user cache directory.")
+serve_parser = subparsers.add_parser(
+    "serve", help="Serve a snapshot over HTTP.")
+serve_parser.add_argument("dir", type=Path,
+                          help="Directory of the snapshot to serve.")
+serve_parser.add_argument("--bind", type=str, default="0.0.0.0",
+                          help="Address to listen on. Defaults to 0.0.0.0.")
+serve_parser.add_argument("--port", type=int, default=8080,
+                          help="Port to listen on. Defaults to 8080.")
+
+
+def _mirror_path(url: str, base_url: str) -> str:
+    """
+    :return: Where a URL is stored in the snapshot, relative to the snapshot root.
+     Files from the simulator host keep their path, files from other hosts are
+     stored under _external/<host>.
+    """
+    parsed = urlparse(url)
+    base = urlparse(base_url)
+    if parsed.netloc == base.netloc and parsed.path.startswith(base.path):
+        return parsed.path[len(base.path):]
+    # Ports are separated with _ since : is not allowed in Windows paths
+    return f"_external/{parsed.netloc.replace(':', '_')}{parsed.path}"
+
+
+def snapshot(base_url: str, version: Optional[str], out_dir: Path,
+             asset_cache: AssetCache) -> Path:
+    """
+    Downloads the simulator page and the CSS and JS files it loads into a directory,
+    laid out so that serving the directory over HTTP can replace the simulator host.
+    Links in the page are rewritten to relative paths, so the snapshot also works
+    when served from a subdirectory.
+
+    :param base_url: The base URL of the simulator host.
+    :param version: The simulator version, or None for the version currently live.
+    :param out_dir: The directory to save the snapshot to.
+    :param asset_cache: The cache to download through.
+    :return: The path to the saved simulator page.
+    """
+    if not base_url.endswith("/"):
+        base_url += "/"
+    sim_url = get_simulator_url(base_url, version)
+    logger.info(f"Snapshotting {sim_url} to {out_dir}")
+    sim_asset = asset_cache.get(sim_url, refresh=True)
+    sim_html = sim_asset.read_text()
+    page_path = _mirror_path(sim_url, base_url)
+    page_dir = posixpath.dirname(page_path)
+    links = list(dict.fromkeys(find_simulator_assets(sim_html)))
+    asset_urls = [urljoin(sim_url, link) for link in links]
+    assets = asset_cache.get_many(asset_urls, refresh=version is None)
+    files = {page_path: sim_asset.sha256}
+    for link, asset in zip(links, assets):
+        file_path = _mirror_path(asset.url, base_url)
+        AssetCache.link_to(asset, out_dir / file_path)
+        files[file_path] = asset.sha256
+        relative = posixpath.relpath(file_path, page_dir or ".")
+        # Only the attribute values change, the rest of the page stays as is
+        for quote in ("\"", "'"):
+            sim_html = sim_html.replace(f"{quote}{link}{quote}",
+                                        f"{quote}{relative}{quote}")
+    (out_dir / page_path).parent.mkdir(parents=True, exist_ok=True)
+    (out_dir / page_path).write_text(sim_html, encoding="utf-8")
+    (out_dir / "snapshot.json").write_text(json.dumps({
+        "url": sim_url,
+        "version": version,
+        "time": time.time(),
+        "files": files
+    }, indent=2))
+    logger.info(f"Saved {len(files)} files to {out_dir}")
+    return out_dir / page_path
+
+
+def serve(dir: Path, bind: str, port: int):
+    """
+    Serves a snapshot over HTTP until interrupted.
+
+    :param dir: The directory of the snapshot.
+    :param bind: The address to listen on.
+    :param port: The port to listen on.
+    """
+
+    class Handler(SimpleHTTPRequestHandler):
+        # The simulator page has no extension
+        extensions_map = {**SimpleHTTPRequestHandler.extensions_map,
+                          "": "text/html"}
+
+        def log_message(self, format, *args):
+            logger.debug(f"{self.address_string()} - {format % args}")
+
+    server = ThreadingHTTPServer((bind, port), partial(Handler, directory=str(dir)))
+    logger.info(f"Serving {dir} at http://{bind}:{port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Stopping")
+    finally:
+        server.server_close()
+
+
+def main():
+    args = parser.parse_args()
+    if args.debug:
+        set_all_stdout_logger_levels(logging.DEBUG)
+    logger.debug(f"Received arguments: {args}")
+    if args.command == "snapshot":
+        asset_cache = AssetCache(get_cache_dir(args.cache_dir))
+        snapshot(args.url, args.version, args.out_dir, asset_cache)
+    elif args.command == "serve":
+        if not args.dir.is_dir():
+            parser.error(f"{args.dir} is not a directory")
+        serve(args.dir, args.bind, args.port)
+
+
+if __name__ == "__main__":
+    main()
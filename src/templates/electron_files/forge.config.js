@@ -1,5 +1,31 @@
 const {FusesPlugin} = require('@electron-forge/plugin-fuses');
 const {FuseV1Options, FuseVersion} = require('@electron/fuses');
+const {buildProfile} = require('./package.json');
+
+// The fast profile only zips the app for this platform instead of making installers
+const makers = buildProfile === 'fast' ? [
+    {
+        name: '@electron-forge/maker-zip',
+        platforms: [process.platform],
+    },
+] : [
+    {
+        name: '@electron-forge/maker-squirrel',
+        config: {},
+    },
+    {
+        name: '@electron-forge/maker-zip',
+        platforms: ['darwin'],
+    },
+    {
+        name: '@electron-forge/maker-deb',
+        config: {},
+    },
+    {
+        name: '@electron-forge/maker-rpm',
+        config: {},
+    },
+];
 
 module.exports = {
     packagerConfig: {
@@ -8,24 +34,7 @@ module.exports = {
         icon: "./src/assets/icons/icon"
     },
     rebuildConfig: {},
-    makers: [
-        {
-            name: '@electron-forge/maker-squirrel',
-            config: {},
-        },
-        {
-            name: '@electron-forge/maker-zip',
-            platforms: ['darwin'],
-        },
-        {
-            name: '@electron-forge/maker-deb',
-            config: {},
-        },
-        {
-            name: '@electron-forge/maker-rpm',
-            config: {},
-        },
-    ],
+    makers,
     plugins: [
         {
             name: '@electron-forge/plugin-auto-unpack-natives',
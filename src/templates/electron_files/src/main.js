@@ -1,7 +1,9 @@
-const {app, BrowserWindow, protocol, net} = require("electron")
+const {app, BrowserWindow} = require("electron")
 const path = require("node:path")
 const fs = require("node:fs")
 const url = require("node:url")
+const {registerScheme, serveDirectory} = require("./protocol")
+const {registerSimStateHandlers} = require("./simState")
 
 // Handle creating/removing shortcuts on Windows when installing/uninstalling.
 if (require('electron-squirrel-startup')) {
@@ -9,6 +11,44 @@ if (require('electron-squirrel-startup')) {
 }
 
 const windowScale = 4;
+// Only log every request when running from source, logging slows down release builds
+const verbose = !app.isPackaged;
+
+registerScheme();
+
+// An app packaged from the prebuilt shell has the game in the resources directory,
+// next to game.json with its name, instead of inside app.asar
+const shellGame = (() => {
+    try {
+        return JSON.parse(fs.readFileSync(path.join(process.resourcesPath, "game.json"), "utf8"));
+    } catch {
+        return null;
+    }
+})();
+if (shellGame !== null) {
+    // Every game packaged from the shell must keep its saves separate
+    app.setName(shellGame.productName);
+    app.setPath("userData", path.join(app.getPath("appData"), shellGame.name));
+}
+
+const getEntryURL = () => {
+    // With electron-forge start, the entry is on the webpack dev server
+    if (!MAIN_WINDOW_WEBPACK_ENTRY.startsWith("file:")) {
+        return MAIN_WINDOW_WEBPACK_ENTRY;
+    }
+    const root = shellGame !== null ? path.join(process.resourcesPath, "game") :
+        path.dirname(url.fileURLToPath(MAIN_WINDOW_WEBPACK_ENTRY));
+    // binary.js is an extra resource, so it can be replaced without repacking the app
+    const overrides = {};
+    const binaryPath = path.join(process.resourcesPath, "binary.js");
+    if (fs.existsSync(binaryPath)) {
+        overrides["binary.js"] = binaryPath;
+    }
+    if (verbose) {
+        console.log(`Serving ${root} with overrides ${JSON.stringify(overrides)}`);
+    }
+    return serveDirectory(root, overrides, verbose);
+};
 
 const createWindow = () => {
     // Create the browser window.
@@ -19,11 +59,12 @@ const createWindow = () => {
         webPreferences: {
             preload: MAIN_WINDOW_PRELOAD_WEBPACK_ENTRY,
         },
-        icon: "./src/assets/icons/icon.png",
+        icon: shellGame !== null ? path.join(process.resourcesPath, "icon.png") :
+            "./src/assets/icons/icon.png",
     });
 
     // and load the index.html of the app.
-    mainWindow.loadURL(MAIN_WINDOW_WEBPACK_ENTRY);
+    mainWindow.loadURL(entryURL);
 
     // Open the DevTools.
     // mainWindow.webContents.openDevTools();
@@ -32,7 +73,10 @@ const createWindow = () => {
 // This method will be called when Electron has finished
 // initialization and is ready to create browser windows.
 // Some APIs can only be used after this event occurs.
+let entryURL;
 app.whenReady().then(() => {
+    entryURL = getEntryURL();
+    registerSimStateHandlers();
     createWindow();
 
     // On OS X it's common to re-create a window in the app when the
@@ -42,22 +86,6 @@ app.whenReady().then(() => {
             createWindow();
         }
     });
-
-    console.log("Will intercept file requests for binary.js");
-    console.log(`process.resourcesPath: ${process.resourcesPath}`);
-    protocol.handle('file', (rq) => {
-        const u = new URL(rq.url);
-        const filePath = u.pathname;
-        if (filePath.endsWith("binary.js")) {
-            const newPath = path.join(process.resourcesPath, "binary.js");
-            const newURL = url.pathToFileURL(newPath);
-            console.log(`Requested for ${filePath}, serving ${newURL} instead`);
-            return net.fetch(newURL.toString(), {bypassCustomProtocolHandlers: true});
-        } else {
-            console.log(`Requested for ${filePath}`);
-            return net.fetch(rq, {bypassCustomProtocolHandlers: true});
-        }
-    });
 });
 
 // Quit when all windows are closed, except on macOS. There, it's common
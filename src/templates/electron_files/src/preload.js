@@ -1,2 +1,10 @@
 // See the Electron documentation for details on how to use preload scripts:
 // https://www.electronjs.org/docs/latest/tutorial/process-model#preload-scripts
+const {contextBridge, ipcRenderer} = require("electron")
+
+// Lets the game save its state to files instead of localStorage, see simState.js
+contextBridge.exposeInMainWorld("simStateStore", {
+    load: () => ipcRenderer.invoke("sim-state:load"),
+    write: (changes) => ipcRenderer.invoke("sim-state:write", changes),
+    writeSync: (changes) => ipcRenderer.sendSync("sim-state:write-sync", changes),
+});
@@ -0,0 +1,153 @@
+const {protocol} = require("electron")
+const path = require("node:path")
+const fs = require("node:fs")
+
+// The game is served from app://game/ instead of file://, so requests are handled
+// here directly without going through the file protocol for every request.
+const SCHEME = "app";
+const HOST = "game";
+
+const MIME_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".js": "text/javascript; charset=utf-8",
+    ".mjs": "text/javascript; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".json": "application/json; charset=utf-8",
+    ".webmanifest": "application/manifest+json; charset=utf-8",
+    ".txt": "text/plain; charset=utf-8",
+    ".map": "application/json; charset=utf-8",
+    ".wasm": "application/wasm",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+    ".svg": "image/svg+xml",
+    ".ico": "image/x-icon",
+    ".woff": "font/woff",
+    ".woff2": "font/woff2",
+    ".ttf": "font/ttf",
+    ".otf": "font/otf",
+    ".mp3": "audio/mpeg",
+    ".wav": "audio/wav",
+    ".ogg": "audio/ogg",
+};
+
+// Files kept in memory after the first read - the game and the simulator, which are
+// the largest files and are loaded again every time the simulator restarts
+const MEMORY_CACHED = [
+    /^binary\.js$/,
+    /^---simulator\.html$/,
+    /^sim(-bundle)?-[^/]+\.(js|css)$/,
+];
+
+// Files with a content hash in their name never change, ex. assets/index-D8b4x1.js
+// from Vite, sim-bundle-0.1a2b3c4d.js, and sim-assets/1a2b3c4d-font.woff2
+const IMMUTABLE = [
+    /^assets\/.+-[\w-]{8,}\.\w+$/,
+    /^sim-bundle-\d+\.[0-9a-f]{8}\.\w+$/,
+    /^sim-assets\/[0-9a-f]{8}-/,
+];
+
+// Must be called before the app is ready
+const registerScheme = () => {
+    protocol.registerSchemesAsPrivileged([{
+        scheme: SCHEME,
+        privileges: {
+            standard: true,
+            secure: true,
+            supportFetchAPI: true,
+            corsEnabled: true,
+            stream: true,
+        },
+    }]);
+};
+
+/**
+ * Serves a directory over app://game/.
+ *
+ * @param root The directory to serve.
+ * @param overrides Paths served from somewhere else, ex. binary.js from the resources
+ *  directory, keyed by path relative to root.
+ * @param verbose Whether to log every request.
+ * @return The URL of index.html.
+ */
+const serveDirectory = (root, overrides, verbose) => {
+    const memory = new Map();
+
+    const resolve = (relativePath) => {
+        if (Object.hasOwn(overrides, relativePath)) {
+            return overrides[relativePath];
+        }
+        const filePath = path.join(root, relativePath);
+        // Do not serve anything outside the directory
+        return filePath.startsWith(root + path.sep) ? filePath : null;
+    };
+
+    const read = async (relativePath, filePath) => {
+        const cached = memory.get(relativePath);
+        if (cached !== undefined) {
+            return cached;
+        }
+        const stats = await fs.promises.stat(filePath);
+        const entry = {
+            body: await fs.promises.readFile(filePath),
+            etag: `"${stats.size.toString(16)}-${Math.floor(stats.mtimeMs).toString(16)}"`,
+        };
+        if (MEMORY_CACHED.some((pattern) => pattern.test(relativePath))) {
+            memory.set(relativePath, entry);
+        }
+        return entry;
+    };
+
+    const headersFor = (relativePath, etag) => {
+        const immutable = IMMUTABLE.some((pattern) => pattern.test(relativePath));
+        return {
+            "Content-Type": MIME_TYPES[path.extname(relativePath).toLowerCase()] ??
+                "application/octet-stream",
+            "Cache-Control": immutable ? "public, max-age=31536000, immutable" : "no-cache",
+            "ETag": etag,
+            "X-Content-Type-Options": "nosniff",
+        };
+    };
+
+    protocol.handle(SCHEME, async (request) => {
+        const requestURL = new URL(request.url);
+        let relativePath = decodeURIComponent(requestURL.pathname).replace(/^\/+/, "");
+        if (relativePath === "" || relativePath.endsWith("/")) {
+            relativePath += "index.html";
+        }
+        const filePath = requestURL.host === HOST ? resolve(relativePath) : null;
+        if (filePath === null) {
+            return new Response("Not found", {status: 404});
+        }
+        try {
+            const {body, etag} = await read(relativePath, filePath);
+            const headers = headersFor(relativePath, etag);
+            if (request.headers.get("If-None-Match") === etag) {
+                if (verbose) {
+                    console.log(`304 ${relativePath}`);
+                }
+                return new Response(null, {status: 304, headers});
+            }
+            if (verbose) {
+                console.log(`200 ${relativePath} from ${filePath}`);
+            }
+            return new Response(body, {status: 200, headers});
+        } catch (error) {
+            if (verbose) {
+                console.log(`404 ${relativePath}: ${error.message}`);
+            }
+            return new Response("Not found", {status: 404});
+        }
+    });
+
+    // Read the game and the simulator while index.html loads
+    Promise.all(Object.keys(overrides).concat(
+        fs.readdirSync(root).filter((name) => MEMORY_CACHED.some((pattern) => pattern.test(name)))
+    ).map((relativePath) => read(relativePath, resolve(relativePath)).catch(() => undefined)));
+
+    return `${SCHEME}://${HOST}/index.html`;
+};
+
+module.exports = {registerScheme, serveDirectory};
@@ -0,0 +1,74 @@
+const {app, ipcMain} = require("electron")
+const path = require("node:path")
+const fs = require("node:fs")
+
+// Saved simulator state, one file per key so only changed keys are written. Files
+// hold {"key": ..., "value": ...} and are named after the key, the same way the
+// Tauri app does it.
+const getStateDir = () => path.join(app.getPath("userData"), "sim-state");
+
+// FNV-1a, for keys too long to be a file name
+const hashKey = (key) => {
+    let hash = 0xcbf29ce484222325n;
+    for (const byte of Buffer.from(key, "utf8")) {
+        hash ^= BigInt(byte);
+        hash = (hash * 0x100000001b3n) & 0xffffffffffffffffn;
+    }
+    return hash.toString(16).padStart(16, "0");
+};
+
+const keyToFileName = (key) => {
+    const hex = Buffer.from(key, "utf8").toString("hex");
+    return `${hex.length <= 128 ? hex : `long-${hashKey(key)}`}.json`;
+};
+
+const loadState = () => {
+    const state = {};
+    let names;
+    try {
+        names = fs.readdirSync(getStateDir());
+    } catch {
+        return state;
+    }
+    for (const name of names.filter((name) => name.endsWith(".json"))) {
+        try {
+            const {key, value} = JSON.parse(fs.readFileSync(path.join(getStateDir(), name), "utf8"));
+            state[key] = value;
+        } catch (error) {
+            console.warn(`Failed to read saved state ${name}: ${error.message}`);
+        }
+    }
+    return state;
+};
+
+const writeState = (changes) => {
+    const stateDir = getStateDir();
+    fs.mkdirSync(stateDir, {recursive: true});
+    for (const [key, value] of Object.entries(changes)) {
+        const filePath = path.join(stateDir, keyToFileName(key));
+        if (value === null) {
+            fs.rmSync(filePath, {force: true});
+        } else {
+            // Write then rename, so a crash never leaves a half written file
+            const tempPath = `${filePath}.tmp`;
+            fs.writeFileSync(tempPath, JSON.stringify({key, value}));
+            fs.renameSync(tempPath, filePath);
+        }
+    }
+};
+
+// Must be called before the window is created
+const registerSimStateHandlers = () => {
+    ipcMain.handle("sim-state:load", () => loadState());
+    ipcMain.handle("sim-state:write", (event, changes) => writeState(changes));
+    // Used when the window is closing, when there is no time to wait for a reply
+    ipcMain.on("sim-state:write-sync", (event, changes) => {
+        try {
+            writeState(changes);
+        } finally {
+            event.returnValue = null;
+        }
+    });
+};
+
+module.exports = {registerSimStateHandlers};
@@ -1,14 +1,103 @@
-// Learn more about Tauri commands at https://tauri.app/develop/calling-rust/
+use std::collections::HashMap;
+use std::fs;
+use std::path::PathBuf;
+
+use serde::{Deserialize, Serialize};
+use tauri::Manager;
+
+// Saved simulator state, one file per key so only changed keys are written. Files
+// hold {"key": ..., "value": ...} and are named after the key, the same way the
+// Electron app does it.
+#[derive(Serialize, Deserialize)]
+struct SavedKey {
+    key: String,
+    value: String,
+}
+
+fn state_dir(app: &tauri::AppHandle) -> Result<PathBuf, String> {
+    app.path()
+        .app_data_dir()
+        .map(|dir| dir.join("sim-state"))
+        .map_err(|err| err.to_string())
+}
+
+// FNV-1a, for keys too long to be a file name
+fn hash_key(key: &str) -> String {
+    let mut hash: u64 = 0xcbf29ce484222325;
+    for byte in key.bytes() {
+        hash ^= byte as u64;
+        hash = hash.wrapping_mul(0x100000001b3);
+    }
+    format!("{:016x}", hash)
+}
+
+fn key_to_file_name(key: &str) -> String {
+    let hex: String = key.bytes().map(|byte| format!("{:02x}", byte)).collect();
+    if hex.len() <= 128 {
+        format!("{}.json", hex)
+    } else {
+        format!("long-{}.json", hash_key(key))
+    }
+}
+
+#[tauri::command]
+fn load_sim_state(app: tauri::AppHandle) -> Result<HashMap<String, String>, String> {
+    let mut state = HashMap::new();
+    let entries = match fs::read_dir(state_dir(&app)?) {
+        Ok(entries) => entries,
+        Err(_) => return Ok(state),
+    };
+    for entry in entries.flatten() {
+        let path = entry.path();
+        if path.extension().map_or(true, |extension| extension != "json") {
+            continue;
+        }
+        match fs::read_to_string(&path)
+            .map_err(|err| err.to_string())
+            .and_then(|text| serde_json::from_str::<SavedKey>(&text).map_err(|err| err.to_string()))
+        {
+            Ok(saved) => {
+                state.insert(saved.key, saved.value);
+            }
+            Err(err) => eprintln!("Failed to read saved state {}: {}", path.display(), err),
+        }
+    }
+    Ok(state)
+}
+
 #[tauri::command]
-fn greet(name: &str) -> String {
-    format!("Hello, {}! You've been greeted from Rust!", name)
+fn write_sim_state(
+    app: tauri::AppHandle,
+    changes: HashMap<String, Option<String>>,
+) -> Result<(), String> {
+    let dir = state_dir(&app)?;
+    fs::create_dir_all(&dir).map_err(|err| err.to_string())?;
+    for (key, value) in changes {
+        let path = dir.join(key_to_file_name(&key));
+        match value {
+            None => {
+                if path.exists() {
+                    fs::remove_file(&path).map_err(|err| err.to_string())?;
+                }
+            }
+            Some(value) => {
+                // Write then rename, so a crash never leaves a half written file
+                let temp_path = path.with_extension("json.tmp");
+                let text = serde_json::to_string(&SavedKey { key, value })
+                    .map_err(|err| err.to_string())?;
+                fs::write(&temp_path, text).map_err(|err| err.to_string())?;
+                fs::rename(&temp_path, &path).map_err(|err| err.to_string())?;
+            }
+        }
+    }
+    Ok(())
 }
 
 #[cfg_attr(mobile, tauri::mobile_entry_point)]
 pub fn run() {
     tauri::Builder::default()
         .plugin(tauri_plugin_opener::init())
-        .invoke_handler(tauri::generate_handler![greet])
+        .invoke_handler(tauri::generate_handler![load_sim_state, write_sim_state])
         .run(tauri::generate_context!())
         .expect("error while running tauri application");
 }
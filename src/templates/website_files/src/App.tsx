@@ -8,12 +8,15 @@ import {
 import {toast} from "react-toastify";
 import {GameConfiguration} from "./gameConfiguration.ts";
 import {positionFixedElement} from "./utils/position.ts";
+import {createSimStateBackend, SimStateStore} from "./utils/simState.ts";
 
 function App(): React.ReactNode {
   const simulatorRef = React.useRef<HTMLIFrameElement>(null);
   const statsRef = React.useRef<HTMLDivElement>(null);
   const [code, setCode] = React.useState("");
-  const [simState, setSimState] = React.useState<unknown>({});
+  const [simState] = React.useState(
+    () => new SimStateStore(createSimStateBackend()),
+  );
 
   const loadingGameToastCallbacksRef = React.useRef<LoadingToastCallbacks>(
     createEmptyLoadingToastCallbacks(),
@@ -27,19 +30,11 @@ function App(): React.ReactNode {
   const [statsInnerText, setStatsInnerText] = React.useState("");
 
   React.useEffect(() => {
-    try {
-      setSimState(JSON.parse(localStorage.getItem("simState") ?? "{}"));
-    } catch (err) {
-      console.warn(
-        // eslint-disable-next-line @typescript-eslint/restrict-template-expressions
-        `Failed to load sim state, maybe first time run or simState is empty?\n${err}`,
-      );
-      setSimState({});
-    }
-  }, []);
-
-  React.useEffect(() => {
-    localStorage.setItem("simState", JSON.stringify(simState));
+    simState.start();
+    return () => {
+      simState.stop();
+      void simState.flush();
+    };
   }, [simState]);
 
   React.useEffect(() => {
@@ -81,6 +76,34 @@ function App(): React.ReactNode {
       });
   }, []);
 
+  React.useEffect(() => {
+    // In the dev server of watch mode, reload the game when it is rebuilt
+    if (!import.meta.hot) {
+      return;
+    }
+
+    function onBinaryUpdate() {
+      fetch(`binary.js?t=${Date.now().toString()}`)
+        .then((res) => res.text())
+        .then((text) => {
+          console.log(
+            `Reloading game with ${Math.round(text.length / 1024)} kb of binary.js`,
+          );
+          setCode(text);
+          // The simulator runs the new code once it is ready again
+          simulatorRef.current?.contentWindow?.location.reload();
+        })
+        .catch((err: unknown) => {
+          console.error(err);
+        });
+    }
+
+    import.meta.hot.on("binary-update", onBinaryUpdate);
+    return () => {
+      import.meta.hot?.off("binary-update", onBinaryUpdate);
+    };
+  }, []);
+
   React.useEffect(() => {
     function startSim() {
       console.log("Starting simulator");
@@ -91,7 +114,7 @@ function App(): React.ReactNode {
         partDefinitions: [],
         // cdnUrl: "https://cdn.makecode.com",
         // version: "",
-        storedState: simState,
+        storedState: simState.snapshot,
         frameCounter: 1,
         options: {
           theme: "green",
@@ -115,8 +138,11 @@ function App(): React.ReactNode {
       // console.log(data);
       if (data.type == "ready") {
         console.log("Simulator is ready");
-        startSim();
-        loadingGameToastCallbacksRef.current.success();
+        // Saved state has to be loaded before the game starts
+        void simState.ready.then(() => {
+          startSim();
+          loadingGameToastCallbacksRef.current.success();
+        });
       } else if (data.type == "simulator") {
         switch (data.command) {
           case "restart": {
@@ -138,19 +164,8 @@ function App(): React.ReactNode {
             break;
           }
           case "setstate": {
-            if (data.stateValue === null) {
-              setSimState({
-                // @ts-ignore
-                ...simState,
-                [data.stateKey]: undefined,
-              });
-            } else {
-              setSimState({
-                // @ts-ignore
-                ...simState,
-                [data.stateKey]: data.stateValue,
-              });
-            }
+            // Saved in batches, null deletes the key
+            simState.set(data.stateKey, data.stateValue);
             break;
           }
           default:
@@ -1 +1,16 @@
 declare module '*.css';
+
+interface Window {
+  // Injected by Tauri since withGlobalTauri is enabled
+  __TAURI__?: {
+    core: {
+      invoke: <T>(cmd: string, args?: Record<string, unknown>) => Promise<T>;
+    };
+  };
+  // Exposed by the preload script of the Electron app
+  simStateStore?: {
+    load: () => Promise<Record<string, string>>;
+    write: (changes: Record<string, string | null>) => Promise<void>;
+    writeSync: (changes: Record<string, string | null>) => void;
+  };
+}
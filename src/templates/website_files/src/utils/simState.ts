@@ -0,0 +1,320 @@
+// Persists the state the simulator saves with the settings extension. Changes are
+// batched and only changed keys are written, on an interval and when the page is
+// hidden or closed, so games that save every frame do not stall the main thread.
+
+// Values are stored serialized, null deletes a key
+export type SimStateChanges = Map<string, string | null>;
+
+export interface SimStateBackend {
+  name: string;
+  load: () => Promise<Record<string, string>>;
+  write: (changes: SimStateChanges) => Promise<void>;
+  // Writes as much as possible before the page goes away, if the backend can
+  writeBeforeUnload?: (changes: SimStateChanges) => void;
+}
+
+// Where the state used to be saved as a single JSON object
+const LEGACY_LOCAL_STORAGE_KEY = "simState";
+const LOCAL_STORAGE_PREFIX = "simState/";
+const DB_NAME = "simState";
+const DB_STORE = "keys";
+
+function requestToPromise<T>(request: IDBRequest<T>): Promise<T> {
+  return new Promise((resolve, reject) => {
+    request.onsuccess = () => {
+      resolve(request.result);
+    };
+    request.onerror = () => {
+      reject(request.error ?? new Error("IndexedDB request failed"));
+    };
+  });
+}
+
+export function createIndexedDBBackend(): SimStateBackend {
+  let dbPromise: Promise<IDBDatabase> | undefined;
+
+  function openDB(): Promise<IDBDatabase> {
+    if (dbPromise === undefined) {
+      const request = indexedDB.open(DB_NAME, 1);
+      request.onupgradeneeded = () => {
+        request.result.createObjectStore(DB_STORE);
+      };
+      dbPromise = requestToPromise(request);
+    }
+    return dbPromise;
+  }
+
+  function startWrite(db: IDBDatabase, changes: SimStateChanges): IDBTransaction {
+    const transaction = db.transaction(DB_STORE, "readwrite");
+    const store = transaction.objectStore(DB_STORE);
+    for (const [key, value] of changes) {
+      if (value === null) {
+        store.delete(key);
+      } else {
+        store.put(value, key);
+      }
+    }
+    transaction.commit();
+    return transaction;
+  }
+
+  let db: IDBDatabase | undefined;
+
+  return {
+    name: "IndexedDB",
+    load: async () => {
+      db = await openDB();
+      const store = db.transaction(DB_STORE, "readonly").objectStore(DB_STORE);
+      const [keys, values] = await Promise.all([
+        requestToPromise(store.getAllKeys()),
+        requestToPromise(store.getAll()),
+      ]);
+      const state: Record<string, string> = {};
+      keys.forEach((key, i) => {
+        state[String(key)] = values[i] as string;
+      });
+      return state;
+    },
+    write: async (changes) => {
+      const transaction = startWrite(await openDB(), changes);
+      await new Promise<void>((resolve, reject) => {
+        transaction.oncomplete = () => {
+          resolve();
+        };
+        transaction.onerror = transaction.onabort = () => {
+          reject(transaction.error ?? new Error("IndexedDB transaction failed"));
+        };
+      });
+    },
+    // A committed transaction finishes even if the page is closed
+    writeBeforeUnload: (changes) => {
+      if (db !== undefined) {
+        startWrite(db, changes);
+      }
+    },
+  };
+}
+
+export function createLocalStorageBackend(): SimStateBackend {
+  function writeNow(changes: SimStateChanges) {
+    for (const [key, value] of changes) {
+      if (value === null) {
+        localStorage.removeItem(LOCAL_STORAGE_PREFIX + key);
+      } else {
+        localStorage.setItem(LOCAL_STORAGE_PREFIX + key, value);
+      }
+    }
+  }
+
+  return {
+    name: "localStorage",
+    load: () => {
+      const state: Record<string, string> = {};
+      for (let i = 0; i < localStorage.length; i++) {
+        const key = localStorage.key(i);
+        if (key?.startsWith(LOCAL_STORAGE_PREFIX)) {
+          state[key.slice(LOCAL_STORAGE_PREFIX.length)] =
+            localStorage.getItem(key) ?? "";
+        }
+      }
+      return Promise.resolve(state);
+    },
+    write: (changes) => {
+      writeNow(changes);
+      return Promise.resolve();
+    },
+    writeBeforeUnload: writeNow,
+  };
+}
+
+// Saves to files in the app data directory through the preload script
+export function createElectronBackend(
+  store: NonNullable<Window["simStateStore"]>,
+): SimStateBackend {
+  return {
+    name: "Electron",
+    load: () => store.load(),
+    write: (changes) => store.write(Object.fromEntries(changes)),
+    writeBeforeUnload: (changes) => {
+      store.writeSync(Object.fromEntries(changes));
+    },
+  };
+}
+
+// Saves to files in the app data directory through Rust commands
+export function createTauriBackend(
+  tauri: NonNullable<Window["__TAURI__"]>,
+): SimStateBackend {
+  return {
+    name: "Tauri",
+    load: () => tauri.core.invoke<Record<string, string>>("load_sim_state"),
+    write: (changes) =>
+      tauri.core.invoke<undefined>("write_sim_state", {
+        changes: Object.fromEntries(changes),
+      }),
+    // Commands are sent right away, so this usually makes it before the window closes
+    writeBeforeUnload: (changes) => {
+      void tauri.core.invoke("write_sim_state", {
+        changes: Object.fromEntries(changes),
+      });
+    },
+  };
+}
+
+export function createSimStateBackend(): SimStateBackend {
+  if (window.__TAURI__ !== undefined) {
+    return createTauriBackend(window.__TAURI__);
+  } else if (window.simStateStore !== undefined) {
+    return createElectronBackend(window.simStateStore);
+  } else if (typeof indexedDB !== "undefined") {
+    return createIndexedDBBackend();
+  } else {
+    return createLocalStorageBackend();
+  }
+}
+
+export class SimStateStore {
+  readonly ready: Promise<void>;
+  private readonly backend: SimStateBackend;
+  private readonly flushInterval: number;
+  private state: Record<string, unknown> = {};
+  // The serialized values, to tell whether a value actually changed
+  private serialized = new Map<string, string>();
+  private pending: SimStateChanges = new Map();
+  private writing: Promise<void> = Promise.resolve();
+  private intervalId: ReturnType<typeof setInterval> | undefined;
+
+  constructor(backend: SimStateBackend, flushInterval = 1000) {
+    this.backend = backend;
+    this.flushInterval = flushInterval;
+    this.ready = this.load();
+  }
+
+  // A copy of the state to send to the simulator
+  get snapshot(): Record<string, unknown> {
+    return {...this.state};
+  }
+
+  set(key: string, value: unknown) {
+    const serialized =
+      value === null || value === undefined ? null : JSON.stringify(value);
+    if ((this.serialized.get(key) ?? null) === serialized) {
+      return;
+    }
+    if (serialized === null) {
+      delete this.state[key];
+      this.serialized.delete(key);
+    } else {
+      this.state[key] = value;
+      this.serialized.set(key, serialized);
+    }
+    this.pending.set(key, serialized);
+  }
+
+  flush(): Promise<void> {
+    if (this.pending.size === 0) {
+      return this.writing;
+    }
+    const changes = this.pending;
+    this.pending = new Map();
+    this.writing = this.writing
+      .then(() => this.backend.write(changes))
+      .catch((err: unknown) => {
+        console.warn(`Failed to save sim state to ${this.backend.name}`, err);
+        // Try again with the next flush, unless the keys changed since
+        for (const [key, value] of changes) {
+          if (!this.pending.has(key)) {
+            this.pending.set(key, value);
+          }
+        }
+      });
+    return this.writing;
+  }
+
+  private readonly onHide = () => {
+    if (document.visibilityState === "hidden") {
+      void this.flush();
+    }
+  };
+
+  private readonly onUnload = () => {
+    if (this.pending.size === 0) {
+      return;
+    }
+    if (this.backend.writeBeforeUnload !== undefined) {
+      this.backend.writeBeforeUnload(this.pending);
+      this.pending = new Map();
+    } else {
+      void this.flush();
+    }
+  };
+
+  // Starts flushing on an interval and when the page is hidden or closed
+  start() {
+    this.stop();
+    this.intervalId = setInterval(() => {
+      void this.flush();
+    }, this.flushInterval);
+    document.addEventListener("visibilitychange", this.onHide);
+    window.addEventListener("pagehide", this.onUnload);
+  }
+
+  stop() {
+    if (this.intervalId !== undefined) {
+      clearInterval(this.intervalId);
+      this.intervalId = undefined;
+    }
+    document.removeEventListener("visibilitychange", this.onHide);
+    window.removeEventListener("pagehide", this.onUnload);
+  }
+
+  private async load() {
+    let loaded: Record<string, string> = {};
+    try {
+      loaded = await this.backend.load();
+    } catch (err) {
+      console.warn(`Failed to load sim state from ${this.backend.name}`, err);
+    }
+    for (const [key, serialized] of Object.entries(loaded)) {
+      try {
+        this.state[key] = JSON.parse(serialized);
+        this.serialized.set(key, serialized);
+      } catch (err) {
+        console.warn(`Failed to parse sim state key ${key}`, err);
+      }
+    }
+    console.log(
+      `Loaded ${this.serialized.size} sim state keys from ${this.backend.name}`,
+    );
+    this.migrateLegacyState();
+  }
+
+  // Moves the state saved as one JSON object in localStorage by older versions
+  private migrateLegacyState() {
+    let legacy: string | null = null;
+    try {
+      legacy = localStorage.getItem(LEGACY_LOCAL_STORAGE_KEY);
+    } catch {
+      return;
+    }
+    if (legacy === null) {
+      return;
+    }
+    try {
+      const legacyState = JSON.parse(legacy) as Record<string, unknown>;
+      for (const [key, value] of Object.entries(legacyState)) {
+        if (!this.serialized.has(key)) {
+          this.set(key, value);
+        }
+      }
+    } catch (err) {
+      console.warn("Failed to parse legacy sim state, discarding it", err);
+    }
+    void this.flush().then(() => {
+      if (this.pending.size === 0) {
+        localStorage.removeItem(LEGACY_LOCAL_STORAGE_KEY);
+        console.log("Migrated legacy sim state from localStorage");
+      }
+    });
+  }
+}
@@ -1,8 +1,27 @@
-import { defineConfig } from 'vite'
+import { defineConfig, type Plugin } from 'vite'
 import react from '@vitejs/plugin-react'
 
+// Tells the app to reload the game when public/binary.js changes in the dev server,
+// instead of reloading the whole page
+function reloadBinary(): Plugin {
+  return {
+    name: "reload-binary",
+    apply: "serve",
+    configureServer(server) {
+      const normalize = (path: string) => path.replace(/\\/g, "/")
+      const binaryPath = `${normalize(server.config.publicDir)}/binary.js`
+      server.watcher.add(binaryPath)
+      server.watcher.on("change", (file) => {
+        if (normalize(file) === binaryPath) {
+          server.ws.send({type: "custom", event: "binary-update"})
+        }
+      })
+    },
+  }
+}
+
 // https://vite.dev/config/
 export default defineConfig({
-  plugins: [react()],
+  plugins: [react(), reloadBinary()],
   base: "./"
 })
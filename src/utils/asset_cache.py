@@ -0,0 +1,174 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import requests
+
+from .download import DEFAULT_MAX_WORKERS, download_file
+from .logger import create_logger
+
+logger = create_logger(name=__name__, level=logging.INFO)
+
+
+@dataclass
+class CachedAsset:
+    """
+    An asset stored in the asset cache.
+    """
+    url: str
+    sha256: str
+    path: Path
+
+    def read_text(self) -> str:
+        return self.path.read_text(encoding="utf-8")
+
+
+class AssetCache:
+    """
+    A persistent, content-addressed cache for assets downloaded over HTTP. Each URL
+    maps to an entry that records the SHA-256 of the last downloaded content along
+    with the ETag and Last-Modified headers, which are used to revalidate the entry
+    instead of downloading it again. The content itself is stored once per hash, so
+    identical files from different URLs share the same blob.
+    """
+
+    def __init__(self, cache_dir: Path, offline: bool = False):
+        """
+        :param cache_dir: The directory to store the cache in.
+        :param offline: If True, never touch the network and only serve cached assets.
+        """
+        self.root = cache_dir / "assets"
+        self.blobs_dir = self.root / "blobs"
+        self.entries_dir = self.root / "entries"
+        self.tmp_dir = self.root / "tmp"
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        self.entries_dir.mkdir(parents=True, exist_ok=True)
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        self.offline = offline
+
+    def _entry_path(self, url: str) -> Path:
+        return self.entries_dir / f"{hashlib.sha256(url.encode()).hexdigest()}.json"
+
+    def _blob_path(self, sha256: str) -> Path:
+        return self.blobs_dir / sha256[:2] / sha256
+
+    def _read_entry(self, url: str) -> Optional[dict]:
+        entry_path = self._entry_path(url)
+        if not entry_path.exists():
+            return None
+        try:
+            entry = json.loads(entry_path.read_text())
+        except json.JSONDecodeError:
+            logger.warning(f"Corrupt cache entry for {url}, ignoring")
+            return None
+        if not self._blob_path(entry["sha256"]).exists():
+            logger.debug(f"Blob for {url} is missing, ignoring entry")
+            return None
+        return entry
+
+    def _write_entry(self, url: str, entry: dict):
+        entry_path = self._entry_path(url)
+        tmp_path = entry_path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        tmp_path.write_text(json.dumps(entry, indent=2))
+        os.replace(tmp_path, entry_path)
+
+    def _store_blob(self, tmp_path: Path, sha256: str):
+        blob_path = self._blob_path(sha256)
+        if blob_path.exists():
+            tmp_path.unlink()
+        else:
+            blob_path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_path, blob_path)
+
+    def get(self, url: str, refresh: bool = False,
+            revalidate: bool = True) -> CachedAsset:
+        """
+        Gets an asset from the cache, downloading or revalidating it if needed. If the
+        network is unavailable, the cached copy is used if there is one.
+
+        :param url: The URL of the asset.
+        :param refresh: If True, download the asset unconditionally.
+        :param revalidate: If False, a cached copy is used without asking the server
+         if it changed, for URLs whose content never changes (ex. versioned files).
+        :return: A CachedAsset pointing to the cached content.
+        """
+        entry = self._read_entry(url)
+        if entry is not None and not refresh and not revalidate:
+            logger.debug(f"Using cached {url} without revalidating")
+            return CachedAsset(url, entry["sha256"], self._blob_path(entry["sha256"]))
+        if self.offline:
+            if entry is None:
+                raise Exception(f"{url} is not cached and offline mode is enabled")
+            logger.debug(f"Using cached {url} (offline)")
+            return CachedAsset(url, entry["sha256"], self._blob_path(entry["sha256"]))
+        headers = {}
+        if entry is not None and not refresh:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        tmp_path = self.tmp_dir / uuid.uuid4().hex
+        try:
+            res = download_file(url, tmp_path, headers=headers)
+        except requests.RequestException as e:
+            if entry is None:
+                raise e
+            logger.warning(f"Failed to revalidate {url}, using cached copy: {e}")
+            return CachedAsset(url, entry["sha256"], self._blob_path(entry["sha256"]))
+        if res.not_modified and entry is not None:
+            logger.debug(f"Cached {url} is still fresh")
+            sha256 = entry["sha256"]
+        else:
+            sha256 = res.sha256
+            self._store_blob(tmp_path, sha256)
+        self._write_entry(url, {
+            "url": url,
+            "sha256": sha256,
+            "etag": res.headers.get("ETag", entry.get("etag") if entry else None),
+            "last_modified": res.headers.get(
+                "Last-Modified", entry.get("last_modified") if entry else None),
+            "fetched": time.time()
+        })
+        return CachedAsset(url, sha256, self._blob_path(sha256))
+
+    def get_many(self, urls: list[str], refresh: bool = False, revalidate: bool = True,
+                 max_workers: int = DEFAULT_MAX_WORKERS) -> list[CachedAsset]:
+        """
+        Gets many assets from the cache in parallel. See get().
+
+        :param urls: The URLs of the assets.
+        :param refresh: If True, download the assets unconditionally.
+        :param revalidate: If False, cached copies are used without revalidating them.
+        :param max_workers: The maximum number of downloads at the same time.
+        :return: A list of CachedAssets in the same order as the URLs.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self.get, url, refresh, revalidate)
+                       for url in urls]
+            return [future.result() for future in futures]
+
+    @staticmethod
+    def link_to(asset: CachedAsset, dest: Path):
+        """
+        Places a cached asset at the destination, hardlinking it to the cached blob if
+        possible so the bytes are not duplicated. Treat the destination as read-only -
+        unlink it before writing new content to it.
+
+        :param asset: The cached asset.
+        :param dest: The destination path.
+        """
+        if dest.exists() or dest.is_symlink():
+            dest.unlink()
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(asset.path, dest)
+        except OSError:
+            shutil.copy2(asset.path, dest)
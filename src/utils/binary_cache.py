@@ -0,0 +1,112 @@
+import logging
+import os
+import uuid
+from pathlib import Path
+
+from .filesystem import CopyMode, copy_file
+from .fingerprint import hash_file
+from .logger import create_logger
+
+logger = create_logger(name=__name__, level=logging.INFO)
+
+# The compile cache is trimmed to this size, least recently used binaries first
+DEFAULT_MAX_SIZE = 512 * 1024 ** 2
+
+
+class BinaryCache:
+    """
+    A cache of compiled game binaries (binary.js) shared between all games, so a game
+    whose MakeCode project has not changed is never compiled again, even in a new
+    working directory. Binaries are stored once per content hash and looked up by the
+    fingerprint of the project's inputs. When the cache grows past its maximum size,
+    the least recently used binaries are evicted.
+    """
+
+    def __init__(self, cache_dir: Path, max_size: int = DEFAULT_MAX_SIZE):
+        """
+        :param cache_dir: The directory to store the cache in.
+        :param max_size: The maximum total size of the binaries in bytes.
+        """
+        self.root = cache_dir / "binaries"
+        self.blobs_dir = self.root / "blobs"
+        self.keys_dir = self.root / "keys"
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        self.keys_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+
+    def _key_path(self, key: str) -> Path:
+        return self.keys_dir / key
+
+    def _blob_path(self, sha256: str) -> Path:
+        return self.blobs_dir / f"{sha256}.js"
+
+    @staticmethod
+    def _write_atomic(path: Path, text: str):
+        tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        tmp_path.write_text(text)
+        os.replace(tmp_path, path)
+
+    def restore(self, key: str, dest: Path) -> bool:
+        """
+        Restores a cached binary.
+
+        :param key: The fingerprint of the project's inputs.
+        :param dest: The path to restore the binary to.
+        :return: True if the binary was cached and restored, False otherwise.
+        """
+        key_path = self._key_path(key)
+        try:
+            blob_path = self._blob_path(key_path.read_text().strip())
+        except FileNotFoundError:
+            logger.debug(f"No cached binary for {key[:16]}")
+            return False
+        if not blob_path.exists():
+            logger.debug(f"Cached binary for {key[:16]} was evicted")
+            key_path.unlink(missing_ok=True)
+            return False
+        logger.debug(f"Restoring cached binary {blob_path} to {dest}")
+        # Copy instead of hardlink, the compiler rewrites binary.js in place
+        copy_file(blob_path, dest, CopyMode.REFLINK)
+        # Mark as recently used
+        os.utime(blob_path)
+        os.utime(key_path)
+        return True
+
+    def store(self, key: str, binary_path: Path):
+        """
+        Stores a compiled binary and evicts old binaries if the cache is too big.
+
+        :param key: The fingerprint of the project's inputs.
+        :param binary_path: The path to the compiled binary.
+        """
+        sha256 = hash_file(binary_path)
+        blob_path = self._blob_path(sha256)
+        if blob_path.exists():
+            os.utime(blob_path)
+        else:
+            logger.debug(f"Storing binary {binary_path} as {blob_path}")
+            tmp_path = self.blobs_dir / f".{uuid.uuid4().hex}.tmp"
+            copy_file(binary_path, tmp_path, CopyMode.REFLINK)
+            os.replace(tmp_path, blob_path)
+        self._write_atomic(self._key_path(key), sha256)
+        self.evict()
+
+    def evict(self):
+        """
+        Deletes the least recently used binaries until the cache fits in its maximum
+        size. Keys of evicted binaries are removed the next time they are looked up.
+        """
+        blobs = []
+        for path in self.blobs_dir.glob("*.js"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            blobs.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum(size for _, size, _ in blobs)
+        for _, size, path in sorted(blobs, key=lambda blob: blob[0]):
+            if total_size <= self.max_size:
+                break
+            logger.debug(f"Evicting cached binary {path}")
+            path.unlink(missing_ok=True)
+            total_size -= size
@@ -0,0 +1,37 @@
+import logging
+import os
+import sys
+from pathlib import Path
+from typing import Optional
+
+from .logger import create_logger
+
+logger = create_logger(name=__name__, level=logging.INFO)
+
+CACHE_DIR_ENV_VAR = "MKCD_TO_APP_CACHE_DIR"
+
+
+def get_cache_dir(override: Optional[Path] = None) -> Path:
+    """
+    Gets the directory where persistent caches are stored. This is shared between all
+    games and builds on this machine.
+
+    :param override: A directory to use instead of the default one.
+    :return: The path to the cache directory, which is created if needed.
+    """
+    if override is not None:
+        cache_dir = Path(override)
+    elif os.environ.get(CACHE_DIR_ENV_VAR):
+        cache_dir = Path(os.environ[CACHE_DIR_ENV_VAR])
+    elif sys.platform == "win32" and os.environ.get("LOCALAPPDATA"):
+        cache_dir = Path(os.environ["LOCALAPPDATA"]) / "MakeCode-Arcade-to-App" / "cache"
+    elif os.environ.get("XDG_CACHE_HOME"):
+        cache_dir = Path(os.environ["XDG_CACHE_HOME"]) / "makecode-arcade-to-app"
+    else:
+        cache_dir = Path.home() / ".cache" / "makecode-arcade-to-app"
+    # Commands run in other directories are given paths in the cache (ex. the shared
+    # cargo target directory), so it must not be relative
+    cache_dir = cache_dir.resolve()
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    logger.debug(f"Cache directory: {cache_dir}")
+    return cache_dir
@@ -0,0 +1,44 @@
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator
+
+from .fingerprint import fingerprint
+from .lock import file_lock
+from .logger import create_logger
+
+logger = create_logger(name=__name__, level=logging.INFO)
+
+
+class CargoTargetCache:
+    """
+    Cargo target directories shared between all games. Every game's Tauri app has
+    the same Rust code and dependencies, so compiling them once and pointing every
+    build at the same target directory (CARGO_TARGET_DIR) leaves only the app crate,
+    which embeds the game's assets, to compile for each game. Target directories are
+    keyed by their inputs (ex. the template hash and cargo version), and only one
+    build uses a target directory at a time.
+    """
+
+    def __init__(self, cache_dir: Path):
+        """
+        :param cache_dir: The directory to store the cache in.
+        """
+        self.root = cache_dir / "cargo-targets"
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    @contextmanager
+    def use(self, inputs: dict[str, Any]) -> Iterator[Path]:
+        """
+        Locks the target directory for a set of inputs, waiting for other builds
+        using it to finish.
+
+        :param inputs: The inputs the compiled dependencies depend on.
+        :return: A context manager giving the target directory.
+        """
+        key = fingerprint(inputs)[:16]
+        target_dir = self.root / key
+        target_dir.mkdir(parents=True, exist_ok=True)
+        with file_lock(self.root / f"{key}.lock"):
+            logger.debug(f"Using shared cargo target directory {target_dir}")
+            yield target_dir
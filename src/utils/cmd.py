@@ -1,14 +1,66 @@
 import logging
+import os
 import subprocess
+import tempfile
 from os import PathLike
 from pathlib import Path
-from typing import Optional, Sequence
+from typing import Any, Optional, Sequence
 
 from .logger import create_logger
+from .trace import get_tracer, max_rss_to_bytes
 
 logger = create_logger(name=__name__, level=logging.INFO)
 
 
+def _wait(process: subprocess.Popen) -> int:
+    """
+    Waits for a process to exit, and records its peak memory with the tracer where
+    os.wait4 is available.
+
+    :param process: The process.
+    :return: The exit code of the process.
+    """
+    with process:
+        try:
+            if hasattr(os, "wait4"):
+                _, status, usage = os.wait4(process.pid, 0)
+                # So Popen does not wait for the process again
+                process.returncode = os.waitstatus_to_exitcode(status)
+                get_tracer().record_peak_rss(max_rss_to_bytes(usage.ru_maxrss))
+            else:
+                process.wait()
+        except BaseException:
+            process.kill()
+            raise
+    return process.returncode
+
+
+def _run(command: Any, capture_output: bool = False, **kwargs) -> str:
+    """
+    Runs a command like subprocess.run with check=True.
+
+    :param command: The command to run.
+    :param capture_output: If True, return what the command printed.
+    :param kwargs: Arguments for subprocess.Popen.
+    :return: The standard output of the command if capture_output, else "".
+    """
+    output = error = ""
+    if capture_output:
+        # Pipes would have to be read before waiting, files can be read after
+        with tempfile.TemporaryFile() as stdout, tempfile.TemporaryFile() as stderr:
+            returncode = _wait(subprocess.Popen(command, stdout=stdout, stderr=stderr,
+                                                **kwargs))
+            stdout.seek(0)
+            stderr.seek(0)
+            output = stdout.read().decode(errors="replace")
+            error = stderr.read().decode(errors="replace")
+    else:
+        returncode = _wait(subprocess.Popen(command, **kwargs))
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, command, output, error)
+    return output
+
+
 def run_command(command: str | bytes | PathLike[str] | PathLike[bytes] | Sequence[
     str | bytes | PathLike[str] | PathLike[bytes]], cwd: Optional[Path] = None):
     """
@@ -21,18 +73,47 @@ def run_command(command: str | bytes | PathLike[str] | PathLike[bytes] | Sequenc
         logger.debug(f"Running command in {cwd}: {command}")
     else:
         logger.debug(f"Running command: {command}")
-    subprocess.run(command, cwd=cwd, check=True)
+    name = command if isinstance(command, (str, bytes, PathLike)) else \
+        " ".join(str(part) for part in command)
+    with get_tracer().span(str(name), "subprocess", cwd=cwd):
+        _run(command, cwd=cwd)
+
+
+def get_command_output(command: Sequence[str | PathLike[str]],
+                       cwd: Optional[Path] = None) -> str:
+    """
+    Run a command in the specified directory and get what it printed.
+
+    :param command: The command to run.
+    :param cwd: The directory in which to run the command.
+    :return: The standard output of the command, with surrounding whitespace removed.
+    """
+    if cwd:
+        logger.debug(f"Running command in {cwd}: {command}")
+    else:
+        logger.debug(f"Running command: {command}")
+    name = " ".join(str(part) for part in command)
+    with get_tracer().span(name, "subprocess", cwd=cwd):
+        output = _run(command, capture_output=True, cwd=cwd)
+    return output.strip()
 
 
-def run_shell_command(command: str, cwd: Optional[Path] = None):
+def run_shell_command(command: str, cwd: Optional[Path] = None,
+                      env: Optional[dict[str, str]] = None):
     """
     Run a shell command in the specified directory.
 
     :param command: The shell command to run.
     :param cwd: The directory in which to run the command.
+    :param env: Environment variables to set for the command, on top of the current
+     environment.
     """
     if cwd:
         logger.debug(f"Running command in {cwd}: {command}")
     else:
         logger.debug(f"Running command: {command}")
-    subprocess.run(command, cwd=cwd, shell=True, check=True)
+    if env:
+        logger.debug(f"With environment variables: {env}")
+    with get_tracer().span(command, "subprocess", cwd=cwd):
+        _run(command, cwd=cwd, shell=True,
+             env={**os.environ, **env} if env else None)
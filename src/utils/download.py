@@ -0,0 +1,161 @@
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .logger import create_logger
+from .trace import get_tracer
+
+logger = create_logger(name=__name__, level=logging.INFO)
+
+# (connect timeout, read timeout) in seconds
+DEFAULT_TIMEOUT = (10, 60)
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_ATTEMPTS = 3
+CHUNK_SIZE = 64 * 1024
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Gets the shared HTTP session. Connections are pooled and kept alive between
+    requests, and failed requests are retried with backoff.
+
+    :return: A requests.Session shared by the whole process.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            logger.debug("Creating shared HTTP session")
+            retry = Retry(total=DEFAULT_ATTEMPTS, backoff_factor=0.5,
+                          status_forcelist=(429, 500, 502, 503, 504),
+                          allowed_methods=("GET", "HEAD"))
+            adapter = HTTPAdapter(pool_connections=DEFAULT_MAX_WORKERS,
+                                  pool_maxsize=DEFAULT_MAX_WORKERS, max_retries=retry)
+            _session = requests.Session()
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+@dataclass
+class DownloadResult:
+    """
+    The result of a download.
+    """
+    url: str
+    path: Path
+    status_code: int
+    sha256: Optional[str] = None  # None if nothing was downloaded (ex. 304)
+    size: int = 0
+    headers: dict = field(default_factory=dict)
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status_code == 304
+
+
+def download_file(url: str, dest: Path, headers: Optional[dict] = None,
+                  timeout: tuple[float, float] = DEFAULT_TIMEOUT,
+                  attempts: int = DEFAULT_ATTEMPTS) -> DownloadResult:
+    """
+    Downloads a file by streaming it to disk in chunks while hashing it. The file is
+    written to a .part file next to the destination first, and if the connection
+    drops the download resumes from where it left off when the server supports range
+    requests.
+
+    :param url: The URL to download.
+    :param dest: The path to save the file to.
+    :param headers: Extra headers to send, ex. for conditional requests. If the server
+     responds with 304 Not Modified, nothing is written.
+    :param timeout: The connect and read timeouts in seconds.
+    :param attempts: How many times to try to resume an interrupted download.
+    :return: A DownloadResult describing the download.
+    """
+    session = get_session()
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    part_path = dest.with_name(f"{dest.name}.part")
+    if part_path.exists():
+        part_path.unlink()
+    hasher = hashlib.sha256()
+    size = 0
+    # The ETag or Last-Modified of the response being resumed
+    validator = None
+    for attempt in range(1, attempts + 1):
+        request_headers = dict(headers or {})
+        if size > 0:
+            # The conditional headers are for the cached copy, not the partial file
+            request_headers = {key: value for key, value in request_headers.items()
+                               if key.lower() not in ("if-none-match",
+                                                      "if-modified-since")}
+            request_headers["Range"] = f"bytes={size}-"
+            if validator is not None:
+                # The server sends the whole file instead if it changed
+                request_headers["If-Range"] = validator
+        try:
+            with session.get(url, headers=request_headers, timeout=timeout,
+                             stream=True) as res:
+                if res.status_code == 304:
+                    logger.debug(f"{url} not modified")
+                    return DownloadResult(url, dest, 304, headers=dict(res.headers))
+                if not res.ok:
+                    if part_path.exists():
+                        part_path.unlink()
+                    # An HTTPError, so callers can fall back like for network errors
+                    raise requests.HTTPError(
+                        f"Failed to download {url}: {res.status_code} {res.reason}",
+                        response=res)
+                if size > 0 and res.status_code != 206:
+                    logger.debug(f"Server sent all of {url} instead of resuming, restarting")
+                    hasher = hashlib.sha256()
+                    size = 0
+                if size == 0:
+                    etag = res.headers.get("ETag")
+                    # If-Range only works with strong ETags
+                    validator = etag if etag is not None and \
+                        not etag.startswith("W/") else res.headers.get("Last-Modified")
+                with part_path.open("ab" if size > 0 else "wb") as f:
+                    for chunk in res.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+                        hasher.update(chunk)
+                        size += len(chunk)
+                part_path.replace(dest)
+                get_tracer().count("bytes_downloaded", size)
+                logger.debug(f"Downloaded {url} ({round(size / 1024)} kb)")
+                return DownloadResult(url, dest, res.status_code, hasher.hexdigest(),
+                                      size, dict(res.headers))
+        except (requests.ConnectionError, requests.Timeout,
+                requests.exceptions.ChunkedEncodingError) as e:
+            if attempt == attempts:
+                if part_path.exists():
+                    part_path.unlink()
+                raise e
+            logger.warning(f"Download of {url} interrupted at {size} bytes, "
+                           f"retrying ({attempt}/{attempts}): {e}")
+    raise AssertionError("Unreachable")
+
+
+def download_files(jobs: list[tuple[str, Path]], headers: Optional[dict] = None,
+                   max_workers: int = DEFAULT_MAX_WORKERS) -> list[DownloadResult]:
+    """
+    Downloads many files in parallel with a bounded thread pool.
+
+    :param jobs: A list of (url, destination path) tuples.
+    :param headers: Extra headers to send with every request.
+    :param max_workers: The maximum number of downloads at the same time.
+    :return: A list of DownloadResults in the same order as the jobs.
+    """
+    logger.debug(f"Downloading {len(jobs)} files with up to {max_workers} workers")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(download_file, url, dest, headers)
+                   for url, dest in jobs]
+        return [future.result() for future in futures]
@@ -1,32 +1,240 @@
 import logging
+import os
 import shutil
+import sys
+from dataclasses import dataclass, field
+from enum import Enum
+from fnmatch import fnmatch
 from pathlib import Path
+from typing import Iterable
 
 from .logger import create_logger
+from .trace import get_tracer
 
 logger = create_logger(name=__name__, level=logging.INFO)
 
 
-def copy_these(dirs_and_files: list[str], src_dir: Path, dest_dir: Path):
+class CopyMode(Enum):
+    COPY = "copy"
+    HARDLINK = "hardlink"
+    REFLINK = "reflink"
+    # Reflink if the filesystem supports it, otherwise hardlink, otherwise copy
+    AUTO = "auto"
+
+
+@dataclass
+class CopyManifest:
+    """
+    What changed in the destination when syncing directories and files. Paths are
+    relative to the destination directory, using forward slashes.
+    """
+    added: list[str] = field(default_factory=list)
+    updated: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    unchanged: list[str] = field(default_factory=list)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.updated or self.removed)
+
+    def merge(self, other: "CopyManifest"):
+        self.added.extend(other.added)
+        self.updated.extend(other.updated)
+        self.removed.extend(other.removed)
+        self.unchanged.extend(other.unchanged)
+
+    def __str__(self) -> str:
+        return (f"{len(self.added)} added, {len(self.updated)} updated, "
+                f"{len(self.removed)} removed, {len(self.unchanged)} unchanged")
+
+
+def _reflink(src_path: Path, dest_path: Path) -> bool:
+    """
+    Clones a file with copy-on-write if the filesystem supports it (ex. Btrfs, XFS,
+    APFS), so no bytes are duplicated until one of the files is modified.
+
+    :return: True if the file was cloned, False if reflinks are not supported.
+    """
+    if sys.platform == "linux":
+        import fcntl
+        ficlone = 0x40049409
+        try:
+            with src_path.open("rb") as src, dest_path.open("wb") as dest:
+                fcntl.ioctl(dest.fileno(), ficlone, src.fileno())
+        except OSError:
+            dest_path.unlink(missing_ok=True)
+            return False
+        shutil.copystat(src_path, dest_path)
+        return True
+    elif sys.platform == "darwin":
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        if not hasattr(libc, "clonefile"):
+            return False
+        return libc.clonefile(os.fsencode(src_path), os.fsencode(dest_path), 0) == 0
+    return False
+
+
+def _place_file(src_path: Path, dest_path: Path, mode: CopyMode):
+    if dest_path.exists() or dest_path.is_symlink():
+        # Never write through an existing file, it could be a link to something else
+        dest_path.unlink()
+    if mode in (CopyMode.REFLINK, CopyMode.AUTO) and _reflink(src_path, dest_path):
+        return
+    if mode in (CopyMode.HARDLINK, CopyMode.AUTO):
+        try:
+            os.link(src_path, dest_path)
+            return
+        except OSError:
+            pass
+    shutil.copy2(src_path, dest_path)
+    get_tracer().count("bytes_copied", src_path.stat().st_size)
+
+
+def copy_file(src_path: Path, dest_path: Path, mode: CopyMode = CopyMode.COPY):
+    """
+    Copies one file, replacing the destination instead of writing through it.
+
+    :param src_path: The file to copy.
+    :param dest_path: The path to copy it to.
+    :param mode: How to place the file in the destination.
     """
-    Copies the specified directories and files in the src_dir to the dest_dir.
-    
+    dest_path.parent.mkdir(parents=True, exist_ok=True)
+    _place_file(src_path, dest_path, mode)
+
+
+def _is_unchanged(src_path: Path, dest_path: Path) -> bool:
+    if not dest_path.is_file():
+        return False
+    if os.path.samefile(src_path, dest_path):
+        return True
+    src_stat = src_path.stat()
+    dest_stat = dest_path.stat()
+    if src_stat.st_size != dest_stat.st_size:
+        return False
+    if src_stat.st_mtime_ns == dest_stat.st_mtime_ns:
+        return True
+    # Same size but different modification time - only the contents can tell
+    with src_path.open("rb") as src, dest_path.open("rb") as dest:
+        while True:
+            src_chunk = src.read(1024 * 1024)
+            if src_chunk != dest.read(1024 * 1024):
+                return False
+            if not src_chunk:
+                break
+    shutil.copystat(src_path, dest_path)
+    return True
+
+
+def is_ignored(rel_path: str, ignore: list[str]) -> bool:
+    """
+    Checks a path against ignore patterns like the ones sync_dir takes.
+
+    :param rel_path: The path relative to the synced or watched directory, with /
+     separators.
+    :param ignore: Glob patterns, matched against the name and the relative path.
+     Patterns starting with / are only matched against the relative path.
+    :return: True if any pattern matches.
+    """
+    name = rel_path.rsplit("/", 1)[-1]
+    for pattern in ignore:
+        if pattern.startswith("/"):
+            if fnmatch(rel_path, pattern[1:]):
+                return True
+        elif fnmatch(rel_path, pattern) or fnmatch(name, pattern):
+            return True
+    return False
+
+
+def sync_dir(src_dir: Path, dest_dir: Path, mode: CopyMode = CopyMode.COPY,
+             delete: bool = True, ignore: Iterable[str] = (),
+             _prefix: str = "") -> CopyManifest:
+    """
+    Makes the destination directory a mirror of the source directory, only copying
+    files whose size, modification time, or contents changed.
+
+    :param src_dir: The source directory.
+    :param dest_dir: The destination directory.
+    :param mode: How to place files in the destination.
+    :param delete: Whether to delete files and directories in the destination that are
+     not in the source.
+    :param ignore: Glob patterns of files and directories to neither copy nor delete,
+     matched against the name and the path relative to the source directory. Patterns
+     starting with / are only matched against the relative path.
+    :return: A CopyManifest of what changed.
+    """
+    ignore = list(ignore)
+    manifest = CopyManifest()
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    src_names = set()
+    for src_path in src_dir.iterdir():
+        rel_path = f"{_prefix}{src_path.name}"
+        if is_ignored(rel_path, ignore):
+            continue
+        src_names.add(src_path.name)
+        dest_path = dest_dir / src_path.name
+        if src_path.is_dir():
+            if dest_path.exists() and not dest_path.is_dir():
+                dest_path.unlink()
+            manifest.merge(sync_dir(src_path, dest_path, mode, delete, ignore,
+                                    f"{rel_path}/"))
+        elif _is_unchanged(src_path, dest_path):
+            manifest.unchanged.append(rel_path)
+        else:
+            if dest_path.is_dir():
+                shutil.rmtree(dest_path)
+            existed = dest_path.exists()
+            _place_file(src_path, dest_path, mode)
+            (manifest.updated if existed else manifest.added).append(rel_path)
+    if delete:
+        for dest_path in dest_dir.iterdir():
+            rel_path = f"{_prefix}{dest_path.name}"
+            if dest_path.name in src_names or is_ignored(rel_path, ignore):
+                continue
+            logger.debug(f"Deleting stale {dest_path}")
+            if dest_path.is_dir() and not dest_path.is_symlink():
+                shutil.rmtree(dest_path)
+            else:
+                dest_path.unlink()
+            manifest.removed.append(rel_path)
+    return manifest
+
+
+def copy_these(dirs_and_files: list[str], src_dir: Path, dest_dir: Path,
+               mode: CopyMode = CopyMode.COPY, delete: bool = False) -> CopyManifest:
+    """
+    Copies the specified directories and files in the src_dir to the dest_dir. Files
+    that have not changed are not copied again.
+
     :param dirs_and_files: A list of file names to copy.
     :param src_dir: The source directory from which to copy the files.
     :param dest_dir: The destination directory to which the files will be copied.
+    :param mode: How to place files in the destination.
+    :param delete: Whether to delete files inside copied directories that are not in
+     the source.
+    :return: A CopyManifest of what changed.
     """
     logger.debug(f"Copying {len(dirs_and_files)} directories and files")
+    manifest = CopyManifest()
+    dest_dir.mkdir(parents=True, exist_ok=True)
     for file in dirs_and_files:
         src_path = src_dir / file
         dest_path = dest_dir / file
         if src_path.exists():
             logger.debug(f"Copying {src_path} to {dest_path}")
             if src_path.is_dir():
-                shutil.copytree(src_path, dest_path, dirs_exist_ok=True)
+                manifest.merge(sync_dir(src_path, dest_path, mode, delete,
+                                        _prefix=f"{file}/"))
+            elif _is_unchanged(src_path, dest_path):
+                manifest.unchanged.append(file)
             else:
-                shutil.copy2(src_path, dest_path)
+                existed = dest_path.exists()
+                _place_file(src_path, dest_path, mode)
+                (manifest.updated if existed else manifest.added).append(file)
         else:
             logger.debug(f"{src_path} does not exist, skipping copy.")
+    logger.debug(f"Copied to {dest_dir}: {manifest}")
+    return manifest
 
 
 def delete_these(dirs_and_files: list[str], dir: Path):
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+from fnmatch import fnmatch
+from functools import cache
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+from .logger import create_logger
+
+logger = create_logger(name=__name__, level=logging.INFO)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path: Path) -> str:
+    """
+    Hashes the contents of a file.
+
+    :param path: The path to the file.
+    :return: The SHA-256 hex digest of the file contents.
+    """
+    hasher = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _load_manifest(manifest_path: Path) -> dict[str, list]:
+    try:
+        return json.loads(manifest_path.read_text())
+    except FileNotFoundError:
+        return {}
+    except json.JSONDecodeError:
+        logger.warning(f"Corrupt hash manifest {manifest_path}, ignoring")
+        return {}
+
+
+def hash_tree(root: Path, exclude: Iterable[str] = (),
+              manifest_path: Optional[Path] = None) -> str:
+    """
+    Hashes a directory tree, including the relative path and contents of every file.
+
+    :param root: The directory to hash. If it is a file, the file is hashed instead.
+    :param exclude: Names of directories and files to skip at any depth, ex.
+     node_modules, or glob patterns of names, ex. *.swp.
+    :param manifest_path: A JSON file to keep the size, modification time, and hash of
+     every file in. Files whose size and modification time match the manifest are
+     not read again, which makes hashing large trees that barely changed fast.
+    :return: The SHA-256 hex digest of the tree, or an empty string if the root does
+     not exist.
+    """
+    if not root.exists():
+        return ""
+    if root.is_file():
+        return hash_file(root)
+    exclude = set(exclude)
+    patterns = [pattern for pattern in exclude if any(c in pattern for c in "*?[")]
+
+    def is_excluded(name: str) -> bool:
+        return name in exclude or any(fnmatch(name, pattern) for pattern in patterns)
+
+    old_manifest = _load_manifest(manifest_path) if manifest_path is not None else {}
+    manifest = {}
+    # Files modified in the last few seconds could change again without their
+    # modification time changing, so their hashes are not reused next time
+    racy_after_ns = time.time_ns() - 2_000_000_000
+    hasher = hashlib.sha256()
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names[:] = sorted(d for d in dir_names if not is_excluded(d))
+        for file_name in sorted(file_names):
+            if is_excluded(file_name):
+                continue
+            path = Path(dir_path) / file_name
+            rel_path = path.relative_to(root).as_posix()
+            stat = path.stat()
+            old_entry = old_manifest.get(rel_path)
+            if old_entry is not None and old_entry[:2] == [stat.st_size,
+                                                            stat.st_mtime_ns]:
+                file_hash = old_entry[2]
+            else:
+                file_hash = hash_file(path)
+            if stat.st_mtime_ns < racy_after_ns:
+                manifest[rel_path] = [stat.st_size, stat.st_mtime_ns, file_hash]
+            hasher.update(rel_path.encode())
+            hasher.update(b"\0")
+            hasher.update(file_hash.encode())
+    if manifest_path is not None and manifest != old_manifest:
+        manifest_path.write_text(json.dumps(manifest))
+    return hasher.hexdigest()
+
+
+@cache
+def get_tool_version(command: str) -> str:
+    """
+    Gets the version of a tool by running it, ex. `node --version`. The result is
+    cached for the lifetime of the process.
+
+    :param command: The shell command that prints the version.
+    :return: The output of the command, or an empty string if it failed.
+    """
+    try:
+        result = subprocess.run(command, shell=True, check=True, capture_output=True,
+                                text=True)
+    except (subprocess.CalledProcessError, OSError) as e:
+        logger.debug(f"Failed to get version with {command}: {e}")
+        return ""
+    return result.stdout.strip()
+
+
+def fingerprint(inputs: dict[str, Any]) -> str:
+    """
+    Computes a fingerprint of a stage's inputs.
+
+    :param inputs: A JSON serializable dictionary of inputs. Values that are not JSON
+     serializable (ex. paths and enums) are converted with str().
+    :return: The SHA-256 hex digest of the inputs.
+    """
+    text = json.dumps(inputs, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class FingerprintStore:
+    """
+    Stores the fingerprint of each stage's inputs from the last successful run, so
+    stages whose inputs have not changed can be skipped.
+    """
+
+    def __init__(self, path: Path):
+        """
+        :param path: The JSON file to store fingerprints in.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.fingerprints: dict[str, str] = {}
+        if path.exists():
+            try:
+                self.fingerprints = json.loads(path.read_text())
+            except json.JSONDecodeError:
+                logger.warning(f"Corrupt fingerprint file {path}, ignoring")
+
+    def _save(self):
+        self.path.write_text(json.dumps(self.fingerprints, indent=2))
+
+    def is_fresh(self, stage: str, stage_fingerprint: str,
+                 outputs: Iterable[Path] = ()) -> bool:
+        """
+        Checks whether a stage can be skipped.
+
+        :param stage: The name of the stage.
+        :param stage_fingerprint: The fingerprint of the stage's current inputs.
+        :param outputs: Paths the stage produces, which all must still exist.
+        :return: True if the stage's inputs are unchanged since the last successful run
+         and its outputs exist.
+        """
+        if self.fingerprints.get(stage) != stage_fingerprint:
+            logger.debug(f"Inputs of stage {stage} changed")
+            return False
+        missing = [output for output in outputs if not output.exists()]
+        if missing:
+            logger.debug(f"Outputs of stage {stage} are missing: {missing}")
+            return False
+        return True
+
+    def invalidate(self, stage: str):
+        """
+        Forgets the fingerprint of a stage, ex. before running it so a failed run is
+        not mistaken for a successful one.
+
+        :param stage: The name of the stage.
+        """
+        with self.lock:
+            if self.fingerprints.pop(stage, None) is not None:
+                self._save()
+
+    def record(self, stage: str, stage_fingerprint: str):
+        """
+        Records the fingerprint of a stage after it ran successfully.
+
+        :param stage: The name of the stage.
+        :param stage_fingerprint: The fingerprint of the stage's inputs.
+        """
+        with self.lock:
+            self.fingerprints[stage] = stage_fingerprint
+            self._save()
@@ -0,0 +1,183 @@
+import hashlib
+import logging
+import os
+import re
+import shutil
+import subprocess
+import uuid
+from pathlib import Path
+from typing import Optional
+
+from .cmd import get_command_output, run_command
+from .logger import create_logger
+
+logger = create_logger(name=__name__, level=logging.INFO)
+
+FULL_SHA_PATTERN = re.compile(r"^[0-9a-f]{40}$")
+
+
+class GitMirrorCache:
+    """
+    A cache of bare mirrors of git repositories, shared between all games. Mirrors
+    are fetched incrementally, and working trees are cloned from them with their
+    objects shared instead of cloning from the remote every time. A commit that is
+    already in the mirror is checked out without touching the network.
+    """
+
+    def __init__(self, cache_dir: Path, offline: bool = False):
+        """
+        :param cache_dir: The directory to store the cache in.
+        :param offline: If True, never fetch and only use commits already mirrored.
+        """
+        self.root = cache_dir / "git"
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.offline = offline
+
+    def mirror_path(self, url: str) -> Path:
+        """
+        :param url: The URL of the repository.
+        :return: The path to the bare mirror of the repository.
+        """
+        return self.root / f"{hashlib.sha256(url.encode()).hexdigest()[:16]}.git"
+
+    def _ensure_mirror(self, url: str) -> Path:
+        mirror = self.mirror_path(url)
+        if mirror.exists():
+            return mirror
+        logger.debug(f"Creating mirror of {url} at {mirror}")
+        # Initialize in a temporary directory and move it into place, so other builds
+        # never see a half-initialized mirror
+        tmp_dir = self.root / f"tmp-{uuid.uuid4().hex}.git"
+        try:
+            run_command(["git", "init", "--quiet", "--bare", tmp_dir])
+            run_command(["git", "remote", "add", "origin", url], cwd=tmp_dir)
+            # Mirror branches and tags directly instead of all refs, so the refs that
+            # keep pinned commits alive are not pruned when fetching
+            run_command(["git", "config", "--replace-all", "remote.origin.fetch",
+                         "+refs/heads/*:refs/heads/*"], cwd=tmp_dir)
+            run_command(["git", "config", "--add", "remote.origin.fetch",
+                         "+refs/tags/*:refs/tags/*"], cwd=tmp_dir)
+            try:
+                os.rename(tmp_dir, mirror)
+            except OSError:
+                logger.debug(f"Mirror of {url} was created by another build")
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return mirror
+
+    @staticmethod
+    def _resolve_local(mirror: Path, checkout: str) -> Optional[str]:
+        try:
+            return get_command_output(["git", "rev-parse", "--verify", "--quiet",
+                                       f"{checkout}^{{commit}}"], cwd=mirror)
+        except subprocess.CalledProcessError:
+            return None
+
+    @staticmethod
+    def _update_head(mirror: Path):
+        # Point HEAD at the remote's default branch, in case it changed
+        output = get_command_output(["git", "ls-remote", "--symref", "origin", "HEAD"],
+                                    cwd=mirror)
+        for line in output.splitlines():
+            if line.startswith("ref: ") and line.endswith("\tHEAD"):
+                ref = line.removeprefix("ref: ").removesuffix("\tHEAD")
+                run_command(["git", "symbolic-ref", "HEAD", ref], cwd=mirror)
+                return
+
+    def resolve(self, url: str, checkout: Optional[str]) -> str:
+        """
+        Makes sure a commit is in the mirror of a repository.
+
+        Full commit SHAs that are already mirrored are used without fetching, and
+        missing ones are fetched shallowly on their own. Branches and tags are always
+        fetched (incrementally) so they are up to date, unless offline.
+
+        :param url: The URL of the repository.
+        :param checkout: A commit SHA, branch, or tag. If None, the default branch.
+        :return: The full SHA of the commit.
+        """
+        mirror = self._ensure_mirror(url)
+        checkout = checkout or "HEAD"
+        pinned = FULL_SHA_PATTERN.match(checkout.lower()) is not None
+        if pinned:
+            sha = self._resolve_local(mirror, checkout)
+            if sha is not None:
+                logger.debug(f"{checkout} is already mirrored")
+                return sha
+        if self.offline:
+            sha = self._resolve_local(mirror, checkout)
+            if sha is None:
+                raise ValueError(f"{checkout} of {url} is not mirrored and offline "
+                                 f"mode is on")
+            logger.debug(f"Offline, using mirrored {checkout} ({sha})")
+            return sha
+        if pinned:
+            logger.info(f"Fetching {checkout} from {url}")
+            try:
+                run_command(["git", "fetch", "--quiet", "--depth", "1", "origin",
+                             checkout], cwd=mirror)
+            except subprocess.CalledProcessError:
+                # Some servers do not allow fetching commits by SHA
+                logger.debug(f"Could not fetch {checkout} by itself, fetching all")
+                run_command(["git", "fetch", "--quiet", "--prune", "origin"],
+                            cwd=mirror)
+        else:
+            logger.info(f"Fetching updates from {url}")
+            run_command(["git", "fetch", "--quiet", "--prune", "origin"], cwd=mirror)
+            if checkout == "HEAD":
+                self._update_head(mirror)
+        sha = self._resolve_local(mirror, checkout)
+        if sha is None:
+            raise ValueError(f"Could not find {checkout} in {url}")
+        return sha
+
+    @staticmethod
+    def _pin(mirror: Path, sha: str):
+        # Working trees borrow objects from the mirror, so keep the commit from being
+        # garbage collected after a branch or tag stops pointing to it
+        run_command(["git", "update-ref", f"refs/pinned/{sha}", sha], cwd=mirror)
+
+    def checkout(self, url: str, checkout: Optional[str], dest: Path) -> str:
+        """
+        Creates or updates a working tree at exactly the given commit, detached. The
+        working tree borrows objects from the mirror, so creating it is fast and does
+        not touch the network. Like git checkout, local changes are carried over, and
+        checking out fails instead of overwriting them.
+
+        :param url: The URL of the repository.
+        :param checkout: A commit SHA, branch, or tag. If None, the default branch.
+        :param dest: The path of the working tree.
+        :return: The full SHA of the checked out commit.
+        """
+        sha = self.resolve(url, checkout)
+        mirror = self.mirror_path(url)
+        self._pin(mirror, sha)
+        alternates_path = dest / ".git" / "objects" / "info" / "alternates"
+        if not (dest / ".git").exists():
+            # Like `git clone --reference`, but without cloning from the remote. (`git
+            # clone --shared` from the mirror does not share objects if the mirror is
+            # shallow)
+            logger.debug(f"Creating working tree at {dest} borrowing from {mirror}")
+            run_command(["git", "init", "--quiet", dest])
+            alternates_path.write_text(f"{(mirror / 'objects').resolve()}\n")
+            run_command(["git", "remote", "add", "origin", url], cwd=dest)
+        if alternates_path.exists():
+            # Share the mirror's shallow boundary too, so git does not look for the
+            # parents of shallowly fetched commits
+            if (mirror / "shallow").exists():
+                shutil.copyfile(mirror / "shallow", dest / ".git" / "shallow")
+            elif (dest / ".git" / "shallow").exists():
+                (dest / ".git" / "shallow").unlink()
+        if self._resolve_local(dest, sha) is None:
+            logger.debug(f"Fetching {sha} from {mirror} into {dest}")
+            run_command(["git", "fetch", "--quiet", mirror, sha], cwd=dest)
+        if self._resolve_local(dest, "HEAD") == sha:
+            logger.debug(f"{dest} is already at {sha}")
+            return sha
+        if get_command_output(["git", "status", "--porcelain", "--untracked-files=no"],
+                              cwd=dest) != "":
+            logger.warning(f"{dest} has uncommitted changes, which are kept if they do "
+                           f"not conflict with {checkout or 'the default branch'}")
+        logger.info(f"Checking out {checkout or 'default branch'} ({sha[:7]})")
+        run_command(["git", "checkout", "--quiet", "--detach", sha], cwd=dest)
+        return sha
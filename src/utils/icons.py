@@ -0,0 +1,127 @@
+import logging
+import os
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image
+
+from .asset_cache import AssetCache
+from .filesystem import CopyMode, copy_these
+from .fingerprint import hash_file
+from .logger import create_logger
+
+logger = create_logger(name=__name__, level=logging.INFO)
+
+# Bump this when the generated icons change so old cached icons are not used
+ICON_PIPELINE_VERSION = 1
+FAVICON_SIZES = [(16, 16), (32, 32), (48, 48)]
+ICO_SIZES = [(16, 16), (24, 24), (32, 32), (48, 48), (64, 64), (128, 128), (256, 256)]
+
+
+@dataclass
+class IconSet:
+    """
+    A set of icons generated from one source image.
+    """
+    source_sha256: str
+    dir: Path
+
+    @property
+    def favicon(self) -> Path:
+        return self.dir / "favicon.ico"
+
+    @property
+    def ico(self) -> Path:
+        return self.dir / "icon.ico"
+
+    @property
+    def icns(self) -> Path:
+        return self.dir / "icon.icns"
+
+    @property
+    def png(self) -> Path:
+        return self.dir / "icon.png"
+
+
+def _save_icon(source_img: Image.Image, path: Path, format: str,
+               sizes: Optional[list[tuple[int, int]]] = None):
+    logger.debug(f"Converting icon to {format} and saving to {path}")
+    # Each thread gets its own copy of the image to encode
+    img = source_img.copy()
+    if sizes is not None:
+        img.save(path, format=format, sizes=sizes)
+    else:
+        img.save(path, format=format)
+
+
+def prepare_icons(icon: Path | str, from_url: bool, cache_dir: Path,
+                  asset_cache: AssetCache, no_cache: Optional[bool] = False) -> IconSet:
+    """
+    Prepares the icons for all targets from one source image: a favicon for the
+    website, and an ICO for Windows, ICNS for Mac, and PNG for Linux for the apps. The
+    source image is fetched and decoded once, the formats are encoded in parallel, and
+    the results are cached by the hash of the source image.
+
+    :param icon: The path or URL of the source image.
+    :param from_url: Whether icon is a URL.
+    :param cache_dir: The directory to store the cache in.
+    :param asset_cache: The cache to download the source image with.
+    :param no_cache: If True, downloads and encodes the icons even if they are cached.
+    :return: An IconSet with the paths to the icons.
+    """
+    if from_url:
+        logger.debug(f"Getting icon from {icon}")
+        source_path = asset_cache.get(str(icon), refresh=no_cache).path
+    else:
+        logger.debug(f"Reading icon from {icon}")
+        source_path = Path(icon)
+    source_sha256 = hash_file(source_path)
+    icons_dir = cache_dir / "icons" / f"v{ICON_PIPELINE_VERSION}-{source_sha256}"
+    if icons_dir.exists() and not no_cache:
+        logger.debug(f"Using cached icons at {icons_dir}")
+        return IconSet(source_sha256, icons_dir)
+
+    logger.debug(f"Generating icons in {icons_dir}")
+    source_img = Image.open(source_path)
+    source_img.load()
+    # Generate in a temporary directory and move it into place when done, so other
+    # builds never see a partially generated set
+    tmp_dir = icons_dir.with_name(f"tmp-{uuid.uuid4().hex}")
+    tmp_dir.mkdir(parents=True)
+    tmp_set = IconSet(source_sha256, tmp_dir)
+    try:
+        with ThreadPoolExecutor() as executor:
+            futures = [
+                executor.submit(_save_icon, source_img, tmp_set.favicon, "ICO",
+                                FAVICON_SIZES),
+                executor.submit(_save_icon, source_img, tmp_set.ico, "ICO", ICO_SIZES),
+                executor.submit(_save_icon, source_img, tmp_set.icns, "ICNS"),
+                executor.submit(_save_icon, source_img, tmp_set.png, "PNG")
+            ]
+            for future in futures:
+                future.result()
+        if no_cache and icons_dir.exists():
+            shutil.rmtree(icons_dir)
+        try:
+            os.rename(tmp_dir, icons_dir)
+        except OSError:
+            logger.debug("Icons were generated by another build")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return IconSet(source_sha256, icons_dir)
+
+
+def link_icons(icons: IconSet, dest_dir: Path, names: list[str]):
+    """
+    Links icons from an icon set into a directory.
+
+    :param icons: The icon set.
+    :param dest_dir: The directory to link the icons into.
+    :param names: The file names of the icons to link, ex. icon.ico.
+    """
+    logger.debug(f"Linking {names} from {icons.dir} to {dest_dir}")
+    copy_these(names, icons.dir, dest_dir, CopyMode.AUTO)
@@ -0,0 +1,45 @@
+import logging
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from .logger import create_logger
+
+logger = create_logger(name=__name__, level=logging.INFO)
+
+
+@contextmanager
+def file_lock(path: Path) -> Iterator[None]:
+    """
+    Holds an exclusive lock on a file, blocking until it is available. Works across
+    processes, ex. games built at the same time in a batch. The lock is released if
+    the process dies.
+
+    :param path: The path to the lock file. It is created if it does not exist.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+b") as f:
+        logger.debug(f"Waiting for lock {path}")
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            # LK_LOCK only retries for 10 seconds, so keep trying
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        logger.debug(f"Acquired lock {path}")
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,94 @@
+import logging
+from pathlib import Path
+from typing import Optional
+
+from .cmd import run_shell_command
+from .logger import create_logger
+
+logger = create_logger(name=__name__, level=logging.INFO)
+
+LOCKFILE_NAME = "yarn.lock"
+
+# Templates already warned about not being locked
+_warned_templates: set[Path] = set()
+
+
+class PackageMirror:
+    """
+    A yarn offline mirror, a directory with the tarball of every package installed
+    in a generated project. Projects with a yarn.lock install exactly the locked
+    versions from the mirror without asking the registry about them, and once every
+    locked package is in the mirror, they can be installed without the internet. The
+    directory can be copied between machines or shared on a network drive.
+    """
+
+    def __init__(self, cache_dir: Path, offline: bool = False,
+                 mirror_dir: Optional[Path] = None):
+        """
+        :param cache_dir: The directory to store the mirror in.
+        :param offline: If True, packages are only installed from the mirror and
+         yarn's cache.
+        :param mirror_dir: The directory of the mirror. If None, it is kept in the
+         cache directory.
+        """
+        # yarn runs in the project, so the path must not be relative
+        self.root = (mirror_dir or cache_dir / "yarn-mirror").resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.offline = offline
+
+    def write_yarnrc(self, prj_dir: Path):
+        """
+        Points yarn at the mirror for a project, so packages it downloads are added
+        to the mirror.
+
+        :param prj_dir: The directory of the project.
+        """
+        (prj_dir / ".yarnrc").write_text(
+            f"yarn-offline-mirror \"{self.root.as_posix()}\"\n"
+            f"yarn-offline-mirror-pruning false\n")
+
+
+def is_locked(template_dir: Path,
+              package_mirror: Optional[PackageMirror] = None) -> bool:
+    """
+    Checks if a template has a yarn.lock. Projects from templates without one are
+    scaffolded with the create-* tools and their packages are resolved from the
+    registry, which cannot be done offline.
+
+    :param template_dir: The directory containing the template files.
+    :param package_mirror: The mirror packages are installed from.
+    :return: True if the template has a lockfile.
+    """
+    if (template_dir / LOCKFILE_NAME).exists():
+        return True
+    if package_mirror is not None and package_mirror.offline:
+        raise ValueError(f"{template_dir} has no {LOCKFILE_NAME}, so its project "
+                         f"cannot be created offline. Run src/lock_templates.py "
+                         f"with the internet first.")
+    if template_dir not in _warned_templates:
+        _warned_templates.add(template_dir)
+        logger.warning(f"{template_dir} has no {LOCKFILE_NAME}, so packages are "
+                       f"resolved from the registry and may differ between builds. "
+                       f"Run src/lock_templates.py to lock the templates.")
+    return False
+
+
+def install_packages(prj_dir: Path, package_mirror: Optional[PackageMirror] = None):
+    """
+    Installs the packages of a project with yarn. If the project has a yarn.lock, the
+    locked versions are installed and the lockfile is never changed.
+
+    :param prj_dir: The directory of the project.
+    :param package_mirror: The mirror to install packages from and add them to. If
+     None, packages come from the registry and yarn's cache.
+    """
+    command = "yarn install --non-interactive"
+    if (prj_dir / LOCKFILE_NAME).exists():
+        command += " --frozen-lockfile"
+    else:
+        logger.debug(f"{prj_dir} has no {LOCKFILE_NAME}, resolving packages from "
+                     f"the registry")
+    if package_mirror is not None:
+        package_mirror.write_yarnrc(prj_dir)
+        command += " --offline" if package_mirror.offline else " --prefer-offline"
+    run_shell_command(command, cwd=prj_dir)
@@ -0,0 +1,118 @@
+import logging
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Iterable
+
+from .fingerprint import fingerprint
+from .logger import create_logger
+
+logger = create_logger(name=__name__, level=logging.INFO)
+
+
+def _link_or_copy(src: str, dest: str):
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+
+
+def clone_tree(src_dir: Path, dest_dir: Path,
+               link_dirs: Iterable[str] = ("node_modules",)):
+    """
+    Clones a project directory. Directories in link_dirs (ex. node_modules) are
+    hardlinked file by file so their bytes are shared with the source, while
+    everything else is copied so it can be safely rewritten.
+
+    :param src_dir: The directory to clone.
+    :param dest_dir: The directory to clone to.
+    :param link_dirs: Names of top level directories to hardlink instead of copy.
+    """
+    logger.debug(f"Cloning {src_dir} to {dest_dir}")
+    link_dirs = set(link_dirs)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    for item in src_dir.iterdir():
+        dest_path = dest_dir / item.name
+        if item.is_symlink():
+            os.symlink(os.readlink(item), dest_path)
+        elif item.is_dir():
+            shutil.copytree(item, dest_path, symlinks=True, dirs_exist_ok=True,
+                            copy_function=_link_or_copy if item.name in link_dirs
+                            else shutil.copy2)
+        else:
+            shutil.copy2(item, dest_path)
+
+
+def relink_dir(src_dir: Path, dest_dir: Path):
+    """
+    Replaces a directory with hardlinks to the files of another, ex. an existing
+    project's node_modules with the ones of the current scaffold. Files are never
+    written through the links, since the old directory is removed first.
+
+    :param src_dir: The directory to link to.
+    :param dest_dir: The directory to replace.
+    """
+    logger.debug(f"Relinking {dest_dir} to {src_dir}")
+    if dest_dir.is_symlink() or dest_dir.is_file():
+        dest_dir.unlink()
+    elif dest_dir.exists():
+        shutil.rmtree(dest_dir)
+    if src_dir.exists():
+        shutil.copytree(src_dir, dest_dir, symlinks=True, copy_function=_link_or_copy)
+
+
+class ScaffoldCache:
+    """
+    A cache of project skeletons with their dependencies installed, so projects do not
+    have to be scaffolded and installed from scratch for every game. Scaffolds are
+    keyed by their inputs (ex. the template directory hash and tool versions) and are
+    never modified after they are created - a game's project is a clone of one.
+    """
+
+    def __init__(self, cache_dir: Path):
+        """
+        :param cache_dir: The directory to store the cache in.
+        """
+        self.root = cache_dir / "scaffolds"
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def get(self, kind: str, inputs: dict[str, Any], create: Callable[[Path], None],
+            refresh: bool = False) -> Path:
+        """
+        Gets a scaffold, creating it if it is not cached yet.
+
+        :param kind: The kind of scaffold, ex. website.
+        :param inputs: Everything the scaffold depends on. A new scaffold is created
+         when any of them change.
+        :param create: A function that creates the scaffold at the path passed to it.
+         The path does not exist yet, and its name is neutral (ex. electron-scaffold),
+         so tools that name the package after the directory do not name it after a
+         dependency.
+        :param refresh: If True, recreate the scaffold even if it is cached.
+        :return: The path to the scaffold.
+        """
+        scaffold_dir = self.root / f"{kind}-{fingerprint(inputs)[:16]}"
+        if scaffold_dir.exists() and not refresh:
+            logger.debug(f"Using cached {kind} scaffold at {scaffold_dir}")
+            return scaffold_dir
+        # Build in a temporary directory and move it into place when done, so a
+        # failed or concurrent build never leaves a half-created scaffold behind
+        tmp_parent = self.root / f"tmp-{uuid.uuid4().hex}"
+        tmp_parent.mkdir()
+        try:
+            logger.info(f"Creating {kind} scaffold, this only happens once")
+            # Not just the kind, npm refuses to install electron in a package
+            # named electron
+            tmp_dir = tmp_parent / f"{kind}-scaffold"
+            create(tmp_dir)
+            if refresh and scaffold_dir.exists():
+                shutil.rmtree(scaffold_dir)
+            try:
+                os.rename(tmp_dir, scaffold_dir)
+            except OSError:
+                logger.debug(f"{kind} scaffold was created by another build")
+        finally:
+            shutil.rmtree(tmp_parent, ignore_errors=True)
+        logger.debug(f"Created {kind} scaffold at {scaffold_dir}")
+        return scaffold_dir
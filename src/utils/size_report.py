@@ -0,0 +1,268 @@
+import json
+import logging
+import re
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from enum import Enum
+from pathlib import Path
+from typing import Any, Optional
+
+from .logger import create_logger
+
+logger = create_logger(name=__name__, level=logging.INFO)
+
+CHUNK_SIZE = 1024 * 1024
+# Files that are already compressed, which are counted at their raw size
+COMPRESSED_SUFFIXES = (".png", ".jpg", ".jpeg", ".gif", ".webp", ".ico", ".icns",
+                       ".mp3", ".ogg", ".wav", ".woff", ".woff2", ".zip", ".gz",
+                       ".br", ".7z", ".deb", ".rpm", ".dmg", ".msi", ".nupkg",
+                       ".appimage")
+# Simulator files next to the website, see simulator.py
+SIMULATOR_FILE_PATTERN = re.compile(r"^(---simulator\.html|sim-.+\.(js|css))$")
+SIMULATOR_DIR = "sim-assets"
+# Website files inside a packaged Electron app, see shell.py and protocol.js
+ELECTRON_APP_SHELL = ("app.asar", "app.asar.unpacked", "game", "game.json",
+                      "icon.png")
+# Files in a cargo target directory that are not shipped with the Tauri app
+CARGO_BUILD_SUFFIXES = (".d", ".rlib", ".a", ".lib", ".pdb", ".exp", ".so",
+                        ".dylib", ".dll")
+SIZE_UNITS = {"b": 1, "kb": 1024, "mb": 1024 ** 2, "gb": 1024 ** 3}
+# The budget name for the size of the app, every file but the installers
+TOTAL_BUDGET = "total"
+
+
+class SizeCategory(Enum):
+    # The game, binary.js
+    BINARY = "binary"
+    # The MakeCode Arcade simulator's page, scripts, styles, and assets
+    SIMULATOR = "simulator"
+    # The website around the simulator, and the code of the app that loads it
+    APP_SHELL = "app_shell"
+    # Electron or Tauri itself, ex. the executable and its libraries
+    RUNTIME = "runtime"
+    # Installers and archives made from the app
+    INSTALLER = "installer"
+
+
+@dataclass
+class FileSize:
+    """
+    The size of one output file.
+    """
+    path: str
+    category: SizeCategory
+    raw: int
+    compressed: int
+
+
+@dataclass
+class SizeReport:
+    """
+    The sizes of the files of one output, ex. the static website or the Electron app.
+    """
+    files: list[FileSize] = field(default_factory=list)
+
+    @property
+    def app_files(self) -> list[FileSize]:
+        """
+        :return: Every file but the installers, which are made from the other files
+         and would count them twice.
+        """
+        return [file for file in self.files if file.category != SizeCategory.INSTALLER]
+
+    @property
+    def raw(self) -> int:
+        return sum(file.raw for file in self.app_files)
+
+    @property
+    def compressed(self) -> int:
+        return sum(file.compressed for file in self.app_files)
+
+    def totals(self) -> dict[str, tuple[int, int]]:
+        """
+        :return: The raw and compressed size of each category with files, and of
+         every file but the installers together, keyed by budget name.
+        """
+        totals = {}
+        for category in SizeCategory:
+            files = [file for file in self.files if file.category == category]
+            if len(files) > 0:
+                totals[category.value] = (sum(file.raw for file in files),
+                                          sum(file.compressed for file in files))
+        totals[TOTAL_BUDGET] = (self.raw, self.compressed)
+        return totals
+
+    def to_json(self) -> dict[str, Any]:
+        return {name: {"raw": raw, "compressed": compressed}
+                for name, (raw, compressed) in self.totals().items()}
+
+    def __str__(self) -> str:
+        if len(self.files) == 0:
+            return "No files"
+
+        def kb(size: int) -> str:
+            return f"{size / 1024:.1f}"
+
+        lines = [f"{'Category':<10}  Files  Size (kb)  Gzip (kb)"]
+        for name, (raw, compressed) in self.totals().items():
+            count = len(self.app_files) if name == TOTAL_BUDGET else \
+                sum(1 for file in self.files if file.category.value == name)
+            lines.append(f"{name:<10}  {count:>5}  {kb(raw):>9}  {kb(compressed):>9}")
+        largest = max(self.files, key=lambda f: f.raw)
+        lines.append(f"Largest file: {largest.path} ({kb(largest.raw)} kb)")
+        return "\n".join(lines)
+
+
+def parse_size(size: int | str) -> int:
+    """
+    Parses a size like 1.5 MB, 300 kb, or a number of bytes.
+
+    :param size: The size.
+    :return: The size in bytes.
+    """
+    if type(size) is int:
+        return size
+    match = re.fullmatch(r"\s*([0-9.]+)\s*([a-z]*)\s*", str(size).lower())
+    if match is None or match.group(2) not in ("", *SIZE_UNITS):
+        raise ValueError(f"Invalid size {size}, expected ex. 500 kb or 2 MB")
+    return int(float(match.group(1)) * SIZE_UNITS.get(match.group(2), 1))
+
+
+def _compressed_size(path: Path, category: SizeCategory) -> int:
+    if category == SizeCategory.INSTALLER or \
+            path.suffix.lower() in COMPRESSED_SUFFIXES:
+        return path.stat().st_size
+    # Stream it, executables and libraries can be hundreds of megabytes
+    compressor = zlib.compressobj(6, wbits=31)
+    size = 0
+    with path.open("rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            size += len(compressor.compress(chunk))
+    size += len(compressor.flush())
+    # Servers send files as they are when compressing does not make them smaller
+    return min(size, path.stat().st_size)
+
+
+def _categorize_website_file(rel_path: str) -> SizeCategory:
+    parts = rel_path.split("/")
+    if parts[-1] == "binary.js":
+        return SizeCategory.BINARY
+    if SIMULATOR_FILE_PATTERN.match(parts[-1]) or SIMULATOR_DIR in parts:
+        return SizeCategory.SIMULATOR
+    return SizeCategory.APP_SHELL
+
+
+def list_website_files(dist_dir: Path) -> list[tuple[Path, SizeCategory]]:
+    """
+    Lists the files of a built website. Precompressed copies are left out.
+
+    :param dist_dir: The dist directory of the website.
+    :return: Each file and its category.
+    """
+    return [(path, _categorize_website_file(path.relative_to(dist_dir).as_posix()))
+            for path in sorted(dist_dir.rglob("*"))
+            if path.is_file() and path.suffix not in (".gz", ".br")]
+
+
+def list_electron_files(out_dir: Path) -> list[tuple[Path, SizeCategory]]:
+    """
+    Lists the files of an Electron app made with Electron Forge or packaged from the
+    prebuilt shell. Anything in out/make is an installer.
+
+    :param out_dir: The out directory of the Electron app.
+    :return: Each file and its category.
+    """
+    files = []
+    for path in sorted(out_dir.rglob("*")):
+        if not path.is_file() or path.is_symlink():
+            continue
+        parts = path.relative_to(out_dir).parts
+        if parts[0] == "make":
+            category = SizeCategory.INSTALLER
+        elif "resources" in parts or "Resources" in parts:
+            resources_index = max(i for i, part in enumerate(parts)
+                                  if part in ("resources", "Resources"))
+            rel_path = "/".join(parts[resources_index + 1:])
+            if rel_path.split("/")[0] in ELECTRON_APP_SHELL or \
+                    rel_path == "binary.js":
+                category = _categorize_website_file(rel_path)
+            else:
+                category = SizeCategory.RUNTIME
+        else:
+            category = SizeCategory.RUNTIME
+        files.append((path, category))
+    return files
+
+
+def list_tauri_files(target_dir: Path) -> list[tuple[Path, SizeCategory]]:
+    """
+    Lists the files of a Tauri app in a cargo profile directory (ex. target/release)
+    that are shipped, which are the executable and the bundles. The website is
+    compiled into the executable, so it is counted as the runtime.
+
+    :param target_dir: The cargo profile directory.
+    :return: Each file and its category.
+    """
+    files = [(path, SizeCategory.RUNTIME) for path in sorted(target_dir.iterdir())
+             if path.is_file() and path.suffix.lower() not in CARGO_BUILD_SUFFIXES]
+    bundle_dir = target_dir / "bundle"
+    if bundle_dir.is_dir():
+        files.extend((path, SizeCategory.INSTALLER)
+                     for path in sorted(bundle_dir.rglob("*"))
+                     if path.is_file() and not path.is_symlink())
+    return files
+
+
+def measure_sizes(root: Path, files: list[tuple[Path, SizeCategory]]) -> SizeReport:
+    """
+    Measures the raw and gzip compressed size of files.
+
+    :param root: The directory the files are in, which paths are reported relative to.
+    :param files: Each file and its category.
+    :return: A SizeReport.
+    """
+    logger.debug(f"Measuring {len(files)} files in {root}")
+    # zlib releases the GIL while compressing
+    with ThreadPoolExecutor() as executor:
+        compressed_sizes = list(executor.map(lambda f: _compressed_size(*f), files))
+    return SizeReport([FileSize(path.relative_to(root).as_posix(), category,
+                                path.stat().st_size, compressed)
+                       for (path, category), compressed in zip(files, compressed_sizes)])
+
+
+def check_budgets(report: SizeReport, budgets: dict[str, int]) -> list[str]:
+    """
+    Checks the compressed sizes in a report against budgets.
+
+    :param report: The SizeReport.
+    :param budgets: The most bytes each category, or the total, may take compressed.
+    :return: A message for every budget that was exceeded.
+    """
+    totals = report.totals()
+    exceeded = []
+    for name, budget in budgets.items():
+        compressed = totals.get(name, (0, 0))[1]
+        if compressed > budget:
+            exceeded.append(f"{name} is {compressed / 1024:.1f} kb compressed, over "
+                            f"its budget of {budget / 1024:.1f} kb")
+    return exceeded
+
+
+def append_history(history_path: Path, report: SizeReport,
+                   info: Optional[dict[str, Any]] = None):
+    """
+    Appends a report to a history file with one JSON object per line, so sizes can be
+    compared across versions.
+
+    :param history_path: The path to the history file.
+    :param report: The SizeReport.
+    :param info: More fields to record, ex. the game's version and the output.
+    """
+    history_path.parent.mkdir(parents=True, exist_ok=True)
+    entry = {"time": time.strftime("%Y-%m-%dT%H:%M:%S%z"), **(info or {}),
+             "sizes": report.to_json()}
+    with history_path.open("a") as f:
+        f.write(json.dumps(entry) + "\n")
+    logger.debug(f"Appended sizes to {history_path}")
@@ -0,0 +1,206 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+from .logger import create_logger
+
+logger = create_logger(name=__name__, level=logging.INFO)
+
+COUNTERS = ("bytes_downloaded", "bytes_copied")
+
+
+def _child_cpu_time() -> float:
+    """
+    :return: The CPU time in seconds used by finished child processes, or 0 if
+     unavailable.
+    """
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def max_rss_to_bytes(max_rss: int) -> int:
+    """
+    :param max_rss: ru_maxrss from getrusage or wait4.
+    :return: The size in bytes. ru_maxrss is in kilobytes on Linux and bytes on Mac.
+    """
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+@dataclass
+class Span:
+    """
+    A finished span of work.
+    """
+    name: str
+    category: str
+    start: float  # Seconds since the tracer started
+    wall_time: float
+    child_cpu_time: float
+    # The peak resident set size of the largest command that ran in the span
+    peak_rss: int
+    counters: dict[str, int]
+    thread_id: int
+    args: dict[str, Any]
+
+
+class Tracer:
+    """
+    Records how long each stage and subprocess of a build takes, along with the CPU
+    time of child processes, the peak memory of the largest command run in it, and
+    bytes downloaded and copied. Spans can be exported in the Chrome trace event
+    format (open with chrome://tracing or https://ui.perfetto.dev) and summarized in
+    a table.
+
+    Child CPU time and peak memory are only available on Unix-like systems. The peak
+    memory of a command includes the child processes it waited for, and is at least
+    the size of this process, which commands start as a copy of. When spans run at
+    the same time (ex. Electron and Tauri packaging), their child CPU times, peak
+    memory, and counters include each other's work.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets all spans and counters, ex. before building the next game.
+        """
+        with self.lock:
+            self.origin = time.perf_counter()
+            # Wall clock time of the origin, so traces from different processes line
+            # up when they are merged
+            self.epoch = time.time()
+            self.spans: list[Span] = []
+            self.counters = {name: 0 for name in COUNTERS}
+            # The peak resident set size of every command that finished, in order
+            self.command_peak_rss: list[int] = []
+
+    def count(self, name: str, value: int):
+        """
+        Adds to a counter, ex. the number of bytes downloaded.
+
+        :param name: The name of the counter.
+        :param value: The amount to add.
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record_peak_rss(self, peak_rss: int):
+        """
+        Records the peak memory of a command that finished, which counts towards
+        every span it ran in.
+
+        :param peak_rss: The peak resident set size of the command in bytes.
+        """
+        with self.lock:
+            self.command_peak_rss.append(peak_rss)
+
+    @contextmanager
+    def span(self, name: str, category: str = "stage", **args) -> Iterator[None]:
+        """
+        Records a span of work around the body of the with statement.
+
+        :param name: The name of the span, ex. the stage name.
+        :param category: The category of the span, ex. stage or subprocess.
+        :param args: Extra information to store with the span.
+        """
+        start = time.perf_counter()
+        start_cpu = _child_cpu_time()
+        with self.lock:
+            start_counters = dict(self.counters)
+            first_command = len(self.command_peak_rss)
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            end_cpu = _child_cpu_time()
+            with self.lock:
+                counters = {key: value - start_counters.get(key, 0)
+                            for key, value in self.counters.items()}
+                peak_rss = max(self.command_peak_rss[first_command:], default=0)
+                self.spans.append(Span(name, category, start - self.origin,
+                                       end - start, end_cpu - start_cpu, peak_rss,
+                                       counters, threading.get_ident(), args))
+
+    def to_chrome_trace(self) -> list[dict]:
+        """
+        :return: The spans as Chrome trace events.
+        """
+        pid = os.getpid()
+        with self.lock:
+            return [{
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": round((self.epoch + span.start) * 1_000_000),
+                "dur": round(span.wall_time * 1_000_000),
+                "pid": pid,
+                "tid": span.thread_id,
+                "args": {
+                    "child_cpu_time_s": round(span.child_cpu_time, 3),
+                    "peak_rss_bytes": span.peak_rss,
+                    **span.counters,
+                    **{key: str(value) for key, value in span.args.items()}
+                }
+            } for span in self.spans]
+
+    def summary(self, category: Optional[str] = None) -> str:
+        """
+        Summarizes the spans in a table, slowest first.
+
+        :param category: Only include spans of this category.
+        :return: The table as a string.
+        """
+        with self.lock:
+            spans = [span for span in self.spans
+                     if category is None or span.category == category]
+        spans.sort(key=lambda span: span.wall_time, reverse=True)
+        if len(spans) == 0:
+            return "No spans recorded"
+        name_width = min(max(len(span.name) for span in spans), 60)
+        lines = [f"{'Span':<{name_width}}  Wall (s)  Child CPU (s)  Peak RSS (MB)  "
+                 f"Downloaded (MB)  Copied (MB)"]
+        for span in spans:
+            lines.append(
+                f"{span.name[:name_width]:<{name_width}}  {span.wall_time:>8.2f}  "
+                f"{span.child_cpu_time:>13.2f}  {span.peak_rss / 1024 ** 2:>13.1f}  "
+                f"{span.counters.get('bytes_downloaded', 0) / 1024 ** 2:>15.2f}  "
+                f"{span.counters.get('bytes_copied', 0) / 1024 ** 2:>11.2f}")
+        return "\n".join(lines)
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    """
+    :return: The tracer shared by the whole process.
+    """
+    return _tracer
+
+
+def write_chrome_trace(events: list[dict], path: Path):
+    """
+    Writes Chrome trace events to a JSON file.
+
+    :param events: The trace events.
+    :param path: The path to the JSON file.
+    """
+    logger.debug(f"Writing {len(events)} trace events to {path}")
+    path.write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"},
+                               indent=2))
@@ -0,0 +1,94 @@
+import logging
+import os
+import time
+from pathlib import Path
+
+from .filesystem import is_ignored
+from .logger import create_logger
+
+logger = create_logger(name=__name__, level=logging.INFO)
+
+# Size and modification time of every file in a tree, keyed by relative path
+TreeSnapshot = dict[str, tuple[int, int]]
+
+
+def snapshot_tree(root: Path, ignore: list[str]) -> TreeSnapshot:
+    """
+    Gets the size and modification time of every file in a directory tree.
+
+    :param root: The directory.
+    :param ignore: Glob patterns of files and directories to leave out, matched like
+     sync_dir does.
+    :return: A TreeSnapshot.
+    """
+    snapshot = {}
+    for dir_path, dir_names, file_names in os.walk(root):
+        rel_dir = Path(dir_path).relative_to(root).as_posix()
+        prefix = "" if rel_dir == "." else f"{rel_dir}/"
+        dir_names[:] = [name for name in dir_names
+                        if not is_ignored(prefix + name, ignore)]
+        for name in file_names:
+            rel_path = prefix + name
+            if is_ignored(rel_path, ignore):
+                continue
+            try:
+                stat = os.stat(os.path.join(dir_path, name))
+            except FileNotFoundError:
+                continue
+            snapshot[rel_path] = (stat.st_size, stat.st_mtime_ns)
+    return snapshot
+
+
+def diff_snapshots(old: TreeSnapshot, new: TreeSnapshot) -> list[str]:
+    """
+    :return: The relative paths of files added, changed, or removed between two
+     snapshots, sorted.
+    """
+    return sorted(path for path in old.keys() | new.keys()
+                  if old.get(path) != new.get(path))
+
+
+class TreeWatcher:
+    """
+    Watches a directory tree for changes by polling it, which works the same on every
+    platform and file system, including network drives and WSL mounts.
+    """
+
+    def __init__(self, root: Path, ignore: list[str], interval: float = 0.5,
+                 settle: float = 0.2):
+        """
+        :param root: The directory to watch.
+        :param ignore: Glob patterns of files and directories to leave out.
+        :param interval: How often to poll in seconds.
+        :param settle: How long the tree must stay unchanged after a change before it
+         is reported, so editors saving several files at once cause one rebuild.
+        """
+        self.root = root
+        self.ignore = ignore
+        self.interval = interval
+        self.settle = settle
+        self.snapshot = snapshot_tree(root, ignore)
+        logger.debug(f"Watching {len(self.snapshot)} files in {root}")
+
+    def wait(self) -> list[str]:
+        """
+        Blocks until files in the tree change.
+
+        :return: The relative paths of the files that changed.
+        """
+        while True:
+            time.sleep(self.interval)
+            current = snapshot_tree(self.root, self.ignore)
+            if diff_snapshots(self.snapshot, current):
+                break
+        # Wait until the tree stops changing
+        while True:
+            time.sleep(self.settle)
+            settled = snapshot_tree(self.root, self.ignore)
+            if not diff_snapshots(current, settled):
+                break
+            current = settled
+        changed = diff_snapshots(self.snapshot, current)
+        self.snapshot = current
+        logger.debug(f"Changed files: {changed}")
+        return changed